@@ -11,11 +11,17 @@ def register_blueprints(app):
     app.register_blueprint(errors_blueprint)
 
 
+def register_commands(app):
+    from .commands import register_commands as register_cli_commands
+    register_cli_commands(app)
+
+
 def create_app(config=DevelopmentConfig()):
     app = Flask(__name__)
 
     app.config.from_object(config)
     register_app_to_extensions(app)
     register_blueprints(app)
+    register_commands(app)
     
     return app
@@ -1,28 +1,14 @@
-
-import datetime
-from flask import abort, current_app, jsonify, request
+from flask import abort, jsonify, request
 from functools import wraps
-import jwt
 
-from app import db
 from app.models import User
+from app.rate_limit import check_admission
+from app.tokens import InvalidToken, create_token, verify_token
 
 from . import blueprint
-from .errors import make_bad_request_response, make_error_response, make_unauthorized_response
-
+from .errors import make_unauthorized_response
 
 
-def create_token(user):
-    return jwt.encode(
-        {
-            "public_id": user.public_id,
-            "exp": datetime.datetime.utcnow() + datetime.timedelta(
-                minutes=current_app.config["TOKEN_EXPIERY_IN_MINUTES"]
-            ),
-        },
-        current_app.config["SECRET_KEY"],
-        algorithm='HS256'
-    )
 
 @blueprint.route('/login')
 def login():
@@ -38,35 +24,33 @@ def login():
     token = create_token(user)
     return jsonify({"x-access-token": token.decode('utf-8')})
 
-def token_expired(decoded_token):
-    return datetime.datetime.utcfromtimestamp(decoded_token['exp']) < datetime.datetime.utcnow() 
+def verify_token_or_401():
+    if 'x-access-token' not in request.headers:
+        abort(401, "Invalid token")
 
-def decode_token_or_401():
     try:
-        return jwt.decode(
-            request.headers['x-access-token'],
-            current_app.config["SECRET_KEY"],
-            algorithms=['HS256']) 
-   
-    except Exception:
-        abort(401, "Invalid token")
+        return verify_token(request.headers['x-access-token'])
+    except InvalidToken as e:
+        abort(401, str(e))
 
 def login_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        decoded_token = decode_token_or_401()
-        if token_expired(decoded_token):
-            return make_unauthorized_response("Token expired")
-        
-        user = User.query.filter_by(public_id=decoded_token["public_id"]).first()
-        if not user:
-            return make_unauthorized_response("Invalid token")
+        # The user row is only loaded by views that need more than the claims
+        user = verify_token_or_401()
+
+        limited_response = check_admission(f'user:{user.public_id}')
+        if limited_response is not None:
+            return limited_response
 
         return f(user, *args, **kwargs)
+
+    # Rate limits of these views are keyed by user instead of address
+    decorated.requires_login = True
     return decorated
 
 # Route used to test authentication
 @blueprint.route("/secret_protected_route")
 @login_required
 def test_auth_protection_route(current_user):
-    return jsonify({"status": "success", "message": "wow you found a secret page!", "user": current_user.to_dict()}), 200
\ No newline at end of file
+    return jsonify({"status": "success", "message": "wow you found a secret page!", "user": current_user.user.to_dict()}), 200
\ No newline at end of file
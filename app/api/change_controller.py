@@ -0,0 +1,103 @@
+from flask import Response, abort, current_app, jsonify, request, stream_with_context, url_for
+
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+
+from app import db
+from app.models import ChangeLogEntry
+from app.rate_limit import make_limited_response
+
+from . import blueprint
+from .fields import get_int_argument_or_400
+
+
+def get_since_or_400():
+    # Server-Sent Events clients resume from the last id they received
+    since = request.headers.get('Last-Event-ID') or request.args.get('since', 0)
+    try:
+        return int(since)
+    except ValueError:
+        abort(400, 'since must be a sequence number')
+
+def get_changes(since, limit):
+    query = ChangeLogEntry.query.filter(ChangeLogEntry.id > since)
+
+    # Gives transactions that took a sequence number before a later one
+    # committed the time to commit too, so the feed never skips past them
+    settle_seconds = current_app.config.get('CHANGE_FEED_SETTLE_SECONDS', 0)
+    if settle_seconds:
+        query = query.filter(ChangeLogEntry.changed_at <= datetime.utcnow() - timedelta(seconds=settle_seconds))
+
+    return query.order_by(ChangeLogEntry.id).limit(limit).all()
+
+
+@blueprint.route("/changes", methods=['GET'])
+def get_change_feed():
+    since = get_since_or_400()
+    limit = get_int_argument_or_400('limit', 1000, 1, current_app.config.get('CHANGE_FEED_MAX_LIMIT', 10000))
+
+    changes = get_changes(since, limit)
+    last_seq = changes[-1].id if changes else since
+
+    return jsonify({
+        "changes": [change.to_dict() for change in changes],
+        "_meta": {
+            "since": since,
+            "last_seq": last_seq,
+            "has_more": len(changes) == limit
+        },
+        "_links": {
+            "next": url_for("api.get_change_feed", since=last_seq, limit=limit)
+        }
+    })
+
+
+# Every open stream holds a worker thread ( of the ASGI gateway too ) while
+# it polls, so only this many are open at once and the rest of the requests
+# keep threads to run on
+def get_stream_slots():
+    if 'change_streams' not in current_app.extensions:
+        current_app.extensions['change_streams'] = threading.BoundedSemaphore(current_app.config.get('CHANGE_FEED_MAX_STREAMS', 4))
+    return current_app.extensions['change_streams']
+
+@blueprint.route("/changes/stream", methods=['GET'])
+def stream_change_feed():
+    since = get_since_or_400()
+    max_seconds = current_app.config.get('CHANGE_FEED_STREAM_SECONDS', 300)
+    timeout = min(request.args.get('timeout', max_seconds, type=float), max_seconds)
+    poll_interval = current_app.config.get('CHANGE_FEED_POLL_INTERVAL', 1.0)
+
+    slots = get_stream_slots()
+    if not slots.acquire(blocking=False):
+        return make_limited_response(503, 'Too many change streams are open, poll /changes or try again later', max(poll_interval, 1))
+
+    def generate(since):
+        # The stream ends after timeout seconds, EventSource clients reconnect
+        # with Last-Event-ID and carry on where it ended
+        ends_at = time.monotonic() + timeout
+        yield f'retry: {int(poll_interval * 1000)}\n\n'
+
+        while True:
+            changes = get_changes(since, 1000)
+            for change in changes:
+                yield f'id: {change.id}\nevent: change\ndata: {json.dumps(change.to_dict())}\n\n'
+            if changes:
+                since = changes[-1].id
+
+            # End the read transaction so the next poll sees new commits
+            db.session.rollback()
+
+            if len(changes) < 1000:
+                if time.monotonic() >= ends_at:
+                    return
+                yield ': keep-alive\n\n'
+                time.sleep(poll_interval)
+
+    response = Response(stream_with_context(generate(since)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    # Released once the server closes the response, however the stream ended
+    response.call_on_close(slots.release)
+    return response
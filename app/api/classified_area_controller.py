@@ -1,14 +1,21 @@
-from flask import abort, current_app, jsonify, request, send_file
+from flask import abort, current_app, jsonify, request, url_for
+from sqlalchemy.orm import joinedload
 
-import io
-import PIL
+import hashlib
+import random
 
 from app import db
-from app.models import ClassifiedArea, TrainingImage
+from app.cache import LRUCache
+from app.duplicates import DUPLICATE_MODES, find_duplicate_groups, merge_duplicate_groups
+from app.models import ClassifiedArea, TrainingImage, User
+from app.sampling import sample_areas
+from app.transforms import CropTransform
+from app.response_cache import cached_response
 
 
 from . import blueprint
 from .errors import make_error_response, make_bad_request_response, make_unauthorized_response
+from .fields import get_include_links, get_int_argument_or_400, get_requested_fields, project_fields, select_fields
 from .pagination import api_paginate_query, get_pagination_page
 
 
@@ -41,18 +48,72 @@ def filter_query_by_tag(query, tag):
 
 
 @blueprint.route("/classified_areas", methods=['GET'])
+@cached_response(ClassifiedArea, TrainingImage)
 def get_classified_areas():
     page = get_pagination_page()
-    query = ClassifiedArea.query
+    fields = get_requested_fields(ClassifiedArea)
+    include_links = get_include_links()
 
     training_image_public_id = request.args.get("training_image")
     tag_filter = request.args.get("tag")
 
 
-    query = filter_query_by_training_image_parent_or_404(query, training_image_public_id)
+    query = filter_query_by_training_image_parent_or_404(ClassifiedArea.query, training_image_public_id)
     query = filter_query_by_tag(query, tag_filter)
+    query = project_fields(query, ClassifiedArea, fields, include_links)
 
-    return jsonify(api_paginate_query(query, page=page, per_page=current_app.config["ITEMS_PER_PAGE"], endpoint="api.get_classified_areas", tag=tag_filter, training_image=training_image_public_id))
+    return jsonify(api_paginate_query(query, page=page, per_page=current_app.config["ITEMS_PER_PAGE"], endpoint="api.get_classified_areas", fields=fields, include_links=include_links, tag=tag_filter, training_image=training_image_public_id))
+
+def filter_query_by_user_or_404(query, user_public_id):
+    if user_public_id is None:
+        return query
+
+    user = User.query.filter_by(public_id=user_public_id).first()
+    if not user:
+        abort(404, f'No user with the public id of "{user_public_id}" exists')
+
+    return query.join(ClassifiedArea.training_image).filter(TrainingImage.user_id == user.id)
+
+
+@blueprint.route("/classified_areas/sample", methods=['GET'])
+def sample_classified_areas():
+    n = get_int_argument_or_400('n', 32, 1, current_app.config.get('SAMPLE_MAX_SIZE', 1000))
+
+    # Without a seed one is picked, it is returned so the sample can be drawn again
+    seed = get_int_argument_or_400('seed', random.SystemRandom().randrange(2 ** 32), 0, 2 ** 63 - 1)
+
+    stratify = request.args.get('stratify')
+    if stratify not in (None, 'tag'):
+        abort(400, 'Samples can only be stratified by tag')
+
+    tags = request.args.get('tags')
+    tags = tags.split(',') if tags else None
+
+    fields = get_requested_fields(ClassifiedArea)
+    include_links = get_include_links()
+    query = select_fields(ClassifiedArea.query, ClassifiedArea, fields, include_links)
+
+    query = filter_query_by_training_image_parent_or_404(query, request.args.get('training_image'))
+    query = filter_query_by_user_or_404(query, request.args.get('user'))
+    query = filter_query_by_tag(query, request.args.get('tag'))
+    if tags is not None and not stratify:
+        query = query.filter(ClassifiedArea.tag.in_([tag.lower() for tag in tags]))
+
+    areas, strata = sample_areas(
+        query, n, random.Random(seed),
+        run_size=current_app.config.get('SAMPLE_RUN_SIZE', 1),
+        stratify=stratify == 'tag',
+        tags=tags
+    )
+
+    meta = {"n": n, "seed": seed, "returned": len(areas)}
+    if strata is not None:
+        meta["strata"] = [{"tag": tag, "returned": count} for tag, count in strata.items()]
+
+    return jsonify({
+        "items": [area.to_dict(fields=fields, include_links=include_links) for area in areas],
+        "_meta": meta
+    })
 
 @blueprint.route('/classified_areas/<string:public_id>', methods=['PUT'])
 @login_required
@@ -74,9 +135,13 @@ def update_classified_area(current_user, public_id):
 
 
 @blueprint.route("/classified_areas/<string:public_id>", methods=['GET'])
+@cached_response(ClassifiedArea, TrainingImage)
 def get_classified_area(public_id):
-    area = ClassifiedArea.query.filter_by(public_id=public_id).first_or_404()
-    return area.to_dict()
+    fields = get_requested_fields(ClassifiedArea)
+    include_links = get_include_links()
+
+    area = select_fields(ClassifiedArea.query, ClassifiedArea, fields, include_links).filter_by(public_id=public_id).first_or_404()
+    return area.to_dict(fields=fields, include_links=include_links)
 
 
 def abort_if_missing_fields(data):
@@ -105,23 +170,147 @@ def create_classified_area(current_user):
 
     return jsonify(area.to_dict()), 201
 
+@blueprint.route("/classified_areas/bulk", methods=['POST'])
+@login_required
+def create_classified_areas(current_user):
+    data = request.get_json()
+    items = data.get('areas') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return make_bad_request_response("A list of areas must be included")
+
+    max_areas = current_app.config.get('BULK_AREAS_MAX', 10000)
+    if len(items) > max_areas:
+        return make_bad_request_response(f"At most {max_areas} areas can be created at once")
+
+    rows, errors = ClassifiedArea.prepare_batch(items, current_user)
+    if errors:
+        # Nothing is created unless every area is valid
+        return make_bad_request_response(
+            f"{len(errors)} of {len(items)} areas are invalid", errors=[error.to_dict() for error in errors]
+        )
+
+    if request.args.get('dry_run', 'false').lower() in ('true', '1', 'yes'):
+        return jsonify({"valid": len(rows)})
+
+    ClassifiedArea.bulk_create(rows)
+    db.session.commit()
+
+    return jsonify({
+        "created": len(rows),
+        "items": [
+            {"public_id": row['public_id'], "_links": {"self": url_for("api.get_classified_area", public_id=row['public_id'])}}
+            for row in rows
+        ]
+    }), 201
+
+def get_duplicates_query_or_400():
+    training_image_public_id = request.args.get('training_image')
+    tag = request.args.get('tag')
+    if training_image_public_id is None and tag is None:
+        abort(400, 'training_image or tag must be given')
+
+    query = filter_query_by_training_image_parent_or_404(ClassifiedArea.query, training_image_public_id)
+    return filter_query_by_tag(query, tag)
+
+def get_duplicates_arguments_or_400():
+    try:
+        threshold = float(request.args.get('threshold', 0.7))
+    except ValueError:
+        abort(400, 'threshold must be a number')
+    if not 0 < threshold <= 1:
+        abort(400, 'threshold must be above 0 and at most 1')
+
+    mode = request.args.get('mode', 'cluster')
+    if mode not in DUPLICATE_MODES:
+        abort(400, f'mode must be one of {list(DUPLICATE_MODES)}')
+
+    return threshold, mode
+
+@blueprint.route("/classified_areas/duplicates", methods=['GET'])
+def get_duplicate_classified_areas():
+    threshold, mode = get_duplicates_arguments_or_400()
+    groups = find_duplicate_groups(get_duplicates_query_or_400(), threshold, mode)
+
+    return jsonify({
+        "groups": [group.to_dict() for group in groups],
+        "_meta": {"threshold": threshold, "mode": mode}
+    })
+
+@blueprint.route("/classified_areas/duplicates/merge", methods=['POST'])
+@login_required
+def merge_duplicate_classified_areas(current_user):
+    threshold, mode = get_duplicates_arguments_or_400()
+
+    strategy = request.args.get('strategy', 'mean')
+    if strategy not in ('mean', 'first'):
+        abort(400, 'strategy must be mean or first')
+
+    # Users that are not admins only merge areas on their own images
+    query = get_duplicates_query_or_400()
+    if not current_user.is_admin:
+        query = query.filter(ClassifiedArea.image_id.in_(
+            db.session.query(TrainingImage.id).filter(TrainingImage.user_id == current_user.id)
+        ))
+
+    groups = find_duplicate_groups(query, threshold, mode)
+    serialized = [group.to_dict() for group in groups]  # Before the duplicates are gone
+
+    removed = merge_duplicate_groups(groups, strategy)
+    db.session.commit()
+
+    return jsonify({
+        "groups": serialized,
+        "removed": removed,
+        "_meta": {"threshold": threshold, "mode": mode, "strategy": strategy}
+    })
+
+def get_crop_cache():
+    if 'crop_cache' not in current_app.extensions:
+        current_app.extensions['crop_cache'] = LRUCache(
+            max_size=current_app.config.get('CROP_CACHE_SIZE', 256),
+            ttl=current_app.config.get('CROP_CACHE_TTL', 600),
+            max_bytes=current_app.config.get('CROP_CACHE_BYTES', 64 * 1024 * 1024)
+        )
+    return current_app.extensions['crop_cache']
+
 @blueprint.route('/classified_areas/<string:public_id>/training_image_cropped')
 def get_classified_area_image(public_id):
-    area = ClassifiedArea.query.filter_by(public_id=public_id).first_or_404()
+    try:
+        transform = CropTransform.from_args(request.args)
+    except ValueError as e:
+        return make_bad_request_response(str(e))
 
-    image = PIL.Image.open(area.training_image.get_image_path())
-    
-    image = image.crop(box=(
+    area = ClassifiedArea.query.options(joinedload(ClassifiedArea.training_image)).filter_by(public_id=public_id).first_or_404()
+    training_image = area.training_image
+    box = (
         area.x_position, area.y_position,
         area.x_position + area.width,
         area.y_position + area.height
-    ))
-
-    img_stream = io.BytesIO()
-    image.save(img_stream, format="PNG")
-    img_stream.seek(0)
+    )
 
-    return send_file(img_stream, mimetype='image/png')
+    # A crop only changes with the stored image, the box or the transform
+    etag = hashlib.sha1(repr((training_image.public_id, training_image.image_version, box, transform.signature())).encode('utf-8')).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    cache = get_crop_cache()
+    rendered = cache.get(etag) if cache.max_size else None
+    if rendered is None:
+        rendered = current_app.extensions['crop_renderer'].render(
+            f'{training_image.public_id}:{training_image.image_version}', training_image.get_image_path(), box, transform
+        )
+
+        # Large crops ( big float resizes ) would push every other crop out
+        if cache.max_size and len(rendered) <= current_app.config.get('CROP_CACHE_MAX_ITEM_BYTES', 1024 * 1024):
+            cache.set(etag, rendered)
+
+    response = current_app.response_class(rendered, mimetype=transform.mimetype)
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 @blueprint.route('/classified_areas/<string:public_id>', methods=['DELETE'])
 @login_required
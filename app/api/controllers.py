@@ -1,2 +1,2 @@
 from . import auth
-from . import classified_area_controller, training_image_controller, user_controller
+from . import change_controller, classified_area_controller, training_image_controller, user_controller
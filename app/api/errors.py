@@ -1,7 +1,7 @@
 from flask import jsonify
 from werkzeug.http import HTTP_STATUS_CODES
 
-def make_error_response(status_code, message=None):
+def make_error_response(status_code, message=None, errors=None):
     data = {
         'error': HTTP_STATUS_CODES.get(status_code, 'Unknown error')
     }
@@ -9,6 +9,9 @@ def make_error_response(status_code, message=None):
     if message:
         data["message"] = message
 
+    if errors:
+        data["errors"] = errors
+
     response = jsonify(data)
     response.status_code = status_code
     return response
@@ -16,5 +19,5 @@ def make_error_response(status_code, message=None):
 def make_unauthorized_response(message=None):
     return make_error_response(status_code=401, message=message)
 
-def make_bad_request_response(message=None):
-    return make_error_response(status_code=400, message=message)
+def make_bad_request_response(message=None, errors=None):
+    return make_error_response(status_code=400, message=message, errors=errors)
@@ -0,0 +1,72 @@
+from flask import abort, request
+
+from datetime import datetime, timezone
+
+
+def get_requested_fields(model):
+    fields = request.args.get('fields')
+
+    # No fields requested means every field is returned
+    if not fields:
+        return None
+
+    fields = [field.strip() for field in fields.split(',') if field.strip()]
+
+    unknown_fields = [field for field in fields if field not in model.SERIALIZED_FIELDS]
+    if unknown_fields:
+        abort(400, f'Unknown fields {unknown_fields}, valid fields are {list(model.SERIALIZED_FIELDS)}')
+
+    return fields
+
+def get_include_links():
+    return request.args.get('links', 'true').lower() not in ('false', '0', 'no')
+
+def get_int_argument_or_400(name, default, minimum=None, maximum=None):
+    value = request.args.get(name)
+    if value is None:
+        return default
+
+    try:
+        value = int(value)
+    except ValueError:
+        abort(400, f'{name} must be an integer')
+
+    if minimum is not None and value < minimum:
+        abort(400, f'{name} must be at least {minimum}')
+    if maximum is not None and value > maximum:
+        abort(400, f'{name} must be at most {maximum}')
+    return value
+
+def get_bool_argument_or_400(name, default=None):
+    value = request.args.get(name)
+    if value is None:
+        return default
+
+    if value.lower() in ('true', '1', 'yes'):
+        return True
+    if value.lower() in ('false', '0', 'no'):
+        return False
+    abort(400, f'{name} must be true or false')
+
+# ISO 8601, a trailing Z ( as returned by the API ) is read as UTC
+def get_datetime_argument_or_400(name, default=None):
+    value = request.args.get(name)
+    if value is None:
+        return default
+
+    try:
+        value = datetime.fromisoformat(value[:-1] if value.endswith('Z') else value)
+    except ValueError:
+        abort(400, f'{name} must be an ISO 8601 date, like 2020-12-31T23:59:59Z')
+
+    # Stored dates are naive UTC
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def select_fields(query, model, fields, include_links):
+    return query.options(*model.query_options_for_fields(fields, include_links))
+
+# For list endpoints: rows come back as APIModelMixin records, not instances
+def project_fields(query, model, fields, include_links):
+    return model.project_query(query, fields, include_links)
@@ -1,18 +1,72 @@
-from flask import jsonify, request, url_for
+from flask import current_app, jsonify, request, url_for
+from flask_sqlalchemy import Pagination
 from werkzeug.http import HTTP_STATUS_CODES
 
+from app.cache import LRUCache
+from app.model_versions import get_model_versions
 
-def api_paginate_query(query, endpoint, page, per_page, **kwargs):
-    paginated = query.paginate(page, per_page, False)
+
+def get_count_cache():
+    if 'count_cache' not in current_app.extensions:
+        current_app.extensions['count_cache'] = LRUCache(
+            max_size=current_app.config.get('PAGINATION_COUNT_CACHE_SIZE', 1024),
+            ttl=current_app.config.get('PAGINATION_COUNT_CACHE_TTL', 300)
+        )
+    return current_app.extensions['count_cache']
+
+def count_query(query, endpoint, estimate=False, **kwargs):
+    # The count of a query only changes when the table it selects from is
+    # written to. The versions only move with writes of this process
+    models = [description['entity'] for description in query.column_descriptions]
+    versions = get_model_versions(models)
+
+    cache = get_count_cache()
+    key = (endpoint, tuple(sorted((name, value) for name, value in kwargs.items() if value is not None)))
+
+    cached = cache.get(key, allow_expired=estimate)
+    if cached is not None:
+        cached_versions, total = cached
+        if cached_versions == versions:
+            return total, False
+
+        # Estimates accept a count taken before the latest writes
+        if estimate:
+            return total, True
+
+    total = query.order_by(None).count()
+    cache.set(key, (versions, total))
+    return total, False
+
+def api_paginate_query(query, endpoint, page, per_page, fields=None, include_links=True, **kwargs):
+    if page < 1:
+        page = 1
+
+    estimate = request.args.get('count') == 'estimate'
+    total, estimated = count_query(query, endpoint, estimate=estimate, **kwargs)
+
+    items = query.limit(per_page).offset((page - 1) * per_page).all()
+    paginated = Pagination(query, page, per_page, total, items)
+
+    # Keep the field selection when following the pagination links
+    if fields is not None:
+        kwargs['fields'] = ','.join(fields)
+    if not include_links:
+        kwargs['links'] = 'false'
+    if estimate:
+        kwargs['count'] = 'estimate'
+
+    meta = {
+        "page": page,
+        "per_page": per_page,
+        "total_pages": paginated.pages,
+        "total_items": paginated.total
+    }
+    if estimate:
+        meta["estimated"] = estimated
 
     return {
-        "items": [item.to_dict() for item in paginated.items],
-        "_meta": {
-            "page": page,
-            "per_page": per_page,
-            "total_pages": paginated.pages,
-            "total_items": paginated.total
-        },
+        "items": [item.to_dict(fields=fields, include_links=include_links) for item in paginated.items],
+        "_meta": meta,
         "_links": {
             "self": url_for(endpoint, page=page, **kwargs),
             "next_page": (url_for(endpoint, page=page + 1, **kwargs)) if paginated.has_next else None,
@@ -30,4 +84,3 @@ def get_pagination_page():
         except (ValueError):
             page = 1
     return page
-
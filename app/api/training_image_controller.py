@@ -1,19 +1,82 @@
-from flask import abort, current_app, request, jsonify
+from flask import abort, current_app, request, jsonify, send_file
+from sqlalchemy.orm import load_only
+
+import os
 
 from app import db
-from app.models import TrainingImage, User
+from app.bulk_upload import bulk_store_images, list_upload_entries, probe_entries
+from app.models import ClassifiedArea, TrainingImage, User
+from app.response_cache import cached_response
+from app.summaries import refresh_covered_ratios
 
 
 from . import blueprint
 from .auth import login_required
 from .errors import make_bad_request_response, make_error_response, make_unauthorized_response
+from .fields import (
+    get_bool_argument_or_400, get_datetime_argument_or_400, get_include_links, get_int_argument_or_400,
+    get_requested_fields, project_fields, select_fields
+)
 from .pagination import api_paginate_query
 
 
+# Writes to areas only mark the covered ratio of their image as stale, it is
+# recomputed when it is read next
+def refresh_stale_covered_ratios(fields):
+    if (fields is None or 'covered_ratio' in fields) and refresh_covered_ratios(db.session):
+        db.session.commit()
+
 @blueprint.route("/training_images/<string:public_id>", methods=['GET'])
+@cached_response(TrainingImage, User)
 def get_training_image(public_id):
-    image = TrainingImage.query.filter_by(public_id=public_id).first_or_404()
-    return jsonify(image.to_dict())
+    fields = get_requested_fields(TrainingImage)
+    include_links = get_include_links()
+    refresh_stale_covered_ratios(fields)
+
+    image = select_fields(TrainingImage.query, TrainingImage, fields, include_links).filter_by(public_id=public_id).first_or_404()
+    return jsonify(image.to_dict(fields=fields, include_links=include_links))
+
+
+def make_image_file_response(training_image):
+    path = training_image.get_image_path()
+    if not os.path.exists(path):
+        abort(404, f'The image file of training image "{training_image.public_id}" is missing')
+
+    accel_redirect_prefix = current_app.config.get('TRAINING_IMAGES_ACCEL_REDIRECT_PREFIX')
+    if accel_redirect_prefix:
+        # Let the front web server (nginx) send the file, ranges included
+        response = current_app.response_class(mimetype=training_image.get_image_mimetype())
+        response.headers['X-Accel-Redirect'] = f'{accel_redirect_prefix}/{os.path.basename(path)}'
+    else:
+        # Sent with sendfile by the WSGI server, or the front server if USE_X_SENDFILE is set
+        response = send_file(path, mimetype=training_image.get_image_mimetype(), add_etags=False)
+
+    if training_image.image_version:
+        response.set_etag(training_image.image_version)
+
+    # Caching is controlled by Cache-Control alone
+    response.expires = None
+    response.cache_control.public = True
+    if training_image.image_version and request.args.get('v') == training_image.image_version:
+        response.cache_control.max_age = current_app.config.get('TRAINING_IMAGES_CACHE_MAX_AGE', 365 * 24 * 60 * 60)
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.max_age = 0
+        response.cache_control.no_cache = True
+
+    if accel_redirect_prefix:
+        return response
+
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response.make_conditional(request, accept_ranges='bytes', complete_length=os.path.getsize(path))
+
+@blueprint.route("/training_images/<string:public_id>/image", methods=['GET'])
+def get_training_image_file(public_id):
+    training_image = TrainingImage.query.options(
+        load_only('public_id', 'image_version', 'image_format')
+    ).filter_by(public_id=public_id).first_or_404()
+
+    return make_image_file_response(training_image)
 
 
 def filter_query_by_parent_user_or_404(query, user_public_id):
@@ -30,11 +93,45 @@ def filter_query_by_parent_user_or_404(query, user_public_id):
         user=user
     )
 
+# Filters on the summaries kept on every image, see app.summaries
+def filter_query_by_annotations(query, min_areas, tag, has_areas):
+    if min_areas is not None:
+        query = query.filter(TrainingImage.area_count >= min_areas)
+    if has_areas is not None:
+        query = query.filter(TrainingImage.area_count > 0 if has_areas else TrainingImage.area_count == 0)
+    if tag is not None:
+        query = query.filter(TrainingImage.classified_areas.any(ClassifiedArea.tag == tag.lower()))
+    return query
+
+def filter_query_by_creation(query, created_after):
+    if created_after is None:
+        return query
+    return query.filter(TrainingImage.created_at > created_after)
+
+def filter_query_by_dimensions(query, min_width, max_width, min_height, max_height):
+    if min_width is not None:
+        query = query.filter(TrainingImage.width >= min_width)
+    if max_width is not None:
+        query = query.filter(TrainingImage.width <= max_width)
+    if min_height is not None:
+        query = query.filter(TrainingImage.height >= min_height)
+    if max_height is not None:
+        query = query.filter(TrainingImage.height <= max_height)
+    return query
+
 @blueprint.route("/training_images", methods=['GET'])
+@cached_response(TrainingImage, User)
 def get_training_images():
     endpoint = "api.get_training_images"
-    query = TrainingImage.query
+    fields = get_requested_fields(TrainingImage)
+    include_links = get_include_links()
     user_public_id = request.args.get('user')
+    min_areas = get_int_argument_or_400('min_areas', None, 0)
+    has_areas = get_bool_argument_or_400('has_areas')
+    tag = request.args.get('tag')
+    created_after = get_datetime_argument_or_400('created_after')
+    dimensions = {name: get_int_argument_or_400(name, None, 0) for name in ('min_width', 'max_width', 'min_height', 'max_height')}
+    refresh_stale_covered_ratios(fields)
 
     page = request.args.get('page')
     if not page:
@@ -42,8 +139,12 @@ def get_training_images():
     else:
         page = int(page)
     
-    query = filter_query_by_parent_user_or_404(query, user_public_id)
-    return jsonify(api_paginate_query(query, page=page, per_page=current_app.config["ITEMS_PER_PAGE"], endpoint=endpoint, user=user_public_id))
+    query = filter_query_by_parent_user_or_404(TrainingImage.query, user_public_id)
+    query = filter_query_by_annotations(query, min_areas, tag, has_areas)
+    query = filter_query_by_creation(query, created_after)
+    query = filter_query_by_dimensions(query, **dimensions)
+    query = project_fields(query, TrainingImage, fields, include_links)
+    return jsonify(api_paginate_query(query, page=page, per_page=current_app.config["ITEMS_PER_PAGE"], endpoint=endpoint, fields=fields, include_links=include_links, user=user_public_id, min_areas=min_areas, has_areas=has_areas, tag=tag, created_after=request.args.get('created_after'), **dimensions))
 
 
 @blueprint.route('/training_images/<string:public_id>', methods=['DELETE'])
@@ -54,8 +155,7 @@ def delete_training_image(current_user, public_id):
     if not training_image.modifiable_by(current_user):
         return make_unauthorized_response("You do not have the permission to delete this")
     
-    training_image.delete_image()      # Deletes the actual image
-    db.session.delete(training_image)  # Deletes the database representation
+    training_image.delete_with_dependents()  # The file is removed by the sweeper after the commit
     db.session.commit()
     return {"status": "success"}
 
@@ -92,3 +192,43 @@ def create_training_image(current_user):
     db.session.add(dbImage)
     db.session.commit()
     return jsonify(dbImage.to_dict()), 201
+
+
+@blueprint.route("/training_images/bulk", methods=['POST'])
+@login_required
+def create_training_images(current_user):
+    user_public_id = request.form.get('user', current_user.public_id)
+
+    if user_public_id != current_user.public_id and not current_user.is_admin:
+        return make_unauthorized_response("Only admins can create images that belong to other users. You can only create an image that belongs to you")
+
+    user = User.query.filter_by(public_id=user_public_id).first()
+    if user is None:
+        return make_bad_request_response("User does not exist, please pass a valid user")
+
+    try:
+        entries = list_upload_entries(request.files.getlist('images'), request.files.get('archive'))
+    except ValueError as e:
+        return make_bad_request_response(str(e))
+
+    if not entries:
+        return make_bad_request_response("No images included")
+
+    max_files = current_app.config.get('BULK_UPLOAD_MAX_FILES', 10000)
+    if len(entries) > max_files:
+        return make_bad_request_response(f"At most {max_files} images can be uploaded at once")
+
+    if request.args.get('dry_run', 'false').lower() in ('true', '1', 'yes'):
+        results = probe_entries(entries)
+        return jsonify({
+            'valid': sum(1 for result in results if result['status'] == 'valid'),
+            'failed': sum(1 for result in results if result['status'] == 'failed'),
+            'results': results
+        })
+
+    results = bulk_store_images(entries, user)
+    return jsonify({
+        'created': sum(1 for result in results if result['status'] == 'created'),
+        'failed': sum(1 for result in results if result['status'] == 'failed'),
+        'results': results
+    }), 201
@@ -2,24 +2,33 @@ from flask import abort, current_app, jsonify, request
 
 from app import db
 from app.models import User
+from app.response_cache import cached_response
 
 from . import blueprint
 from .errors import make_bad_request_response, make_error_response, make_unauthorized_response
+from .fields import get_include_links, get_requested_fields, project_fields, select_fields
 from .pagination import api_paginate_query, get_pagination_page
 
 from .auth import login_required
 
 @blueprint.route('/users/<string:public_id>', methods=['GET'])
+@cached_response(User)
 def get_user(public_id):
-    user = User.query.filter_by(public_id=public_id).first_or_404()
-    return jsonify(user.to_dict())
+    fields = get_requested_fields(User)
+    include_links = get_include_links()
+
+    user = select_fields(User.query, User, fields, include_links).filter_by(public_id=public_id).first_or_404()
+    return jsonify(user.to_dict(fields=fields, include_links=include_links))
     
 @blueprint.route('/users', methods=["GET"])
+@cached_response(User)
 def get_users():
     page = get_pagination_page()
-    query = User.query
+    fields = get_requested_fields(User)
+    include_links = get_include_links()
+    query = project_fields(User.query, User, fields, include_links)
 
-    return api_paginate_query(query, endpoint="api.get_users", per_page=current_app.config["ITEMS_PER_PAGE"], page=page)
+    return api_paginate_query(query, endpoint="api.get_users", per_page=current_app.config["ITEMS_PER_PAGE"], page=page, fields=fields, include_links=include_links)
 
 
 def abort_if_missing_fields(data):
@@ -79,7 +88,7 @@ def delete_user(current_user, public_id):
     if not to_delete.modifiable_by(current_user):
         return make_error_response("You can only delete your own account, unless you are an admin")
 
-    db.session.delete(to_delete)
+    to_delete.delete_with_dependents()
     db.session.commit()
 
     return {"status": "success"}, 200
@@ -126,5 +135,5 @@ def promote_user(current_user, public_id):
 @login_required
 def my_public_id(current_user):
     return jsonify(
-        current_user.to_dict()
+        current_user.user.to_dict()
     )
\ No newline at end of file
@@ -0,0 +1,155 @@
+import asyncio
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Serves the WSGI app to an ASGI server without tying a thread to a slow
+# client. Request bodies are received on the event loop before the app is
+# called, and the response is sent chunk by chunk from the event loop, so the
+# worker threads only run the app itself (routing, DB and PIL work) and read
+# the next chunk of a file. A client trickling a large upload or reading a
+# crop slowly no longer pins a thread for the whole transfer.
+class ASGIGateway(object):
+    def __init__(self, wsgi_app, max_workers=None, spool_size=1024 * 1024):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='asgi-worker')
+        self.spool_size = spool_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        else:
+            raise NotImplementedError(f'Unsupported ASGI scope type {scope["type"]}')
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def http(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+
+        body, body_length = await self.receive_body(receive, loop)
+        if body is None:
+            return  # The client went away before sending the whole body
+
+        environ = self.build_environ(scope, body, body_length)
+
+        try:
+            status, headers, result = await loop.run_in_executor(self.executor, self.call_wsgi_app, environ)
+        except BaseException:
+            body.close()
+            raise
+
+        try:
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+
+            # Every chunk is produced on a worker thread but sent from the loop
+            iterator = iter(result)
+            sentinel = object()
+            while True:
+                chunk = await loop.run_in_executor(self.executor, next, iterator, sentinel)
+                if chunk is sentinel:
+                    break
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            body.close()
+            if hasattr(result, 'close'):
+                await loop.run_in_executor(self.executor, result.close)
+
+    async def receive_body(self, receive, loop):
+        body = tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+        body_length = 0
+
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return None, 0
+
+            chunk = message.get('body', b'')
+            body_length += len(chunk)
+
+            # Once the body has rolled over to disk the writes are file I/O
+            if body_length > self.spool_size:
+                await loop.run_in_executor(self.executor, body.write, chunk)
+            else:
+                body.write(chunk)
+
+            more_body = message.get('more_body', False)
+
+        body.seek(0)
+        return body, body_length
+
+    def build_environ(self, scope, body, body_length):
+        server_name, server_port = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server_name,
+            'SERVER_PORT': str(server_port),
+            'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+            'REMOTE_ADDR': client[0],
+            'REMOTE_PORT': str(client[1]),
+            'CONTENT_LENGTH': str(body_length),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+            elif name == 'CONTENT_LENGTH':
+                continue  # Replaced by the length of the received body
+            else:
+                key = f'HTTP_{name}'
+                environ[key] = f'{environ[key]},{value}' if key in environ else value
+
+        return environ
+
+    def call_wsgi_app(self, environ):
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response:
+                raise exc_info[1].with_traceback(exc_info[2])
+
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [
+                (name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers
+            ]
+
+        result = self.wsgi_app(environ, start_response)
+        return response['status'], response['headers'], result
+
+
+def create_asgi_app(app):
+    return ASGIGateway(
+        app,
+        max_workers=app.config.get('ASGI_WORKER_THREADS'),
+        spool_size=app.config.get('ASGI_BODY_SPOOL_SIZE', 1024 * 1024)
+    )
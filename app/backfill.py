@@ -0,0 +1,89 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import bindparam, or_
+
+from app import db
+from app.models import TrainingImage
+from .change_log import log_changes
+from .images import probe_image
+from .integrity import Throttle
+from .model_versions import record_bulk_change
+from .summaries import refresh_summaries
+
+
+class BackfillReport(object):
+    def __init__(self):
+        self.rows_scanned = 0
+        self.rows_updated = 0
+        self.unreadable_files = []
+
+    def to_dict(self):
+        return {
+            'rows_scanned': self.rows_scanned,
+            'rows_updated': self.rows_updated,
+            'unreadable_files': self.unreadable_files
+        }
+
+
+# Runs in the backfill threads, reading a header is mostly waiting on the disk
+def probe_dimensions(path):
+    try:
+        with probe_image(path) as probe:
+            return probe.size
+    except ValueError:
+        return None
+
+def backfill_batch(rows, executor, report):
+    paths = [TrainingImage.make_image_path(public_id, image_format) for _, public_id, image_format in rows]
+
+    updates = []
+    for (image_id, public_id, _), path, size in zip(rows, paths, executor.map(probe_dimensions, paths)):
+        if size is None:
+            report.unreadable_files.append(path)
+            continue
+        updates.append({'image_id': image_id, 'public_id': public_id, 'image_width': size[0], 'image_height': size[1]})
+
+    if not updates:
+        return
+
+    images = TrainingImage.__table__
+    db.session.execute(
+        images.update().where(images.c.id == bindparam('image_id')).values(
+            width=bindparam('image_width'), height=bindparam('image_height')
+        ),
+        updates
+    )
+    log_changes(db.session, TrainingImage, 'update', [update['public_id'] for update in updates])
+    # The covered ratio of the areas depends on the size of their image
+    refresh_summaries(db.session, [update['image_id'] for update in updates])
+    record_bulk_change(db.session, TrainingImage)
+    db.session.commit()
+
+    report.rows_updated += len(updates)
+
+# Fills in the width and height of training images stored without them, from
+# the headers of their files. Every batch is committed on its own
+def backfill_dimensions(batch_size=500, workers=8, items_per_second=None):
+    report = BackfillReport()
+    throttle = Throttle(items_per_second)
+
+    last_id = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            rows = (
+                db.session.query(TrainingImage.id, TrainingImage.public_id, TrainingImage.image_format)
+                .filter(TrainingImage.id > last_id, or_(TrainingImage.width.is_(None), TrainingImage.height.is_(None)))
+                .order_by(TrainingImage.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                break
+
+            backfill_batch(rows, executor, report)
+            report.rows_scanned += len(rows)
+            last_id = rows[-1][0]
+            throttle.wait(len(rows))
+
+    db.session.rollback()
+    return report
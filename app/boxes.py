@@ -0,0 +1,166 @@
+# numpy is only imported once boxes are checked or compared, not with the models
+OUT_OF_BOUNDS = "ClassifiedAreas cannot extend out of the bounds the parent image!"
+TOO_SMALL = "Width and height cannot be below 1px"
+# Larger values are rejected before the int64 math, where they would overflow
+MAX_COORDINATE = 2 ** 31 - 1
+TOO_LARGE = f"Positions and sizes cannot be larger than {MAX_COORDINATE}px"
+
+BOX_FIELDS = ('x_position', 'y_position', 'width', 'height')
+
+
+class BoxError(object):
+    __slots__ = ('index', 'field', 'message')
+
+    def __init__(self, index, field, message):
+        self.index = index
+        self.field = field
+        self.message = message
+
+    def to_dict(self):
+        return {'index': self.index, 'field': self.field, 'message': self.message}
+
+
+# Checks any number of boxes against the size of their images in one pass.
+# Every argument is a sequence with one entry per box, the first failing
+# check of a box is reported, in the order the single area checks ran in.
+def validate_boxes(x, y, width, height, image_width, image_height):
+    import numpy as np
+
+    too_large = {}
+    for field, values in zip(BOX_FIELDS, (x, y, width, height)):
+        for index, value in enumerate(values):
+            if abs(value) > MAX_COORDINATE and index not in too_large:
+                too_large[index] = BoxError(index, field, TOO_LARGE)
+    if too_large:
+        x, y, width, height = ([0 if index in too_large else value for index, value in enumerate(values)] for values in (x, y, width, height))
+
+    x, y, width, height = (np.asarray(values, dtype=np.int64) for values in (x, y, width, height))
+    image_width = np.asarray(image_width, dtype=np.int64)
+    image_height = np.asarray(image_height, dtype=np.int64)
+
+    negative = (x < 0) | (y < 0)
+    outside = (x + width > image_width) | (y + height > image_height)
+    too_small = (width < 1) | (height < 1)
+
+    errors = []
+    for index in np.flatnonzero(negative | outside | too_small):
+        if int(index) in too_large:
+            continue
+        if negative[index]:
+            errors.append(BoxError(int(index), 'x_position' if x[index] < 0 else 'y_position', OUT_OF_BOUNDS))
+        elif outside[index]:
+            errors.append(BoxError(int(index), 'width' if x[index] + width[index] > image_width[index] else 'height', OUT_OF_BOUNDS))
+        else:
+            errors.append(BoxError(int(index), 'width' if width[index] < 1 else 'height', TOO_SMALL))
+    return sorted(errors + list(too_large.values()), key=lambda error: error.index)
+
+
+# Boxes are compared in tiles of this many rows, so finding duplicates
+# never needs more than IOU_TILE x (boxes) floats, however big the group
+IOU_TILE = 256
+
+
+# Pairs of boxes ( first < second ) with an IoU of at least threshold, which
+# must be above 0. The boxes are swept in order of their left edge, a tile
+# is only compared with the boxes that start before its rightmost edge
+def iou_pairs(x, y, width, height, threshold, tile=IOU_TILE):
+    import numpy as np
+
+    x, y, width, height = (np.asarray(values, dtype=np.float32) for values in (x, y, width, height))
+    order = np.argsort(x, kind='stable')
+    x, y, width, height = x[order], y[order], width[order], height[order]
+    right, bottom = x + width, y + height
+    area = width * height
+
+    firsts, seconds = [], []
+    for start in range(0, len(x), tile):
+        rows = slice(start, min(start + tile, len(x)))
+        # Boxes from end on start right of every box of the tile
+        end = max(int(np.searchsorted(x, right[rows].max(), side='left')), rows.stop)
+        columns = slice(start, end)
+
+        overlap_width = np.clip(np.minimum(right[rows, None], right[None, columns]) - np.maximum(x[rows, None], x[None, columns]), 0, None)
+        overlap_height = np.clip(np.minimum(bottom[rows, None], bottom[None, columns]) - np.maximum(y[rows, None], y[None, columns]), 0, None)
+        intersection = overlap_width * overlap_height
+        union = area[rows, None] + area[None, columns] - intersection
+        iou = np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+        row_indices, column_indices = np.nonzero(iou >= threshold)
+        row_indices, column_indices = row_indices + start, column_indices + start
+        later = column_indices > row_indices
+        firsts.append(order[row_indices[later]])
+        seconds.append(order[column_indices[later]])
+
+    if not firsts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    first, second = np.concatenate(firsts), np.concatenate(seconds)
+    return np.minimum(first, second), np.maximum(first, second)
+
+
+# Groups of boxes connected by an IoU of at least threshold, every group
+# sorted and only groups of two or more boxes
+def cluster_duplicates(x, y, width, height, threshold):
+    parents = list(range(len(x)))
+
+    def find(index):
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    for first, second in zip(*iou_pairs(x, y, width, height, threshold)):
+        parents[find(int(second))] = find(int(first))
+
+    groups = {}
+    for index in range(len(parents)):
+        groups.setdefault(find(index), []).append(index)
+    return [group for group in groups.values() if len(group) > 1]
+
+# Greedy non-max suppression in index order: every box not suppressed yet
+# keeps the group of the later boxes it overlaps by at least threshold
+def suppress_duplicates(x, y, width, height, threshold):
+    overlapping = [[] for _ in range(len(x))]
+    for first, second in zip(*iou_pairs(x, y, width, height, threshold)):
+        overlapping[int(first)].append(int(second))
+
+    suppressed = [False] * len(x)
+    groups = []
+    for index in range(len(x)):
+        if suppressed[index]:
+            continue
+
+        later = sorted(other for other in overlapping[index] if not suppressed[other])
+        if later:
+            for other in later:
+                suppressed[other] = True
+            groups.append([index] + later)
+    return groups
+
+def merge_boxes(x, y, width, height):
+    import numpy as np
+
+    # Averaging the edges keeps the merged box inside the image every box is in
+    x, y, width, height = (np.asarray(values, dtype=np.float64) for values in (x, y, width, height))
+    left, top = int(round(x.mean())), int(round(y.mean()))
+    right, bottom = int(round((x + width).mean())), int(round((y + height).mean()))
+    return left, top, max(right - left, 1), max(bottom - top, 1)
+
+# Pixels covered by at least one box, overlaps counted once. The union is
+# taken on the grid of the box edges, which is never larger than the image
+def covered_area(x, y, width, height):
+    import numpy as np
+
+    x, y, width, height = (np.asarray(values, dtype=np.int64) for values in (x, y, width, height))
+    if not len(x):
+        return 0
+
+    xs = np.unique(np.concatenate([x, x + width]))
+    ys = np.unique(np.concatenate([y, y + height]))
+    left, right = np.searchsorted(xs, x), np.searchsorted(xs, x + width)
+    top, bottom = np.searchsorted(ys, y), np.searchsorted(ys, y + height)
+
+    covered = np.zeros((len(ys) - 1, len(xs) - 1), dtype=bool)
+    for box in zip(left, right, top, bottom):
+        covered[box[2]:box[3], box[0]:box[1]] = True
+
+    return int(np.outer(np.diff(ys), np.diff(xs))[covered].sum())
@@ -0,0 +1,178 @@
+import os
+import tarfile
+import zipfile
+import zlib
+
+from flask import current_app, url_for
+
+from app import db
+from .change_log import log_changes
+from .images import probe_image, store_image
+from .model_versions import record_bulk_change
+from .models import TrainingImage, generateUuid
+from .sweeper import file_sweeper
+
+
+# The settings store_image reads, handed to the worker processes with every upload
+STORAGE_CONFIG_KEYS = (
+    'TRAINING_IMAGES_STORAGE_FORMAT',
+    'TRAINING_IMAGES_PNG_COMPRESS_LEVEL',
+    'TRAINING_IMAGES_ORIGINAL_FORMATS',
+    'TRAINING_IMAGES_WEBP_EFFORT'
+)
+
+
+class UploadEntry(object):
+    __slots__ = ('name', 'size', 'read')
+
+    def __init__(self, name, size, read):
+        self.name = name
+        self.size = size
+        self.read = read
+
+
+def list_file_entries(files):
+    for file in files:
+        file.stream.seek(0, os.SEEK_END)
+        size = file.stream.tell()
+        file.stream.seek(0)
+        yield UploadEntry(file.filename, size, file.stream.read)
+
+def list_archive_entries(archive):
+    stream = archive.stream
+    if zipfile.is_zipfile(stream):
+        stream.seek(0)
+        zip_file = zipfile.ZipFile(stream)
+        for info in zip_file.infolist():
+            if not info.is_dir():
+                yield UploadEntry(info.filename, info.file_size, lambda info=info: zip_file.read(info))
+        return
+
+    stream.seek(0)
+    try:
+        tar_file = tarfile.open(fileobj=stream, mode='r:*')
+    except tarfile.TarError:
+        raise ValueError('The archive is not a zip or tar archive')
+
+    for member in tar_file.getmembers():
+        if member.isfile():
+            yield UploadEntry(member.name, member.size, lambda member=member: tar_file.extractfile(member).read())
+
+def list_upload_entries(files, archive=None):
+    entries = list(list_file_entries(files))
+    if archive is not None:
+        entries.extend(list_archive_entries(archive))
+    return entries
+
+
+# Errors of reading one archive member ( bad CRC, corrupt compressed data,
+# encrypted ) that fail only its entry
+READ_ERRORS = (zipfile.BadZipFile, tarfile.TarError, zlib.error, RuntimeError, OSError, EOFError)
+
+# Returns the bytes of an entry, or the error its manifest entry fails with
+def read_entry(entry, max_entry_size):
+    if entry.size > max_entry_size:
+        return None, f'Files larger than {max_entry_size} bytes are not accepted'
+
+    try:
+        return entry.read(), None
+    except READ_ERRORS as e:
+        return None, f'The file could not be read: {e}'
+
+
+def store_batch(entries, user, pool, config):
+    folder = os.path.join(current_app.static_folder, current_app.config['TRAINING_IMAGES_UPLOAD_FOLDER'])
+    max_entry_size = current_app.config.get('BULK_UPLOAD_MAX_ENTRY_SIZE', 64 * 1024 * 1024)
+
+    submitted = []
+    for entry in entries:
+        source, error = read_entry(entry, max_entry_size)
+        if error is not None:
+            submitted.append((entry, None, None, error))
+            continue
+
+        public_id = generateUuid()
+        submitted.append((entry, public_id, pool.submit(store_image, source, folder, public_id, config), None))
+
+    results = []
+    rows = []
+    for entry, public_id, future, error in submitted:
+        if error is not None:
+            results.append({'name': entry.name, 'status': 'failed', 'error': error})
+            continue
+
+        try:
+            stored = future.result()
+        except ValueError as e:
+            results.append({'name': entry.name, 'status': 'failed', 'error': str(e)})
+            continue
+        except Exception as e:
+            # Anything else only fails this entry too, the rest of the batch is still inserted
+            results.append({'name': entry.name, 'status': 'failed', 'error': f'The image could not be stored: {e}'})
+            continue
+
+        rows.append(dict(stored, public_id=public_id, user_id=user.id))
+        results.append({
+            'name': entry.name,
+            'status': 'created',
+            'public_id': public_id,
+            '_links': {
+                'self': url_for('api.get_training_image', public_id=public_id),
+                'image': url_for('api.get_training_image_file', public_id=public_id, v=stored['image_version'])
+            }
+        })
+
+    if rows:
+        try:
+            db.session.bulk_insert_mappings(TrainingImage, rows)
+            log_changes(db.session, TrainingImage, 'create', [row['public_id'] for row in rows])
+            record_bulk_change(db.session, TrainingImage)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            file_sweeper.schedule([TrainingImage.make_image_path(row['public_id'], row['image_format']) for row in rows])
+            raise
+
+    return results
+
+
+# Dry runs check every entry from its header, nothing is decoded or stored
+def probe_entries(entries):
+    max_entry_size = current_app.config.get('BULK_UPLOAD_MAX_ENTRY_SIZE', 64 * 1024 * 1024)
+
+    results = []
+    for entry in entries:
+        source, error = read_entry(entry, max_entry_size)
+        if error is not None:
+            results.append({'name': entry.name, 'status': 'failed', 'error': error})
+            continue
+
+        try:
+            with probe_image(source) as probe:
+                probe.verify()
+        except ValueError as e:
+            results.append({'name': entry.name, 'status': 'failed', 'error': str(e)})
+            continue
+
+        results.append({
+            'name': entry.name,
+            'status': 'valid',
+            'format': probe.format,
+            'mode': probe.mode,
+            'width': probe.width,
+            'height': probe.height
+        })
+    return results
+
+
+# Every batch is committed on its own, a failing file only fails its entry in
+# the returned manifest
+def bulk_store_images(entries, user):
+    pool = current_app.extensions['image_worker_pool']
+    batch_size = current_app.config.get('BULK_UPLOAD_BATCH_SIZE', 200)
+    config = {key: current_app.config[key] for key in STORAGE_CONFIG_KEYS if key in current_app.config}
+
+    results = []
+    for start in range(0, len(entries), batch_size):
+        results.extend(store_batch(entries[start:start + batch_size], user, pool, config))
+    return results
@@ -0,0 +1,58 @@
+from datetime import datetime
+
+from sqlalchemy import event, literal, DateTime, String
+
+
+# Every insert, update and delete of a tracked model is written to the change
+# log table in the transaction that makes it, so the log never shows a change
+# that was rolled back and never misses one that was committed. Its
+# autoincrementing id is the sequence number of the change feed.
+_log_table = None
+_tracked_models = ()
+
+
+def make_entry(model, public_id, operation, changed_at):
+    return {'model': model.__name__, 'public_id': public_id, 'operation': operation, 'changed_at': changed_at}
+
+def log_changes(session, model, operation, public_ids):
+    changed_at = datetime.utcnow()
+    rows = [make_entry(model, public_id, operation, changed_at) for public_id in public_ids]
+    if rows:
+        session.execute(_log_table.insert(), rows)
+
+# For bulk statements: logs every row the query selects with one
+# INSERT ... SELECT, run before the statement changes them
+def log_query_changes(session, query, operation):
+    model = query.column_descriptions[0]['entity']
+    rows = query.with_entities(
+        literal(model.__name__, String), model.public_id, literal(operation, String), literal(datetime.utcnow(), DateTime)
+    ).order_by(None)
+
+    session.execute(_log_table.insert().from_select(
+        ['model', 'public_id', 'operation', 'changed_at'], rows.statement
+    ))
+
+
+def _log_flushed_changes(session, flush_context):
+    changed_at = datetime.utcnow()
+    rows = []
+
+    for operation, instances in (('create', session.new), ('update', session.dirty), ('delete', session.deleted)):
+        for instance in sorted(
+            (instance for instance in instances if isinstance(instance, _tracked_models)),
+            key=lambda instance: (type(instance).__name__, instance.id or 0)
+        ):
+            if operation == 'update' and not session.is_modified(instance, include_collections=False):
+                continue
+            rows.append(make_entry(type(instance), instance.public_id, operation, changed_at))
+
+    if rows:
+        session.connection().execute(_log_table.insert(), rows)
+
+
+def track_change_log(session, log_model, models):
+    global _log_table, _tracked_models
+    _log_table = log_model.__table__
+    _tracked_models = tuple(models)
+
+    event.listen(session, 'after_flush', _log_flushed_changes)
@@ -0,0 +1,45 @@
+import json
+import time
+
+import click
+from flask.cli import AppGroup
+
+
+images_cli = AppGroup('images', help='Maintenance of the stored training image files.')
+
+
+@images_cli.command('scan')
+@click.option('--remove-orphans', is_flag=True, help='Remove files that no training image points to.')
+@click.option('--batch-size', default=500, show_default=True, help='Files or rows checked per query.')
+@click.option('--rate', default=2000, show_default=True, help='Max files and rows checked per second, 0 for no limit.')
+@click.option('--grace', default=3600, show_default=True, help='Files younger than this many seconds are never orphans.')
+@click.option('--interval', default=0, help='Run again every this many seconds, as a background collector.')
+def scan_images(remove_orphans, batch_size, rate, grace, interval):
+    """Reports image files without a training image and training images without a file."""
+    from .integrity import scan_image_folder
+
+    while True:
+        report = scan_image_folder(
+            remove_orphans=remove_orphans, batch_size=batch_size, items_per_second=rate, grace_seconds=grace
+        )
+        click.echo(json.dumps(report.to_dict(), indent=2))
+
+        if not interval:
+            return
+        time.sleep(interval)
+
+
+@images_cli.command('backfill-dimensions')
+@click.option('--batch-size', default=500, show_default=True, help='Rows read and updated per transaction.')
+@click.option('--workers', default=8, show_default=True, help='Threads reading image headers.')
+@click.option('--rate', default=0, show_default=True, help='Max rows per second, 0 for no limit.')
+def backfill_image_dimensions(batch_size, workers, rate):
+    """Fills in the width and height of training images that have none, from the headers of their files."""
+    from .backfill import backfill_dimensions
+
+    report = backfill_dimensions(batch_size=batch_size, workers=workers, items_per_second=rate)
+    click.echo(json.dumps(report.to_dict(), indent=2))
+
+
+def register_commands(app):
+    app.cli.add_command(images_cli)
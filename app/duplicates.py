@@ -0,0 +1,91 @@
+from itertools import groupby
+
+from sqlalchemy.orm import load_only
+
+from app import db
+from .boxes import cluster_duplicates, merge_boxes, suppress_duplicates
+from .change_log import log_changes, log_query_changes
+from .model_versions import record_bulk_change
+from .summaries import refresh_summaries
+from .models import ClassifiedArea, TrainingImage
+
+
+DUPLICATE_MODES = {
+    'cluster': cluster_duplicates,
+    'nms': suppress_duplicates
+}
+
+
+class DuplicateGroup(object):
+    __slots__ = ('training_image', 'tag', 'areas')
+
+    def __init__(self, training_image, tag, areas):
+        self.training_image = training_image
+        self.tag = tag
+        self.areas = areas
+
+    # The oldest area is the one kept when the group is merged
+    @property
+    def keep(self):
+        return self.areas[0]
+
+    def to_dict(self):
+        return {
+            'training_image': self.training_image,
+            'tag': self.tag,
+            'keep': self.keep.public_id,
+            'duplicates': [area.public_id for area in self.areas[1:]]
+        }
+
+
+# Areas can only duplicate areas of the same image and tag, so the IoUs are
+# computed per image and tag, never over the whole query
+def find_duplicate_groups(query, threshold, mode='cluster'):
+    find_groups = DUPLICATE_MODES[mode]
+
+    rows = (
+        query.join(ClassifiedArea.training_image)
+        .options(load_only('public_id', 'tag', 'x_position', 'y_position', 'width', 'height', 'image_id'))
+        .add_columns(TrainingImage.public_id)
+        .order_by(ClassifiedArea.image_id, ClassifiedArea.tag, ClassifiedArea.id)
+    )
+
+    groups = []
+    for (_, tag, training_image), grouped in groupby(rows, key=lambda row: (row[0].image_id, row[0].tag, row[1])):
+        areas = [area for area, _ in grouped]
+        if len(areas) < 2:
+            continue
+
+        for indices in find_groups(
+            [area.x_position for area in areas], [area.y_position for area in areas],
+            [area.width for area in areas], [area.height for area in areas],
+            threshold
+        ):
+            groups.append(DuplicateGroup(training_image, tag, [areas[index] for index in indices]))
+    return groups
+
+def merge_duplicate_groups(groups, strategy='mean'):
+    updates = []
+    duplicate_ids = []
+    for group in groups:
+        if strategy == 'mean':
+            x_position, y_position, width, height = merge_boxes(
+                [area.x_position for area in group.areas], [area.y_position for area in group.areas],
+                [area.width for area in group.areas], [area.height for area in group.areas]
+            )
+            updates.append({
+                'id': group.keep.id, 'x_position': x_position, 'y_position': y_position, 'width': width, 'height': height
+            })
+        duplicate_ids.extend(area.id for area in group.areas[1:])
+
+    if updates:
+        db.session.bulk_update_mappings(ClassifiedArea, updates)
+        log_changes(db.session, ClassifiedArea, 'update', [group.keep.public_id for group in groups])
+    for start in range(0, len(duplicate_ids), 500):
+        duplicates_query = ClassifiedArea.query.filter(ClassifiedArea.id.in_(duplicate_ids[start:start + 500]))
+        log_query_changes(db.session, duplicates_query, 'delete')
+        duplicates_query.delete(synchronize_session=False)
+
+    record_bulk_change(db.session, ClassifiedArea)
+    refresh_summaries(db.session, [group.keep.image_id for group in groups])
+    return len(duplicate_ids)
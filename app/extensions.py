@@ -1,9 +1,43 @@
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import sqlite3
+
+from .images import ImageWorkerPool
+from .instrumentation import Instrumentation
+from .json_encoding import JSONProvider
+from .lazy_migrate import LazyMigrate
+from .rate_limit import RateLimiter
+from .render_farm import CropRenderer
+from .response_cache import ResponseCache
+from .sweeper import file_sweeper
+
 
 db = SQLAlchemy()
-migrate = Migrate(db=db)
+migrate = LazyMigrate(db=db)
+instrumentation = Instrumentation()
+response_cache = ResponseCache()
+image_worker_pool = ImageWorkerPool()
+json_provider = JSONProvider()
+rate_limiter = RateLimiter()
+crop_renderer = CropRenderer()
+
+# SQLite only enforces foreign keys ( and ON DELETE CASCADE ) when asked to
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
 
 def register_app(app):
     db.init_app(app)
     migrate.init_app(app)
+    instrumentation.init_app(app)
+    response_cache.init_app(app)
+    file_sweeper.init_app(app)
+    image_worker_pool.init_app(app)
+    json_provider.init_app(app)
+    rate_limiter.init_app(app)
+    crop_renderer.init_app(app)
@@ -0,0 +1,218 @@
+import hashlib
+import io
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+
+
+# PIL format name -> (file extension, mimetype) of the formats images are stored in
+STORED_FORMATS = {
+    'PNG': ('png', 'image/png'),
+    'JPEG': ('jpeg', 'image/jpeg'),
+    'WEBP': ('webp', 'image/webp'),
+    'TIFF': ('tiff', 'image/tiff')
+}
+
+STORAGE_POLICIES = ['png', 'original', 'webp-lossless', 'raw']
+
+EXTENSION_MIMETYPES = {extension: mimetype for extension, mimetype in STORED_FORMATS.values()}
+
+
+def get_mimetype(extension):
+    return EXTENSION_MIMETYPES.get(extension, 'application/octet-stream')
+
+
+# Modes PNG can store, images in any other mode ( CMYK, YCbCr, LAB, ... ) are converted first
+PNG_MODES = ('1', 'L', 'LA', 'I', 'I;16', 'P', 'RGB', 'RGBA')
+
+def encode_png(image, config):
+    if image.mode == 'F':
+        image = image.convert('I')
+    elif image.mode not in PNG_MODES:
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+    stream = io.BytesIO()
+    image.save(stream, format='PNG', compress_level=config.get('TRAINING_IMAGES_PNG_COMPRESS_LEVEL', 6))
+    return stream.getvalue(), 'png'
+
+def encode_webp_lossless(image, config):
+    from PIL import features
+
+    if not features.check('webp'):
+        raise RuntimeError('Pillow was built without WebP support, webp-lossless storage is not available')
+
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or image.mode == 'P' else 'RGB')
+
+    stream = io.BytesIO()
+    image.save(stream, format='WEBP', lossless=True, quality=config.get('TRAINING_IMAGES_WEBP_EFFORT', 80))
+    return stream.getvalue(), 'webp'
+
+def encode_raw(image, config):
+    # Uncompressed TIFF stores every mode and is the cheapest to decode
+    stream = io.BytesIO()
+    image.save(stream, format='TIFF', compression=None)
+    return stream.getvalue(), 'tiff'
+
+def stores_original(image_format, config):
+    # Uploads that already are in an accepted format are stored byte for byte
+    return (
+        config.get('TRAINING_IMAGES_STORAGE_FORMAT', 'png') == 'original'
+        and image_format in config.get('TRAINING_IMAGES_ORIGINAL_FORMATS', ['PNG', 'JPEG', 'WEBP'])
+        and image_format in STORED_FORMATS
+    )
+
+# Image can be a probe when the upload is stored as it is, only its format is read then
+def encode_for_storage(image, source_bytes, config):
+    policy = config.get('TRAINING_IMAGES_STORAGE_FORMAT', 'png')
+
+    if policy == 'original':
+        if stores_original(image.format, config):
+            return source_bytes, STORED_FORMATS[image.format][0]
+        return encode_png(image, config)
+
+    if policy == 'webp-lossless':
+        return encode_webp_lossless(image, config)
+
+    if policy == 'raw':
+        return encode_raw(image, config)
+
+    if policy != 'png':
+        raise ValueError(f'Unknown storage format policy "{policy}", valid policies are {STORAGE_POLICIES}')
+    return encode_png(image, config)
+
+
+# PIL is imported on first use, processes that never touch an image do not load it
+def open_image(source_bytes):
+    from PIL import Image as PILImage
+
+    return PILImage.open(io.BytesIO(source_bytes))
+
+def decode_image(source_bytes):
+    from PIL import Image as PILImage, UnidentifiedImageError
+
+    try:
+        image = open_image(source_bytes)
+        image.load()
+    except (UnidentifiedImageError, PILImage.DecompressionBombError, OSError):
+        raise ValueError('Image file passed is corrupt/not an image')
+    return image
+
+
+# Formats whose Pillow verify() checks the whole file ( PNG chunk checksums ),
+# for the others it checks nothing and verifying them means decoding them
+VERIFIABLE_FORMATS = ('PNG',)
+
+
+# Format, size and mode of an image, from its header only. verify() checks
+# the rest of the file, without decoding it where the format allows
+class ImageProbe(object):
+    def __init__(self, image):
+        self._image = image
+        self.verified = False
+
+    @property
+    def format(self):
+        return self._image.format
+
+    @property
+    def mode(self):
+        return self._image.mode
+
+    @property
+    def size(self):
+        return self._image.size
+
+    @property
+    def width(self):
+        return self._image.width
+
+    @property
+    def height(self):
+        return self._image.height
+
+    def verify(self):
+        if not self.verified:
+            try:
+                if self._image.format in VERIFIABLE_FORMATS:
+                    self._image.verify()
+                else:
+                    self._image.load()
+            except Exception:
+                raise ValueError('Image file passed is corrupt/not an image')
+            self.verified = True
+        return self
+
+    def close(self):
+        self._image.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def probe_image(source):
+    # Bytes or a path, PIL only parses the header when it opens an image
+    from PIL import Image as PILImage, UnidentifiedImageError
+
+    try:
+        return ImageProbe(PILImage.open(io.BytesIO(source) if isinstance(source, bytes) else source))
+    except (UnidentifiedImageError, PILImage.DecompressionBombError, OSError, SyntaxError):
+        raise ValueError('Image file passed is corrupt/not an image')
+
+def probe_for_storage(source_bytes, config):
+    # Uploads stored as they are only need their header and a verify(),
+    # which decodes the formats that can not be checked any other way.
+    # Every other upload is decoded to be encoded
+    probe = probe_image(source_bytes)
+    if stores_original(probe.format, config):
+        return probe.verify()
+    return decode_image(source_bytes)
+
+
+# Runs in the bulk upload worker processes: decodes, validates and encodes one
+# upload and writes it to the upload folder, the row is inserted by the caller
+def store_image(source_bytes, folder, public_id, config):
+    image = probe_for_storage(source_bytes, config)
+    stored, image_format = encode_for_storage(image, source_bytes, config)
+
+    with open(os.path.join(folder, f'{public_id}.{image_format}'), 'wb') as file:
+        file.write(stored)
+
+    width, height = image.size
+    return {
+        'width': width,
+        'height': height,
+        'image_format': image_format,
+        'image_version': hashlib.sha1(stored).hexdigest()[:16]
+    }
+
+
+# Decoding and encoding is CPU bound and holds the GIL, so bulk uploads are
+# spread over processes. The pool is started on first use, after a
+# preforking server has forked its workers.
+class ImageWorkerPool(object):
+    def __init__(self, workers=None):
+        self.workers = workers
+        self._executor = None
+
+    def init_app(self, app):
+        self.workers = app.config.get('BULK_UPLOAD_WORKERS', self.workers)
+        app.extensions['image_worker_pool'] = self
+
+    def submit(self, fn, *args):
+        # 0 workers runs everything on the request thread
+        if self.workers == 0:
+            future = Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        if self._executor is None:
+            # Started from a request thread, the workers come from the
+            # forkserver so they never inherit a lock another thread holds
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('forkserver'))
+        return self._executor.submit(fn, *args)
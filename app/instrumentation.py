@@ -0,0 +1,178 @@
+import cProfile
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, current_app, g, has_app_context, request
+from sqlalchemy import event
+
+
+class RequestTimings(object):
+    def __init__(self):
+        self.start = time.perf_counter()
+
+        self.query_count = 0
+        self.query_seconds = 0.0
+
+        self.image_seconds = {
+            'decode': 0.0,
+            'encode': 0.0
+        }
+
+        self.profiler = None
+
+
+def current_timings():
+    if not has_app_context():
+        return None
+    return g.get('request_timings')
+
+
+# For image work timed somewhere else, like another process
+def add_image_time(kind, seconds):
+    timings = current_timings()
+    if timings is not None:
+        timings.image_seconds[kind] += seconds
+
+@contextmanager
+def record_image_time(kind):
+    timings = current_timings()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings.image_seconds[kind] += time.perf_counter() - start
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info['query_start_time'].pop()
+
+    timings = current_timings()
+    if timings is not None:
+        timings.query_count += 1
+        timings.query_seconds += time.perf_counter() - start
+
+
+class MetricsRegistry(object):
+    METRICS = [
+        ('requests_total', 'counter', 'Requests handled'),
+        ('request_duration_seconds_total', 'counter', 'Wall time spent handling requests'),
+        ('db_queries_total', 'counter', 'SQL statements executed'),
+        ('db_duration_seconds_total', 'counter', 'Time spent executing SQL statements'),
+        ('image_decode_seconds_total', 'counter', 'Time spent decoding images with PIL'),
+        ('image_encode_seconds_total', 'counter', 'Time spent encoding images with PIL'),
+        ('response_bytes_total', 'counter', 'Size of the response bodies sent'),
+    ]
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def record(self, endpoint, method, timings, duration, response_size):
+        labels = (endpoint, method)
+        with self._lock:
+            values = self._values.setdefault(labels, dict.fromkeys((name for name, _, _ in self.METRICS), 0))
+            values['requests_total'] += 1
+            values['request_duration_seconds_total'] += duration
+            values['db_queries_total'] += timings.query_count
+            values['db_duration_seconds_total'] += timings.query_seconds
+            values['image_decode_seconds_total'] += timings.image_seconds['decode']
+            values['image_encode_seconds_total'] += timings.image_seconds['encode']
+            values['response_bytes_total'] += response_size
+
+    def to_prometheus(self):
+        with self._lock:
+            values = {labels: dict(metrics) for labels, metrics in self._values.items()}
+
+        lines = []
+        for name, metric_type, description in self.METRICS:
+            full_name = f'{self.prefix}_{name}'
+            lines.append(f'# HELP {full_name} {description}')
+            lines.append(f'# TYPE {full_name} {metric_type}')
+            for (endpoint, method), metrics in sorted(values.items()):
+                lines.append(f'{full_name}{{endpoint="{endpoint}",method="{method}"}} {metrics[name]}')
+        return '\n'.join(lines) + '\n'
+
+
+class Instrumentation(object):
+    def init_app(self, app):
+        # Opt-in, nothing is recorded unless the config enables it
+        if not app.config.get('INSTRUMENTATION_ENABLED'):
+            return
+
+        app.extensions['instrumentation'] = MetricsRegistry(app.config.get('INSTRUMENTATION_METRICS_PREFIX', 'microaa'))
+
+        with app.app_context():
+            engine = app.extensions['sqlalchemy'].db.get_engine(app)
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        app.teardown_request(self.stop_profiler)
+
+        app.add_url_rule('/metrics', 'metrics', self.metrics)
+
+    def start_request(self):
+        timings = RequestTimings()
+
+        if random.random() < current_app.config.get('PROFILING_SAMPLE_RATE', 0):
+            timings.profiler = cProfile.Profile()
+            try:
+                timings.profiler.enable()
+            except ValueError:  # Another profiler is already running
+                timings.profiler = None
+
+        g.request_timings = timings
+
+    def finish_request(self, response):
+        timings = g.pop('request_timings', None)
+        if timings is None:
+            return response
+
+        duration = time.perf_counter() - timings.start
+        self.stop_profiler(timings=timings)
+        self.dump_profile_if_slow(timings, duration)
+
+        response.headers['Server-Timing'] = ', '.join([
+            f'total;dur={duration * 1000:.2f}',
+            f'db;dur={timings.query_seconds * 1000:.2f};desc="{timings.query_count} queries"',
+            f'decode;dur={timings.image_seconds["decode"] * 1000:.2f}',
+            f'encode;dur={timings.image_seconds["encode"] * 1000:.2f}',
+        ])
+
+        current_app.extensions['instrumentation'].record(
+            request.endpoint or 'unknown', request.method, timings, duration, response.content_length or 0
+        )
+        return response
+
+    def stop_profiler(self, exception=None, timings=None):
+        timings = timings or current_timings()
+        if timings is not None and timings.profiler is not None:
+            timings.profiler.disable()
+
+    def dump_profile_if_slow(self, timings, duration):
+        if timings.profiler is None:
+            return
+
+        if duration * 1000 < current_app.config.get('PROFILING_SLOW_REQUEST_MS', 500):
+            return
+
+        folder = current_app.config.get('PROFILING_DUMP_FOLDER') or 'profiles'
+        os.makedirs(folder, exist_ok=True)
+
+        file_name = f'{int(time.time() * 1000)}-{request.endpoint or "unknown"}-{duration * 1000:.0f}ms.prof'
+        timings.profiler.dump_stats(os.path.join(folder, file_name))
+
+    def metrics(self):
+        return Response(
+            current_app.extensions['instrumentation'].to_prometheus(),
+            mimetype='text/plain; version=0.0.4'
+        )
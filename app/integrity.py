@@ -0,0 +1,141 @@
+import os
+import time
+
+from flask import current_app
+
+from app import db
+from app.models import TrainingImage
+
+
+class ScanReport(object):
+    def __init__(self):
+        self.files_scanned = 0
+        self.rows_scanned = 0
+
+        self.orphaned_files = []
+        self.missing_files = []
+        self.removed_files = 0
+
+    def to_dict(self):
+        return {
+            'files_scanned': self.files_scanned,
+            'rows_scanned': self.rows_scanned,
+            'orphaned_files': self.orphaned_files,
+            'missing_files': self.missing_files,
+            'removed_files': self.removed_files
+        }
+
+
+class Throttle(object):
+    # Keeps the scan at or below items_per_second so it can share the disk and
+    # database with production traffic
+    def __init__(self, items_per_second):
+        self.items_per_second = items_per_second
+        self.started = time.monotonic()
+        self.items = 0
+
+    def wait(self, items):
+        self.items += items
+        if not self.items_per_second:
+            return
+
+        ahead = self.items / self.items_per_second - (time.monotonic() - self.started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def get_upload_folder():
+    return os.path.join(current_app.static_folder, current_app.config['TRAINING_IMAGES_UPLOAD_FOLDER'])
+
+def scan_file_batch(batch, report, grace_seconds):
+    stored_formats = dict(
+        db.session.query(TrainingImage.public_id, TrainingImage.image_format)
+        .filter(TrainingImage.public_id.in_([public_id for public_id, _, _, _ in batch]))
+    )
+
+    now = time.time()
+    for public_id, extension, path, modified in batch:
+        if public_id in stored_formats and (stored_formats[public_id] or 'png') == extension:
+            continue
+
+        # Files this young may belong to an upload that has not committed yet
+        if now - modified < grace_seconds:
+            continue
+
+        report.orphaned_files.append(path)
+
+def scan_files(report, batch_size, throttle, grace_seconds):
+    seen = set()
+    batch = []
+
+    with os.scandir(get_upload_folder()) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+
+            public_id, _, extension = entry.name.partition('.')
+            seen.add(entry.name)
+            batch.append((public_id, extension, entry.path, entry.stat().st_mtime))
+
+            if len(batch) >= batch_size:
+                scan_file_batch(batch, report, grace_seconds)
+                report.files_scanned += len(batch)
+                throttle.wait(len(batch))
+                batch = []
+
+    if batch:
+        scan_file_batch(batch, report, grace_seconds)
+        report.files_scanned += len(batch)
+
+    return seen
+
+def scan_rows(report, seen, batch_size, throttle):
+    last_id = 0
+    while True:
+        rows = (
+            db.session.query(TrainingImage.id, TrainingImage.public_id, TrainingImage.image_format)
+            .filter(TrainingImage.id > last_id)
+            .order_by(TrainingImage.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            return
+
+        for _, public_id, image_format in rows:
+            path = TrainingImage.make_image_path(public_id, image_format)
+
+            # The file may have been written after the folder was scanned
+            if os.path.basename(path) not in seen and not os.path.exists(path):
+                report.missing_files.append(path)
+
+        report.rows_scanned += len(rows)
+        last_id = rows[-1][0]
+        throttle.wait(len(rows))
+
+def scan_image_folder(remove_orphans=False, batch_size=500, items_per_second=None, grace_seconds=3600):
+    report = ScanReport()
+    throttle = Throttle(items_per_second)
+
+    seen = scan_files(report, batch_size, throttle, grace_seconds)
+    scan_rows(report, seen, batch_size, throttle)
+
+    # Rows are only read, the transaction is closed so it holds no locks
+    db.session.rollback()
+
+    if remove_orphans:
+        remove_files(report, batch_size, throttle)
+
+    return report
+
+def remove_files(report, batch_size, throttle):
+    for start in range(0, len(report.orphaned_files), batch_size):
+        batch = report.orphaned_files[start:start + batch_size]
+        for path in batch:
+            try:
+                os.remove(path)
+                report.removed_files += 1
+            except FileNotFoundError:
+                pass
+
+        throttle.wait(len(batch))
@@ -0,0 +1,55 @@
+import importlib
+
+from flask.json import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class OrjsonEncoder(JSONEncoder):
+    # orjson writes compact or 2-space indented output, any other indent
+    # (which only debugging asks for) is left to the stdlib encoder
+    def encode(self, o):
+        if self.indent not in (None, 2):
+            return super().encode(o)
+
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if self.indent == 2:
+            options |= orjson.OPT_INDENT_2
+
+        # Values orjson does not know, and dates, which Flask writes as HTTP
+        # dates, still go through JSONEncoder.default
+        try:
+            return orjson.dumps(o, default=self.default, option=options).decode('utf-8')
+        except orjson.JSONEncodeError:
+            # What orjson can not write, like integers wider than 64 bits,
+            # the stdlib encoder still can
+            return super().encode(o)
+
+
+BACKENDS = {
+    'orjson': OrjsonEncoder,
+    'stdlib': JSONEncoder
+}
+
+def load_encoder(backend):
+    if backend == 'auto':
+        return OrjsonEncoder if orjson is not None else JSONEncoder
+
+    if backend == 'orjson' and orjson is None:
+        raise RuntimeError('JSON_ENCODER_BACKEND is orjson but orjson is not installed')
+    if backend in BACKENDS:
+        return BACKENDS[backend]
+
+    # Any other encoder is given as "module:Class"
+    module_name, class_name = backend.split(':')
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+class JSONProvider(object):
+    def init_app(self, app):
+        app.json_encoder = load_encoder(app.config.get('JSON_ENCODER_BACKEND', 'auto'))
@@ -0,0 +1,22 @@
+# Flask-Migrate imports alembic, which only the `flask db` commands and
+# migrations/env.py use. Until one of them reads app.extensions['migrate']
+# it holds this stand in, which sets up the real extension on first use
+class _PendingMigrateConfig(object):
+    def __init__(self, app, db):
+        self._app = app
+        self._db = db
+
+    def __getattr__(self, name):
+        from flask_migrate import Migrate
+
+        Migrate(self._app, self._db)
+        return getattr(self._app.extensions['migrate'], name)
+
+
+class LazyMigrate(object):
+    def __init__(self, db):
+        self.db = db
+
+    def init_app(self, app):
+        app.extensions['migrate'] = _PendingMigrateConfig(app, self.db)
+
@@ -0,0 +1,68 @@
+import threading
+import time
+
+from sqlalchemy import event
+
+
+# Every model has a version that is bumped whenever a transaction writing
+# to its table commits. Caches store the versions they were computed at and
+# treat an entry as stale once any of them has moved on
+_lock = threading.Lock()
+_versions = {}
+_changed_at = {}
+_listeners = []
+
+
+def get_model_version(model):
+    return _versions.get(model.__name__, 0)
+
+def get_model_versions(models):
+    return tuple(get_model_version(model) for model in models)
+
+def get_versions_by_name(model_names):
+    return [_versions.get(name, 0) for name in model_names]
+
+def get_last_changed(models):
+    return max((_changed_at.get(model.__name__, 0) for model in models), default=0)
+
+def on_models_changed(listener):
+    _listeners.append(listener)
+    return listener
+
+def mark_models_changed(*models):
+    names = {model.__name__ for model in models}
+    now = time.time()
+
+    with _lock:
+        for name in names:
+            _versions[name] = _versions.get(name, 0) + 1
+            _changed_at[name] = now
+
+    for listener in _listeners:
+        listener(names)
+
+
+# Bulk statements (query.delete()/update()) bypass the flush, so the models
+# they write to are recorded by hand and published with the commit
+def record_bulk_change(session, *models):
+    session.info.setdefault('changed_models', set()).update(models)
+
+
+def _collect_changed_models(session, flush_context):
+    changed = session.info.setdefault('changed_models', set())
+    for instance in session.new | session.dirty | session.deleted:
+        changed.add(type(instance))
+
+def _publish_changed_models(session):
+    changed = session.info.pop('changed_models', None)
+    if changed:
+        mark_models_changed(*changed)
+
+def _discard_changed_models(session):
+    session.info.pop('changed_models', None)
+
+
+def track_model_changes(session):
+    event.listen(session, 'after_flush', _collect_changed_models)
+    event.listen(session, 'after_commit', _publish_changed_models)
+    event.listen(session, 'after_rollback', _discard_changed_models)
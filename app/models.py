@@ -1,32 +1,104 @@
 from flask import current_app, url_for
 from werkzeug.security import check_password_hash, generate_password_hash
 
+import hashlib
 import os
+import random
+from datetime import datetime
 
 from app import db
-from PIL import Image as PILImage, UnidentifiedImageError
+from sqlalchemy.orm import Bundle, aliased, joinedload, load_only
 from uuid import uuid4
 
+from .boxes import BOX_FIELDS, BoxError, validate_boxes
+from .change_log import log_changes, log_query_changes, track_change_log
+from .images import encode_for_storage, get_mimetype, probe_for_storage
+from .instrumentation import record_image_time
+from .model_versions import record_bulk_change, track_model_changes
+from .summaries import refresh_summaries, track_summaries
+from .sweeper import schedule_file_removal, track_file_removals
 from .utilities import valid_email, valid_password
 
 
 def generateUuid():
     return uuid4().hex
 
+class ParentRecord(object):
+    __slots__ = ('public_id',)
+
+    def __init__(self, public_id):
+        self.public_id = public_id
+
+class APIRecord(object):
+    # Read only stand in for a model instance, holding only the columns a
+    # response needs. Made by APIModelMixin.project_query, never in a session
+    __slots__ = ()
+    PARENTS = frozenset()
+
+    def __init__(self, names, values):
+        for name, value in zip(names, values):
+            if name in self.PARENTS:
+                value = ParentRecord(value) if value is not None else None
+            setattr(self, name, value)
+
+class RecordBundle(Bundle):
+    single_entity = True
+
+    def __init__(self, name, record_class, *columns):
+        super().__init__(name, *columns)
+        self.record_class = record_class
+
+    def create_row_processor(self, query, procs, labels):
+        record_class = self.record_class
+
+        def make_record(row):
+            return record_class(labels, [proc(row) for proc in procs])
+        return make_record
+
+
 class APIModelMixin(object):
+    # Maps every field returned by to_dict to the column it is read from.
+    # Fields rendered as the public_id of a parent also list the relationship
+    # in SERIALIZED_PARENTS, LINK_FIELDS are the fields get_links() reads and
+    # LINK_COLUMNS any other columns it needs
+    SERIALIZED_FIELDS = {}
+    SERIALIZED_PARENTS = {}
+    LINK_FIELDS = ()
+    LINK_COLUMNS = ()
+    # Methods get_links calls, copied to the record class
+    RECORD_METHODS = ()
+
+    @classmethod
+    def get_attribute_type_names(cls):
+        # Built once per model instead of on every rejected argument
+        if '_attribute_type_names' not in cls.__dict__:
+            cls._attribute_type_names = {
+                argument: [i.__name__ for i in types] if isinstance(types, tuple) else types.__name__
+                for argument, types in cls.ATTRIBUTE_TYPES.items()
+            }
+        return cls._attribute_type_names
+
+    @classmethod
+    def invalid_argument_type_message(cls, arguments, argument):
+        return f'{argument} was of type {type(arguments[argument]).__name__} not of type {cls.get_attribute_type_names()[argument]}'
+
     @classmethod
     def raise_invalid_argument_type_exception(cls, arguments, argument):
-        if isinstance(cls.ATTRIBUTE_TYPES[argument], tuple):
-            raise TypeError(f'{argument} was of type {type(arguments[argument]).__name__} not of type {list(i.__name__ for i in cls.ATTRIBUTE_TYPES[argument])}') 
-        else:
-            raise TypeError(f'{argument} was of type {type(arguments[argument]).__name__} not of type {cls.ATTRIBUTE_TYPES[argument].__name__}')   
+        raise TypeError(cls.invalid_argument_type_message(arguments, argument))
 
     @classmethod
-    def validate_argument_types(cls, arguments):
+    def find_invalid_argument_type(cls, arguments):
         for argument in arguments:
             if argument in cls.UPDATABLE_ATTRIBUTES:
                 if not isinstance(arguments[argument], cls.ATTRIBUTE_TYPES[argument]):
-                    cls.raise_invalid_argument_type_exception(arguments, argument)
+                    return argument
+        return None
+
+    @classmethod
+    def validate_argument_types(cls, arguments):
+        argument = cls.find_invalid_argument_type(arguments)
+        if argument is not None:
+            cls.raise_invalid_argument_type_exception(arguments, argument)
     
     @classmethod
     def from_dict(cls, dictionary):
@@ -48,8 +120,87 @@ class APIModelMixin(object):
     def modifiable_by(self, user):
         pass
 
-    def to_dict(self):
-        pass
+    def get_links(self):
+        return {}
+
+    def serialize_field(self, field):
+        if field in self.SERIALIZED_PARENTS:
+            parent = getattr(self, self.SERIALIZED_PARENTS[field])
+            return parent.public_id if parent else None
+
+        value = getattr(self, field)
+        if isinstance(value, datetime):
+            return value.isoformat() + 'Z'
+        return value
+
+    def to_dict(self, fields=None, include_links=True):
+        data = {field: self.serialize_field(field) for field in (fields or self.SERIALIZED_FIELDS)}
+
+        if include_links:
+            data['_links'] = self.get_links()
+        return data
+
+    @classmethod
+    def query_options_for_fields(cls, fields=None, include_links=True):
+        needed = set(fields or cls.SERIALIZED_FIELDS)
+        if include_links:
+            needed.update(cls.LINK_FIELDS)
+
+        columns = [cls.SERIALIZED_FIELDS[field] for field in needed]
+        if include_links:
+            columns.extend(cls.LINK_COLUMNS)
+
+        options = [load_only(*columns)]
+        for field, relationship in cls.SERIALIZED_PARENTS.items():
+            if field in needed:
+                options.append(joinedload(getattr(cls, relationship)).load_only('public_id'))
+        return options
+
+    @classmethod
+    def get_record_class(cls):
+        if '_record_class' not in cls.__dict__:
+            attributes = {cls.SERIALIZED_PARENTS.get(field, field) for field in cls.SERIALIZED_FIELDS}
+            attributes.update(cls.LINK_COLUMNS)
+
+            namespace = {
+                '__slots__': tuple(sorted(attributes)),
+                'PARENTS': frozenset(cls.SERIALIZED_PARENTS.values()),
+                'SERIALIZED_FIELDS': cls.SERIALIZED_FIELDS,
+                'SERIALIZED_PARENTS': cls.SERIALIZED_PARENTS,
+                'serialize_field': cls.serialize_field,
+                'to_dict': cls.to_dict,
+                'get_links': cls.get_links
+            }
+            for method in cls.RECORD_METHODS:
+                namespace[method] = getattr(cls, method)
+
+            cls._record_class = type(f'{cls.__name__}Record', (APIRecord,), namespace)
+        return cls._record_class
+
+    # Selects only the columns the fields need, the public_id of parents
+    # included, and returns them as records instead of instances
+    @classmethod
+    def project_query(cls, query, fields=None, include_links=True):
+        needed = set(fields or cls.SERIALIZED_FIELDS)
+        if include_links:
+            needed.update(cls.LINK_FIELDS)
+
+        columns = []
+        for field in sorted(needed):
+            if field in cls.SERIALIZED_PARENTS:
+                relationship = getattr(cls, cls.SERIALIZED_PARENTS[field])
+                parent = aliased(relationship.property.mapper.class_)
+                query = query.outerjoin(parent, relationship)
+                columns.append(parent.public_id.label(cls.SERIALIZED_PARENTS[field]))
+            else:
+                columns.append(getattr(cls, cls.SERIALIZED_FIELDS[field]).label(field))
+
+        if include_links:
+            columns.extend(getattr(cls, column).label(column) for column in cls.LINK_COLUMNS)
+
+        # SQLite picks a different index ( and row order ) for different
+        # columns, so pages are ordered by id whatever fields are requested
+        return query.with_entities(RecordBundle(cls.__name__, cls.get_record_class(), *columns)).order_by(cls.id)
 
 
         
@@ -64,6 +215,12 @@ class User(db.Model, APIModelMixin):
         'is_admin': bool
     }
 
+    SERIALIZED_FIELDS = {
+        'email': 'email',
+        'is_admin': 'is_admin',
+        'public_id': 'public_id'
+    }
+    LINK_FIELDS = ('public_id',)
 
     id = db.Column(db.Integer, primary_key=True)
     public_id = db.Column(db.String(32), unique=True, default=generateUuid, index=True)
@@ -72,7 +229,8 @@ class User(db.Model, APIModelMixin):
     password_hash = db.Column(db.String(128), nullable=False)
     is_admin = db.Column(db.Boolean, default=False, nullable=False)
     
-    training_images = db.relationship("TrainingImage", backref="user", cascade="all,delete", lazy='dynamic')
+    # Children are removed by ON DELETE CASCADE and delete_with_dependents, never loaded to be deleted
+    training_images = db.relationship("TrainingImage", backref="user", cascade="all,delete", passive_deletes=True, lazy='dynamic')
 
     def __init__(self, **kwargs):
         super()
@@ -91,21 +249,24 @@ class User(db.Model, APIModelMixin):
                 else:
                     setattr(self, field, data[field])
     
-    def to_dict(self):
+    def get_links(self):
         return {
-            'email': self.email,
-            'is_admin': self.is_admin,
-            'public_id': self.public_id,
-            '_links': {
-                'self': url_for("api.get_user", public_id=self.public_id),
-                'training_images': url_for("api.get_training_images", user=self.public_id),
-                'promote': url_for('api.promote_user', public_id=self.public_id),
-                'demote': url_for('api.demote_user', public_id=self.public_id)
-            }
+            'self': url_for("api.get_user", public_id=self.public_id),
+            'training_images': url_for("api.get_training_images", user=self.public_id),
+            'promote': url_for('api.promote_user', public_id=self.public_id),
+            'demote': url_for('api.demote_user', public_id=self.public_id)
         }
 
     def modifiable_by(self, user):
-        return self == user or user.is_admin
+        return self.public_id == user.public_id or user.is_admin
+
+    def delete_with_dependents(self):
+        TrainingImage.bulk_delete(TrainingImage.query.filter_by(user_id=self.id))
+
+        users_query = User.query.filter_by(id=self.id)
+        log_query_changes(db.session, users_query, 'delete')
+        users_query.delete(synchronize_session=False)
+        record_bulk_change(db.session, User)
     
     def check_password(self, to_check):
         return check_password_hash(self.password_hash, to_check)
@@ -126,16 +287,52 @@ class User(db.Model, APIModelMixin):
 
 
 
-class TrainingImage(db.Model):
+class TrainingImage(db.Model, APIModelMixin):
+    SERIALIZED_FIELDS = {
+        'public_id': 'public_id',
+        'width': 'width',
+        'height': 'height',
+        'user': 'user_id',
+        'area_count': 'area_count',
+        'tags': 'tags',
+        'covered_ratio': 'covered_ratio',
+        'created_at': 'created_at',
+        'updated_at': 'updated_at'
+    }
+    SERIALIZED_PARENTS = {
+        'user': 'user'
+    }
+    LINK_FIELDS = ('public_id', 'user')
+    LINK_COLUMNS = ('image_version',)
+    RECORD_METHODS = ('get_image_url',)
+
     id = db.Column(db.Integer, primary_key=True)
     public_id = db.Column(db.String(32), unique=True, default=generateUuid, index=True)
 
     width = db.Column(db.Integer)
     height = db.Column(db.Integer)
 
-    user_id = db.Column(db.Integer, db.ForeignKey(f'{User.__tablename__}.id'),)
+    # Hash of the stored file, changes whenever the image is replaced
+    image_version = db.Column(db.String(16))
+    # Extension of the stored file, see TRAINING_IMAGES_STORAGE_FORMAT
+    image_format = db.Column(db.String(8), default='png')
 
-    classified_areas = db.relationship("ClassifiedArea", cascade="all,delete", backref="training_image", lazy='dynamic')
+    # Summary of the classified areas, kept up to date by app.summaries. A
+    # NULL covered_ratio is stale and recomputed when it is read
+    area_count = db.Column(db.Integer, nullable=False, default=0, index=True)
+    tags = db.Column(db.JSON, nullable=False, default=list)
+    covered_ratio = db.Column(db.Float, default=0.0, index=True)
+
+    user_id = db.Column(db.Integer, db.ForeignKey(f'{User.__tablename__}.id', ondelete='CASCADE'), index=True)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        db.Index('ix_training_image_width_height', 'width', 'height'),
+    )
+
+    classified_areas = db.relationship("ClassifiedArea", cascade="all,delete", passive_deletes=True, backref="training_image", lazy='dynamic')
     
     def __init__(self, user):
         self.public_id = generateUuid()
@@ -143,50 +340,78 @@ class TrainingImage(db.Model):
             raise ValueError("User does not exist, please pass a valid user")
         self.user = user
     
-    def to_dict(self):
+    def get_links(self):
         return {
-            "public_id": self.public_id,
-            "width": self.width,
-            "height": self.height,
-            
-            "user": self.user.public_id,
-            
-            "_links": {
-                "image": self.get_image_url(),
-                "self": url_for("api.get_training_image", public_id=self.public_id),
-                "user": url_for("api.get_user", public_id=self.user.public_id),
-                "classified_areas": url_for('api.get_classified_areas', training_image=self.public_id)
-            }
+            "image": self.get_image_url(),
+            "self": url_for("api.get_training_image", public_id=self.public_id),
+            "user": url_for("api.get_user", public_id=self.user.public_id),
+            "classified_areas": url_for('api.get_classified_areas', training_image=self.public_id)
         }
     
     def modifiable_by(self, user):
-        return self.user == user or user.is_admin
+        return self.user.public_id == user.public_id or user.is_admin
     
     def set_image(self, im_stream):
         self.delete_image()  # Remove any existing image ( if there is one)
 
-        try:
-            image = PILImage.open(im_stream)
-        except UnidentifiedImageError:
-            raise ValueError('Image file passed is corrupt/not an image')
+        source = im_stream.read()
+        with record_image_time('decode'):
+            image = probe_for_storage(source, current_app.config)
         
-        image.save(os.path.join(current_app.static_folder, current_app.config['TRAINING_IMAGES_UPLOAD_FOLDER'], f'{self.public_id}.png'))
+        with record_image_time('encode'):
+            stored, self.image_format = encode_for_storage(image, source, current_app.config)
+
+        with open(self.get_image_path(), 'wb') as file:
+            file.write(stored)
+
+        self.image_version = hashlib.sha1(stored).hexdigest()[:16]
         self.width, self.height = image.size
         
     def delete_image(self):
         if os.path.exists(self.get_image_path()):
             os.remove(self.get_image_path())
 
+    def delete_with_dependents(self):
+        TrainingImage.bulk_delete(TrainingImage.query.filter_by(id=self.id))
+
+    @staticmethod
+    def bulk_delete(images_query):
+        # Set based: one DELETE for the areas and one for the images, their
+        # files are removed by the sweeper once the deletion is committed
+        files = [
+            TrainingImage.make_image_path(public_id, image_format)
+            for public_id, image_format in images_query.with_entities(TrainingImage.public_id, TrainingImage.image_format)
+        ]
+        image_ids = images_query.with_entities(TrainingImage.id).subquery()
+
+        areas_query = ClassifiedArea.query.filter(ClassifiedArea.image_id.in_(image_ids))
+        log_query_changes(db.session, areas_query, 'delete')
+        areas_query.delete(synchronize_session=False)
+
+        log_query_changes(db.session, images_query, 'delete')
+        images_query.delete(synchronize_session=False)
+
+        record_bulk_change(db.session, TrainingImage, ClassifiedArea)
+        schedule_file_removal(db.session, files)
+
 
     @staticmethod
     def from_dict(dictionary):
         return TrainingImage(user=User.query.filter_by(public_id=dictionary["user"]).first())
 
     def get_image_url(self):
-        return current_app.config["TRAINING_IMAGES_UPLOAD_URL"] + f'/{self.public_id}.png'
+        # The version makes the URL change with the content, so it can be cached forever
+        return url_for("api.get_training_image_file", public_id=self.public_id, v=self.image_version)
 
     def get_image_path(self):
-        return os.path.join(current_app.static_folder, current_app.config['TRAINING_IMAGES_UPLOAD_FOLDER'], f'{self.public_id}.png')
+        return TrainingImage.make_image_path(self.public_id, self.image_format)
+
+    @staticmethod
+    def make_image_path(public_id, image_format):
+        return os.path.join(current_app.static_folder, current_app.config['TRAINING_IMAGES_UPLOAD_FOLDER'], f'{public_id}.{image_format or "png"}')
+
+    def get_image_mimetype(self):
+        return get_mimetype(self.image_format or 'png')
 
 
     
@@ -210,6 +435,19 @@ class ClassifiedArea(db.Model, APIModelMixin):
         'training_image': (TrainingImage)
     }
 
+    SERIALIZED_FIELDS = {
+        'x_position': 'x_position',
+        'y_position': 'y_position',
+        'width': 'width',
+        'height': 'height',
+        'tag': 'tag',
+        'public_id': 'public_id',
+        'training_image': 'image_id'
+    }
+    SERIALIZED_PARENTS = {
+        'training_image': 'training_image'
+    }
+    LINK_FIELDS = ('public_id', 'training_image')
 
     id = db.Column(db.Integer, primary_key=True)
     public_id = db.Column(db.String(32), unique=True, default=generateUuid, index=True)
@@ -222,7 +460,15 @@ class ClassifiedArea(db.Model, APIModelMixin):
     width = db.Column(db.Integer)
     height = db.Column(db.Integer)
 
-    image_id = db.Column(db.Integer, db.ForeignKey(f'{TrainingImage.__tablename__}.id'))
+    image_id = db.Column(db.Integer, db.ForeignKey(f'{TrainingImage.__tablename__}.id', ondelete='CASCADE'), index=True)
+
+    # Uniform in [0, 1), lets app.sampling draw random areas with index range scans
+    random_key = db.Column(db.Float, default=random.random, index=True)
+
+    __table_args__ = (
+        db.Index('ix_classified_area_tag_random_key', 'tag', 'random_key'),
+        db.Index('ix_classified_area_image_id_random_key', 'image_id', 'random_key'),
+    )
     
     def __init__(self, **kwargs):
         
@@ -231,41 +477,30 @@ class ClassifiedArea(db.Model, APIModelMixin):
         )
 
     def update_attributes(self, dictionary):
-        self.prepare_dictionary_of_attributes(dictionary)
+        dictionary = self.prepare_dictionary_of_attributes(dictionary)
 
         for field in dictionary:
             if field in ClassifiedArea.UPDATABLE_ATTRIBUTES:
                 setattr(self, field, dictionary[field])
 
-    def to_dict(self):
+    def get_links(self):
         return {
-            "x_position": self.x_position,
-            "y_position": self.y_position,
-
-            "width": self.width,
-            "height": self.height,
-
-            "tag": self.tag,
-
-            "public_id": self.public_id,
-            "training_image": self.training_image.public_id,
-
-            "_links": {
-                "self": url_for("api.get_classified_area", public_id=self.public_id),
-                "training_image": url_for(
-                    "api.get_training_image", public_id=self.training_image.public_id
-                ) if self.training_image else None,
-                "training_image_cropped": url_for(
-                    "api.get_classified_area_image", public_id=self.public_id
-                )
-            }
+            "self": url_for("api.get_classified_area", public_id=self.public_id),
+            "training_image": url_for(
+                "api.get_training_image", public_id=self.training_image.public_id
+            ) if self.training_image else None,
+            "training_image_cropped": url_for(
+                "api.get_classified_area_image", public_id=self.public_id
+            )
         }
 
     def modifiable_by(self, user):
-        return self.training_image.user == user or user.is_admin
+        return self.training_image.user.public_id == user.public_id or user.is_admin
 
 
     def prepare_dictionary_of_attributes(self, dictionary):
+        # The caller's dictionary ( often request.json ) is left as it is
+        dictionary = dict(dictionary)
         self.fill_missing_attributes(dictionary)
         
         # Make training_image of correct type
@@ -276,6 +511,7 @@ class ClassifiedArea(db.Model, APIModelMixin):
             dictionary['tag'] = dictionary['tag'].lower()
         
         self.validate_arguments(dictionary)
+        return dictionary
 
     def fill_missing_attributes(self, dictionary):
         for attribute in ClassifiedArea.UPDATABLE_ATTRIBUTES:
@@ -283,12 +519,116 @@ class ClassifiedArea(db.Model, APIModelMixin):
                 dictionary[attribute] = getattr(self, attribute)
 
     @classmethod
-    def validate_argument_values(cls, arguments): 
-        if arguments['x_position'] < 0 or arguments['y_position'] < 0:
-            raise ValueError("ClassifiedAreas cannot extend out of the bounds the parent image!")
-        
-        if arguments['x_position'] + arguments['width'] > arguments['training_image'].width or arguments['y_position'] + arguments['height'] > arguments['training_image'].height:
-            raise ValueError("ClassifiedAreas cannot extend out of the bounds the parent image!")
+    def validate_argument_values(cls, arguments):
+        errors = validate_boxes(
+            [arguments['x_position']], [arguments['y_position']], [arguments['width']], [arguments['height']],
+            [arguments['training_image'].width], [arguments['training_image'].height]
+        )
+        if errors:
+            raise ValueError(errors[0].message)
+
+    @classmethod
+    def prepare_batch(cls, items, user):
+        # Validates many new areas at once: one query per 500 parent images and
+        # one vectorized bounds check. Returns the rows to insert and a
+        # BoxError for every rejected area
+        errors = []
+        candidates = []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                errors.append(BoxError(index, None, 'Every area must be an object'))
+                continue
+
+            missing = [field for field in ('training_image',) + BOX_FIELDS if field not in item]
+            if missing:
+                errors.append(BoxError(index, missing[0], f'{missing[0]} must be included'))
+                continue
+
+            if not isinstance(item['training_image'], str):
+                errors.append(BoxError(index, 'training_image', f'training_image was of type {type(item["training_image"]).__name__} not of type str'))
+                continue
+
+            arguments = {field: item.get(field) for field in BOX_FIELDS + ('tag',)}
+            argument = cls.find_invalid_argument_type(arguments)
+            if argument is not None:
+                errors.append(BoxError(index, argument, cls.invalid_argument_type_message(arguments, argument)))
+                continue
+
+            candidates.append((index, item))
+
+        public_ids = list({item['training_image'] for _, item in candidates})
+        images = {}
+        for start in range(0, len(public_ids), 500):
+            for image in TrainingImage.query.options(load_only('id', 'public_id', 'width', 'height', 'user_id')).filter(
+                TrainingImage.public_id.in_(public_ids[start:start + 500])
+            ):
+                images[image.public_id] = image
+
+        parented = []
+        for index, item in candidates:
+            image = images.get(item['training_image'])
+            if image is None:
+                errors.append(BoxError(index, 'training_image', 'Passed traning image does not exist'))
+            elif image.user_id != user.id and not user.is_admin:
+                errors.append(BoxError(index, 'training_image', 'You can only create classified_areas on your own training_images'))
+            else:
+                parented.append((index, item, image))
+
+        box_errors = validate_boxes(
+            *([item[field] for _, item, _ in parented] for field in BOX_FIELDS),
+            [image.width for _, _, image in parented], [image.height for _, _, image in parented]
+        )
+        rejected = set()
+        for error in box_errors:
+            rejected.add(error.index)
+            error.index = parented[error.index][0]
+            errors.append(error)
+
+        rows = [
+            {
+                'public_id': generateUuid(),
+                'image_id': image.id,
+                'x_position': item['x_position'],
+                'y_position': item['y_position'],
+                'width': item['width'],
+                'height': item['height'],
+                'tag': item['tag'].lower() if item.get('tag') else item.get('tag'),
+                'random_key': random.random()
+            }
+            for position, (_, item, image) in enumerate(parented) if position not in rejected
+        ]
+
+        errors.sort(key=lambda error: error.index)
+        return rows, errors
+
+    @staticmethod
+    def bulk_create(rows):
+        db.session.bulk_insert_mappings(ClassifiedArea, rows)
+        log_changes(db.session, ClassifiedArea, 'create', [row['public_id'] for row in rows])
+        record_bulk_change(db.session, ClassifiedArea)
+        refresh_summaries(db.session, [row['image_id'] for row in rows])
+
+
+class ChangeLogEntry(db.Model):
+    # id is the sequence number of the change feed
+    id = db.Column(db.Integer, primary_key=True)
+
+    model = db.Column(db.String(32), nullable=False)
+    public_id = db.Column(db.String(32), nullable=False)
+    operation = db.Column(db.String(8), nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False)
+
+    def to_dict(self):
+        return {
+            'seq': self.id,
+            'model': self.model,
+            'public_id': self.public_id,
+            'operation': self.operation,
+            'changed_at': self.changed_at.isoformat() + 'Z'
+        }
+
 
-        if arguments['width'] < 1 or arguments['height'] < 1:
-            raise ValueError("Width and height cannot be below 1px")
+track_model_changes(db.session)
+track_change_log(db.session, ChangeLogEntry, [User, TrainingImage, ClassifiedArea])
+track_summaries(db.session, TrainingImage, ClassifiedArea)
+track_file_removals(db.session)
@@ -0,0 +1,183 @@
+import importlib
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, request
+
+
+# Endpoints that are not cheap JSON, every other endpoint is in the json class
+ENDPOINT_CLASSES = {
+    'api.get_classified_area_image': 'image',
+    'api.create_training_image': 'upload',
+    'api.create_training_images': 'upload',
+    'api.create_classified_areas': 'upload'
+}
+
+
+class MemoryBackend(object):
+    # Token buckets of this process, the least recently used are dropped
+    # once there are more than max_keys
+    def __init__(self, app):
+        self.max_keys = app.config.get('RATE_LIMIT_MAX_KEYS', 100000)
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def take(self, key, rate, burst):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+
+class RedisBackend(object):
+    # Refills and takes in one script, so processes sharing the server share
+    # the buckets without racing each other
+    TAKE_SCRIPT = """
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local tokens = tonumber(bucket[1]) or burst
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + math.max(now - updated, 0) * rate)
+
+    local allowed = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+        allowed = 1
+    end
+
+    redis.call('HMSET', KEYS[1], 'tokens', tokens, 'updated', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, app):
+        import redis
+
+        self.client = redis.from_url(app.config['RATE_LIMIT_REDIS_URL'])
+        self.prefix = app.config.get('RATE_LIMIT_KEY_PREFIX', 'microaa:rate')
+        self.take_script = self.client.register_script(self.TAKE_SCRIPT)
+
+    def take(self, key, rate, burst):
+        allowed, tokens = self.take_script(keys=[f'{self.prefix}:{key}'], args=[rate, burst, time.time()])
+        return bool(allowed), 0 if allowed else (1 - float(tokens)) / rate
+
+
+BACKENDS = {
+    'memory': MemoryBackend,
+    'redis': RedisBackend
+}
+
+def load_backend(app):
+    backend = app.config.get('RATE_LIMIT_BACKEND', 'memory')
+    if backend in BACKENDS:
+        return BACKENDS[backend](app)
+
+    # Any other backend is given as "module:Class"
+    module_name, class_name = backend.split(':')
+    return getattr(importlib.import_module(module_name), class_name)(app)
+
+
+# "json=20:40,image=5:10" -> {'json': (20.0, 40.0), 'image': (5.0, 10.0)}
+def parse_limits(value):
+    limits = {}
+    for limit in filter(None, value.split(',')):
+        endpoint_class, _, numbers = limit.partition('=')
+        numbers = tuple(float(number) for number in numbers.split(':'))
+        # A rate or burst of 0 could never be refilled
+        if not all(number > 0 for number in numbers):
+            raise ValueError(f'Rate limit "{limit}" has to be made of positive numbers')
+        limits[endpoint_class.strip()] = numbers
+    return limits
+
+
+class AdmissionState(object):
+    def __init__(self, app):
+        self.backend = load_backend(app)
+        self.limits = parse_limits(app.config.get('RATE_LIMITS', ''))
+        self.max_in_flight = {
+            endpoint_class: int(limit[0]) for endpoint_class, limit in parse_limits(app.config.get('RATE_LIMIT_MAX_IN_FLIGHT', '')).items()
+        }
+        self.endpoint_classes = dict(ENDPOINT_CLASSES, **app.config.get('RATE_LIMIT_ENDPOINT_CLASSES', {}))
+
+        self._lock = threading.Lock()
+        self.in_flight = dict.fromkeys(self.max_in_flight, 0)
+
+    def acquire(self, endpoint_class):
+        with self._lock:
+            if self.in_flight[endpoint_class] >= self.max_in_flight[endpoint_class]:
+                return False
+            self.in_flight[endpoint_class] += 1
+            return True
+
+    def release(self, endpoint_class):
+        with self._lock:
+            self.in_flight[endpoint_class] -= 1
+
+
+def make_limited_response(status_code, message, retry_after):
+    from .api.errors import make_error_response
+
+    response = make_error_response(status_code, message)
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+# Called once per request, with the user resolved by login_required or the
+# client address. Returns the response to send instead of running the view
+def check_admission(principal):
+    # Kept on the request, the app context (and g) can outlive one request
+    state = current_app.extensions.get('rate_limiter')
+    if state is None or request.environ.get('microaa.admission_checked'):
+        return None
+    request.environ['microaa.admission_checked'] = True
+
+    endpoint_class = state.endpoint_classes.get(request.endpoint, 'json')
+
+    if endpoint_class in state.limits:
+        rate, burst = state.limits[endpoint_class]
+        allowed, retry_after = state.backend.take(f'{endpoint_class}:{principal}', rate, burst)
+        if not allowed:
+            return make_limited_response(429, f'Too many {endpoint_class} requests, slow down', retry_after)
+
+    # Shed load instead of queueing more work behind a full worker pool
+    if endpoint_class in state.max_in_flight:
+        if not state.acquire(endpoint_class):
+            return make_limited_response(503, f'Too many {endpoint_class} requests in progress, try again later', 1)
+        request.environ['microaa.admission_slot'] = endpoint_class
+
+    return None
+
+
+def _check_anonymous_request():
+    view = current_app.view_functions.get(request.endpoint)
+
+    # Views behind login_required are checked per user once it is resolved
+    if view is None or getattr(view, 'requires_login', False):
+        return None
+    return check_admission(f'ip:{request.remote_addr}')
+
+def _release_admission_slot(exception=None):
+    endpoint_class = request.environ.pop('microaa.admission_slot', None)
+    if endpoint_class is not None:
+        current_app.extensions['rate_limiter'].release(endpoint_class)
+
+
+class RateLimiter(object):
+    def init_app(self, app):
+        if not app.config.get('RATE_LIMIT_ENABLED'):
+            return
+
+        app.extensions['rate_limiter'] = AdmissionState(app)
+        app.before_request(_check_anonymous_request)
+        app.teardown_request(_release_admission_slot)
@@ -0,0 +1,237 @@
+import hashlib
+import importlib
+import multiprocessing
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import resource_tracker, shared_memory, util
+
+from .instrumentation import add_image_time, record_image_time
+from .transforms import render_crop
+
+
+# Decoded sources are published to shared memory as a header followed by
+# the pixels. The header is written last, so a segment whose ready flag is
+# set is complete: ready, mode, width, height
+HEADER = struct.Struct('<B7sII')
+# Modes with 8 bit pixels and nothing else, sources in any other mode ( P,
+# I;16, ... ) are rendered as they are decoded and not published, so the
+# farm renders exactly what the inline renderer does
+SOURCE_MODES = ('L', 'RGB', 'RGBA')
+
+
+def open_source(path):
+    from PIL import Image as PILImage
+
+    image = PILImage.open(path)
+    image.load()
+    return image
+
+
+class InlineRenderer(object):
+    # Decodes and renders on the request thread
+    def __init__(self, app):
+        pass
+
+    def render(self, key, path, box, transform):
+        from PIL import Image as PILImage
+
+        with record_image_time('decode'):
+            image = PILImage.open(path)
+            image.load()
+
+        with record_image_time('encode'):
+            return render_crop(image, box, transform)
+
+    def shutdown(self):
+        pass
+
+
+# State of a render worker process: the segments it published, least
+# recently used first. A worker unlinks its segments when they are evicted
+# and when it exits
+_sources = None
+_cache_size = 0
+
+
+def segment_name(key):
+    return 'microaa_' + hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+
+def publish_source(key, image):
+    import numpy as np
+
+    pixels = np.asarray(image)
+    segment = shared_memory.SharedMemory(name=segment_name(key), create=True, size=HEADER.size + pixels.nbytes)
+    np.ndarray(pixels.shape, dtype=np.uint8, buffer=segment.buf, offset=HEADER.size)[...] = pixels
+    segment.buf[:HEADER.size] = HEADER.pack(1, image.mode.encode('ascii'), image.width, image.height)
+    return segment
+
+def attach_source(key):
+    try:
+        segment = shared_memory.SharedMemory(name=segment_name(key))
+    except FileNotFoundError:
+        return None
+
+    if segment.buf[0] != 1:
+        segment.close()  # Still being written by its owner
+        return None
+    return segment
+
+def image_from_segment(segment):
+    import numpy as np
+    from PIL import Image as PILImage
+
+    _, mode, width, height = HEADER.unpack(bytes(segment.buf[:HEADER.size]))
+    mode = mode.rstrip(b'\0').decode('ascii')
+    shape = (height, width) if mode == 'L' else (height, width, len(mode))
+    return PILImage.fromarray(np.ndarray(shape, dtype=np.uint8, buffer=segment.buf, offset=HEADER.size), mode)
+
+def release_segment(segment, unlink):
+    try:
+        segment.close()
+    except BufferError:
+        pass  # Still viewed by the traceback of a failed render, unmapped once it is collected
+    if unlink:
+        segment.unlink()
+
+def _release_sources():
+    while _sources:
+        release_segment(_sources.popitem()[1], unlink=True)
+
+def _init_worker(cache_size):
+    global _sources, _cache_size
+    _sources = OrderedDict()
+    _cache_size = cache_size
+    util.Finalize(None, _release_sources, exitpriority=10)
+
+def render_job(key, path, box, transform):
+    start = time.perf_counter()
+
+    # Sources are found in this worker's own segments, then in segments
+    # another worker published, and only then decoded from the file
+    segment = _sources.pop(key, None)
+    owned = segment is not None
+    if segment is None:
+        segment = attach_source(key)
+    if segment is None:
+        image = open_source(path)
+        try:
+            if image.mode in SOURCE_MODES:
+                segment = publish_source(key, image)
+                owned = True
+        except FileExistsError:
+            pass  # Another worker is publishing it right now
+
+    try:
+        if segment is not None:
+            image = image_from_segment(segment)
+        decoded = time.perf_counter()
+
+        rendered = render_crop(image, box, transform)
+        rendered_at = time.perf_counter()
+    finally:
+        image = None
+        if owned:
+            _sources[key] = segment
+            while len(_sources) > _cache_size:
+                release_segment(_sources.popitem(last=False)[1], unlink=True)
+        elif segment is not None:
+            release_segment(segment, unlink=False)
+
+    return rendered, decoded - start, rendered_at - decoded
+
+
+class RenderFarm(object):
+    # One single process pool per worker. Every source image is routed to the
+    # same worker, so its decoded pixels stay warm there. When that worker
+    # has max_queue jobs waiting, the job goes to the least busy worker,
+    # which reads the pixels from the shared memory of the owner
+    def __init__(self, app):
+        self.workers = app.config.get('CROP_RENDER_WORKERS') or os.cpu_count()
+        self.cache_size = app.config.get('CROP_RENDER_CACHE_SIZE', 32)
+        self.max_queue = app.config.get('CROP_RENDER_MAX_QUEUE', 4)
+        self.timeout = app.config.get('CROP_RENDER_TIMEOUT', 30)
+
+        self._lock = threading.Lock()
+        self._pools = None
+        self._queued = [0] * self.workers
+
+    def make_pool(self):
+        # Pools are started from a request thread, while other threads may
+        # hold locks a forked child would inherit. Workers come from the
+        # forkserver instead, a clean single threaded process
+        return ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context('forkserver'),
+            initializer=_init_worker, initargs=(self.cache_size,)
+        )
+
+    def get_pools(self):
+        with self._lock:
+            if self._pools is None:
+                # Started before the workers, so they all share it and a
+                # segment is only cleaned up after its owner is gone
+                resource_tracker.ensure_running()
+                self._pools = [self.make_pool() for _ in range(self.workers)]
+            return self._pools
+
+    def route(self, key):
+        worker = zlib.crc32(key.encode('utf-8')) % self.workers
+        with self._lock:
+            if self._queued[worker] >= self.max_queue:
+                least_busy = min(range(self.workers), key=self._queued.__getitem__)
+                if self._queued[least_busy] < self._queued[worker]:
+                    worker = least_busy
+            self._queued[worker] += 1
+        return worker
+
+    def render(self, key, path, box, transform):
+        pools = self.get_pools()
+        worker = self.route(key)
+        try:
+            rendered, decode_seconds, encode_seconds = pools[worker].submit(
+                render_job, key, path, box, transform
+            ).result(timeout=self.timeout)
+        except BrokenProcessPool:
+            # A crashed worker is replaced, the request that saw it fails
+            with self._lock:
+                if self._pools[worker] is pools[worker]:
+                    self._pools[worker] = self.make_pool()
+            raise
+        finally:
+            with self._lock:
+                self._queued[worker] -= 1
+
+        add_image_time('decode', decode_seconds)
+        add_image_time('encode', encode_seconds)
+        return rendered
+
+    def shutdown(self):
+        with self._lock:
+            pools, self._pools = self._pools, None
+        for pool in pools or ():
+            pool.shutdown()
+
+
+BACKENDS = {
+    'inline': InlineRenderer,
+    'farm': RenderFarm
+}
+
+def load_renderer(app):
+    backend = app.config.get('CROP_RENDER_BACKEND', 'inline')
+    if backend in BACKENDS:
+        return BACKENDS[backend](app)
+
+    # Any other backend is given as "module:Class"
+    module_name, class_name = backend.split(':')
+    return getattr(importlib.import_module(module_name), class_name)(app)
+
+
+class CropRenderer(object):
+    def init_app(self, app):
+        app.extensions['crop_renderer'] = load_renderer(app)
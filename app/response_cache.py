@@ -0,0 +1,146 @@
+import hashlib
+import importlib
+import json
+import time
+from functools import wraps
+
+from flask import current_app, make_response, request
+
+from .cache import LRUCache
+from .model_versions import get_versions_by_name, on_models_changed
+
+
+class MemoryBackend(object):
+    def __init__(self, app):
+        self.entries = LRUCache(
+            max_size=app.config.get('RESPONSE_CACHE_MAX_ENTRIES', 4096),
+            ttl=app.config.get('RESPONSE_CACHE_TTL', 60)
+        )
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, entry):
+        self.entries.set(key, entry)
+
+    # Only writes of this process move the versions, with several worker
+    # processes their entries can be up to RESPONSE_CACHE_TTL old
+    def get_versions(self, model_names):
+        return get_versions_by_name(model_names)
+
+
+class RedisBackend(object):
+    def __init__(self, app):
+        import redis
+
+        self.client = redis.from_url(app.config['RESPONSE_CACHE_REDIS_URL'])
+        self.prefix = app.config.get('RESPONSE_CACHE_KEY_PREFIX', 'microaa')
+        self.ttl = app.config.get('RESPONSE_CACHE_TTL', 60)
+
+        # Versions live in redis so a write in one process invalidates the
+        # entries cached by every other process sharing the server
+        on_models_changed(self.bump_versions)
+
+    def _version_key(self, model_name):
+        return f'{self.prefix}:version:{model_name}'
+
+    def get(self, key):
+        value = self.client.get(f'{self.prefix}:response:{key}')
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, entry):
+        self.client.set(f'{self.prefix}:response:{key}', json.dumps(entry), ex=self.ttl)
+
+    def get_versions(self, model_names):
+        return [int(version or 0) for version in self.client.mget([self._version_key(name) for name in model_names])]
+
+    def bump_versions(self, model_names):
+        pipeline = self.client.pipeline()
+        for name in model_names:
+            pipeline.incr(self._version_key(name))
+        pipeline.execute()
+
+
+BACKENDS = {
+    'memory': MemoryBackend,
+    'redis': RedisBackend
+}
+
+def load_backend(app):
+    backend = app.config.get('RESPONSE_CACHE_BACKEND', 'memory')
+    if backend in BACKENDS:
+        return BACKENDS[backend](app)
+
+    # Any other backend is given as "module:Class"
+    module_name, class_name = backend.split(':')
+    return getattr(importlib.import_module(module_name), class_name)(app)
+
+
+class ResponseCache(object):
+    def init_app(self, app):
+        if not app.config.get('RESPONSE_CACHE_ENABLED'):
+            return
+
+        app.extensions['response_cache'] = load_backend(app)
+
+
+def make_cache_key():
+    view_args = sorted((request.view_args or {}).items())
+    query_args = sorted(request.args.items(multi=True))
+    return hashlib.sha1(repr((request.endpoint, view_args, query_args)).encode('utf-8')).hexdigest()
+
+def make_entry(response, versions):
+    body = response.get_data()
+    return {
+        'body': body.decode('utf-8'),
+        'status': response.status_code,
+        'mimetype': response.mimetype,
+        'versions': versions,
+        'etag': hashlib.sha1(body).hexdigest(),
+        'last_modified': time.time()
+    }
+
+def make_response_from_entry(entry):
+    response = current_app.response_class(entry['body'], status=entry['status'], mimetype=entry['mimetype'])
+    response.headers['X-Cache'] = 'HIT'
+    return response
+
+def add_revalidation_headers(response, entry):
+    response.set_etag(entry['etag'])
+    response.last_modified = entry['last_modified']
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def cached_response(*models):
+    model_names = [model.__name__ for model in models]
+
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            backend = current_app.extensions.get('response_cache')
+            if backend is None or request.method != 'GET':
+                return f(*args, **kwargs)
+
+            key = make_cache_key()
+
+            # Versions are read before the view runs, a write committed while
+            # it runs then makes the stored entry stale instead of hiding it
+            versions = backend.get_versions(model_names)
+
+            entry = backend.get(key)
+            if entry is not None and list(entry['versions']) == list(versions):
+                return add_revalidation_headers(make_response_from_entry(entry), entry)
+
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200 or response.mimetype != 'application/json':
+                return response
+
+            entry = make_entry(response, versions)
+            backend.set(key, entry)
+
+            response.headers['X-Cache'] = 'MISS'
+            return add_revalidation_headers(response, entry)
+        return decorated
+    return decorator
@@ -0,0 +1,71 @@
+import math
+
+from .models import ClassifiedArea
+
+
+# Every area has an independent uniform random_key, so the areas following
+# any point in random_key order are a uniform random subset. A sample is
+# drawn as a few runs from random starting points, each one range scan on a
+# random_key index, instead of sorting the whole table by RANDOM().
+def draw_run(query, start, size):
+    rows = query.filter(ClassifiedArea.random_key >= start).order_by(ClassifiedArea.random_key).limit(size).all()
+    if len(rows) < size:
+        # Wrap around to the start of the key range
+        rows += query.filter(ClassifiedArea.random_key < start).order_by(ClassifiedArea.random_key).limit(size - len(rows)).all()
+    return rows
+
+def sample_query(query, n, rng, run_size):
+    sampled = {}
+    attempts = 2 * math.ceil(n / run_size) + 4
+
+    while len(sampled) < n and attempts:
+        size = min(run_size, n - len(sampled))
+        rows = draw_run(query, rng.random(), size)
+        for row in rows:
+            sampled.setdefault(row.id, row)
+
+        # A run that wrapped around without filling up returned every area
+        if len(rows) < size:
+            break
+        attempts -= 1
+
+    if len(sampled) < n:
+        # Short runs rarely wrap around, when the draws did not find enough
+        # areas there may be fewer than n, then they are all returned
+        for row in query.order_by(ClassifiedArea.random_key).limit(n).all():
+            sampled.setdefault(row.id, row)
+
+    return list(sampled.values())[:n]
+
+
+def get_strata(query, tags=None):
+    if tags is not None:
+        return sorted(tag.lower() for tag in tags)
+
+    distinct = query.with_entities(ClassifiedArea.tag).distinct().order_by(None)
+    return sorted((row.tag for row in distinct), key=lambda tag: (tag is None, tag or ''))
+
+def sample_areas(query, n, rng, run_size=1, stratify=False, tags=None):
+    if not stratify:
+        areas = sample_query(query, n, rng, run_size)
+        rng.shuffle(areas)
+        return areas, None
+
+    strata = get_strata(query, tags)
+    if not strata:
+        return [], {}
+
+    # Every tag gets an equal share, the remainder goes to randomly picked tags
+    shares = {tag: n // len(strata) for tag in strata}
+    for tag in rng.sample(strata, n % len(strata)):
+        shares[tag] += 1
+
+    areas = []
+    counts = {}
+    for tag in strata:
+        drawn = sample_query(query.filter(ClassifiedArea.tag == tag if tag is not None else ClassifiedArea.tag.is_(None)), shares[tag], rng, run_size) if shares[tag] else []
+        counts[tag] = len(drawn)
+        areas.extend(drawn)
+
+    rng.shuffle(areas)
+    return areas, counts
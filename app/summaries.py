@@ -0,0 +1,201 @@
+from collections import defaultdict
+from itertools import groupby
+
+from sqlalchemy import bindparam, event, func, inspect, select
+
+from .boxes import covered_area
+from .model_versions import record_bulk_change
+
+
+# The area count, tags and covered ratio of every training image are kept
+# on its row. Writes to areas update the count and tags by their difference
+# in the same transaction and only mark the covered ratio as stale ( NULL ),
+# the ratio is recomputed from the areas of an image once it is read.
+_image_model = None
+_area_model = None
+
+
+def get_covered_ratio(areas, image_width, image_height):
+    pixels = (image_width or 0) * (image_height or 0)
+    covered = covered_area(*([getattr(area, field) for area in areas] for field in ('x_position', 'y_position', 'width', 'height')))
+    return covered / pixels if pixels else 0.0
+
+def summarize(areas, image_width, image_height):
+    return {
+        'area_count': len(areas),
+        'tags': sorted({area.tag for area in areas if area.tag is not None}),
+        'covered_ratio': get_covered_ratio(areas, image_width, image_height)
+    }
+
+# For writes that bypass the flush: counts and tags of the images from their
+# areas, without reading their boxes
+def refresh_summaries(session, image_ids):
+    image_ids = sorted(image_id for image_id in set(image_ids) if image_id is not None)
+    if not image_ids:
+        return
+
+    images = _image_model.__table__
+    areas = _area_model.__table__
+    connection = session.connection()
+
+    summaries = []
+    for start in range(0, len(image_ids), 500):
+        chunk = image_ids[start:start + 500]
+        counts = dict(connection.execute(
+            select([areas.c.image_id, func.count()]).where(areas.c.image_id.in_(chunk)).group_by(areas.c.image_id)
+        ).fetchall())
+        tags = _get_present_tags(connection, chunk)
+
+        summaries.extend(
+            {'image_id': image_id, 'area_count': counts.get(image_id, 0), 'tags': sorted(tags.get(image_id, ()))}
+            for image_id in chunk
+        )
+
+    connection.execute(
+        images.update().where(images.c.id == bindparam('image_id')).values(
+            area_count=bindparam('area_count'), tags=bindparam('tags'), covered_ratio=None
+        ),
+        summaries
+    )
+    record_bulk_change(session, _image_model)
+
+def _get_present_tags(connection, image_ids, tags=None):
+    areas = _area_model.__table__
+    query = select([areas.c.image_id, areas.c.tag]).where(areas.c.image_id.in_(image_ids)).where(areas.c.tag.isnot(None))
+    if tags is not None:
+        query = query.where(areas.c.tag.in_(tags))
+
+    present = {}
+    for image_id, tag in connection.execute(query.distinct()):
+        present.setdefault(image_id, set()).add(tag)
+    return present
+
+# Computes the covered ratio of images marked stale, in batches of images.
+# Returns the number of images refreshed
+def refresh_covered_ratios(session, batch_size=500):
+    images = _image_model.__table__
+    areas = _area_model.__table__
+    connection = session.connection()
+
+    refreshed = 0
+    while True:
+        stale = connection.execute(
+            select([images.c.id, images.c.width, images.c.height]).where(images.c.covered_ratio.is_(None)).limit(batch_size)
+        ).fetchall()
+        if not stale:
+            return refreshed
+
+        rows = connection.execute(
+            select([areas.c.image_id, areas.c.x_position, areas.c.y_position, areas.c.width, areas.c.height])
+            .where(areas.c.image_id.in_([image.id for image in stale]))
+            .order_by(areas.c.image_id)
+        )
+        grouped = {image_id: list(image_areas) for image_id, image_areas in groupby(rows, key=lambda row: row.image_id)}
+
+        connection.execute(
+            # Filling in a ratio is not an edit of the image
+            images.update().where(images.c.id == bindparam('image_id')).values(covered_ratio=bindparam('ratio'), updated_at=images.c.updated_at),
+            [
+                {'image_id': image.id, 'ratio': get_covered_ratio(grouped.get(image.id, []), image.width, image.height)}
+                for image in stale
+            ]
+        )
+        refreshed += len(stale)
+
+
+class _SummaryChanges(object):
+    def __init__(self):
+        self.counts = defaultdict(int)
+        self.added_tags = defaultdict(set)
+        self.removed_tags = defaultdict(set)
+        self.stale = set()
+
+    def add(self, image_id, tag):
+        if image_id is not None:
+            self.counts[image_id] += 1
+            if tag is not None:
+                self.added_tags[image_id].add(tag)
+            self.stale.add(image_id)
+
+    def remove(self, image_id, tag):
+        if image_id is not None:
+            self.counts[image_id] -= 1
+            if tag is not None:
+                self.removed_tags[image_id].add(tag)
+            self.stale.add(image_id)
+
+
+def _old_value(state, attribute):
+    history = state.attrs[attribute].history
+    return history.deleted[0] if history.deleted else getattr(state.object, attribute)
+
+def _old_image_id(state):
+    history = state.attrs.training_image.history
+    if not history.deleted:
+        return state.object.image_id
+    return history.deleted[0].id if history.deleted[0] is not None else None
+
+def _collect_changes(session):
+    changes = _SummaryChanges()
+    for instance in session.new:
+        if isinstance(instance, _area_model):
+            changes.add(instance.image_id, instance.tag)
+
+    for instance in session.deleted:
+        if isinstance(instance, _area_model):
+            changes.remove(instance.image_id, instance.tag)
+
+    for instance in session.dirty:
+        state = inspect(instance)
+        if isinstance(instance, _area_model) and session.is_modified(instance):
+            # An area moved to another image also changes the one it left
+            changes.remove(_old_image_id(state), _old_value(state, 'tag'))
+            changes.add(instance.image_id, instance.tag)
+        elif isinstance(instance, _image_model):
+            # A replaced image can change size, and with it the covered ratio
+            if state.attrs.width.history.has_changes() or state.attrs.height.history.has_changes():
+                changes.stale.add(instance.id)
+    return changes
+
+def _apply_flushed_changes(session, flush_context):
+    changes = _collect_changes(session)
+    if not changes.stale:
+        return
+
+    images = _image_model.__table__
+    connection = session.connection()
+
+    connection.execute(
+        images.update().where(images.c.id == bindparam('image_id')).values(
+            area_count=images.c.area_count + bindparam('delta'), covered_ratio=None
+        ),
+        [{'image_id': image_id, 'delta': changes.counts[image_id]} for image_id in sorted(changes.stale)]
+    )
+
+    # A removed tag stays as long as another area of the image has it
+    tagged = sorted(set(changes.added_tags) | set(changes.removed_tags))
+    if tagged:
+        removed = set().union(*changes.removed_tags.values())
+        present = _get_present_tags(connection, tagged, sorted(removed)) if removed else {}
+        current = dict(connection.execute(select([images.c.id, images.c.tags]).where(images.c.id.in_(tagged))).fetchall())
+
+        updates = []
+        for image_id, tags in current.items():
+            kept = (set(tags or ()) | changes.added_tags.get(image_id, set())) - (changes.removed_tags.get(image_id, set()) - present.get(image_id, set()))
+            if sorted(kept) != list(tags or ()):
+                updates.append({'image_id': image_id, 'image_tags': sorted(kept)})
+
+        if updates:
+            connection.execute(
+                images.update().where(images.c.id == bindparam('image_id')).values(tags=bindparam('image_tags')),
+                updates
+            )
+    record_bulk_change(session, _image_model)
+
+
+def track_summaries(session, image_model, area_model):
+    global _image_model, _area_model
+    _image_model = image_model
+    _area_model = area_model
+
+    event.listen(session, 'after_flush', _apply_flushed_changes)
@@ -0,0 +1,96 @@
+import os
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import event
+
+
+# Removes files in the background, in batches, so deleting rows never waits
+# on unlinking their files. Files are only queued once the transaction that
+# deleted their rows has committed.
+class FileSweeper(object):
+    def __init__(self, batch_size=500, interval=1.0):
+        self.batch_size = batch_size
+        self.interval = interval
+
+        self._pending = deque()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._sweep_lock = threading.Lock()
+
+    def init_app(self, app):
+        self.batch_size = app.config.get('FILE_SWEEPER_BATCH_SIZE', self.batch_size)
+        self.interval = app.config.get('FILE_SWEEPER_INTERVAL', self.interval)
+
+    def schedule(self, paths):
+        self._pending.extend(paths)
+        self._ensure_running()
+        self._wakeup.set()
+
+    # Removes everything pending right away, including a batch in progress
+    def sweep(self):
+        removed = 0
+        while self._pending:
+            removed += self._sweep_batch()
+        with self._sweep_lock:
+            return removed
+
+    def _sweep_batch(self):
+        with self._sweep_lock:
+            return self._remove(self._take_batch())
+
+    def _take_batch(self):
+        batch = []
+        while self._pending and len(batch) < self.batch_size:
+            batch.append(self._pending.popleft())
+        return batch
+
+    def _remove(self, paths):
+        removed = 0
+        for path in paths:
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='file-sweeper', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+
+            while self._pending:
+                self._sweep_batch()
+
+                # Yield the disk between batches
+                if self._pending:
+                    time.sleep(self.interval)
+
+
+file_sweeper = FileSweeper()
+
+
+def schedule_file_removal(session, paths):
+    session.info.setdefault('files_to_remove', []).extend(paths)
+
+def _sweep_committed_files(session):
+    paths = session.info.pop('files_to_remove', None)
+    if paths:
+        file_sweeper.schedule(paths)
+
+def _discard_files(session):
+    session.info.pop('files_to_remove', None)
+
+
+def track_file_removals(session):
+    event.listen(session, 'after_commit', _sweep_committed_files)
+    event.listen(session, 'after_rollback', _discard_files)
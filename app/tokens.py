@@ -0,0 +1,147 @@
+import datetime
+import time
+
+from flask import abort, current_app
+from sqlalchemy.orm import load_only
+
+from .cache import LRUCache
+from .model_versions import get_last_changed
+from .models import User
+
+
+class InvalidToken(Exception):
+    pass
+
+
+# The user a verified token was issued to, built from its claims. Admin
+# rights come from the is_admin claim, so checking them needs no query. The
+# User row is only loaded when a view needs more of it
+class Principal(object):
+    __slots__ = ('public_id', 'is_admin', '_user')
+
+    def __init__(self, public_id, is_admin=False):
+        self.public_id = public_id
+        self.is_admin = is_admin
+        self._user = None
+
+    @property
+    def user(self):
+        if self._user is None:
+            self._user = User.query.filter_by(public_id=self.public_id).first()
+            if self._user is None:
+                abort(401, "Invalid token")
+        return self._user
+
+    @property
+    def id(self):
+        return self.user.id
+
+
+# "2020-11:secret,2020-12:other secret" -> {'2020-11': 'secret', '2020-12': 'other secret'}
+def parse_signing_keys(value):
+    keys = {}
+    for key in filter(None, value.split(',')):
+        kid, _, secret = key.partition(':')
+        keys[kid.strip()] = secret
+    return keys
+
+def get_signing_keys():
+    if 'token_keys' not in current_app.extensions:
+        keys = parse_signing_keys(current_app.config.get('TOKEN_SIGNING_KEYS') or '')
+
+        # Tokens without a kid were signed with SECRET_KEY before keys could be
+        # rotated. Once keys are configured they are only accepted if asked
+        # for, so SECRET_KEY can be retired
+        legacy_key = None
+        if not keys or current_app.config.get('TOKEN_ACCEPT_LEGACY'):
+            legacy_key = current_app.config['SECRET_KEY']
+        if not keys:
+            keys = {'default': current_app.config['SECRET_KEY']}
+
+        signing_kid = current_app.config.get('TOKEN_SIGNING_KID') or list(keys)[-1]
+        current_app.extensions['token_keys'] = (keys, signing_kid, legacy_key)
+    return current_app.extensions['token_keys']
+
+def get_verification_cache():
+    if 'token_cache' not in current_app.extensions:
+        current_app.extensions['token_cache'] = LRUCache(max_size=current_app.config.get('TOKEN_CACHE_SIZE', 10000))
+    return current_app.extensions['token_cache']
+
+
+def create_token(user):
+    import jwt
+
+    keys, kid, _ = get_signing_keys()
+    return jwt.encode(
+        {
+            "public_id": user.public_id,
+            "is_admin": user.is_admin,
+            # Not rounded to the second, see refresh_claims
+            "iat": time.time(),
+            "exp": datetime.datetime.utcnow() + datetime.timedelta(
+                minutes=current_app.config["TOKEN_EXPIERY_IN_MINUTES"]
+            ),
+        },
+        keys[kid],
+        algorithm='HS256',
+        headers={'kid': kid}
+    )
+
+def decode_token(token):
+    import jwt
+
+    keys, _, legacy_key = get_signing_keys()
+    try:
+        kid = jwt.get_unverified_header(token).get('kid')
+    except jwt.InvalidTokenError:
+        raise InvalidToken("Invalid token")
+
+    if kid is not None and not isinstance(kid, str):
+        raise InvalidToken("Invalid token")
+
+    key = keys.get(kid) if kid is not None else legacy_key
+    if key is None:
+        raise InvalidToken("Invalid token")  # Signed with a key that has been rotated out
+
+    try:
+        return jwt.decode(token, key, algorithms=['HS256'])
+    except jwt.ExpiredSignatureError:
+        raise InvalidToken("Token expired")
+    except jwt.InvalidTokenError:
+        raise InvalidToken("Invalid token")
+
+# Signature and expiry are checked once per token, later requests with the
+# same token only check that it has not expired since
+def verify_token(token):
+    cache = get_verification_cache()
+
+    cached = cache.get(token)
+    if cached is None:
+        decoded = decode_token(token)
+        # Tokens from before the is_admin claim are checked against the row right away
+        claims = (decoded['public_id'], decoded['exp'], decoded.get('is_admin', False), decoded.get('iat', 0))
+    elif cached[1] <= time.time():
+        raise InvalidToken("Token expired")
+    else:
+        claims = cached
+
+    claims = refresh_claims(claims)
+    if claims is not cached:
+        cache.set(token, claims)
+    return Principal(claims[0], claims[2])
+
+# The is_admin claim can go stale when the user is demoted or deleted. It is
+# checked against the User row once it is TOKEN_CLAIMS_MAX_AGE seconds old,
+# and right away after this process has written to the users
+def refresh_claims(claims):
+    public_id, exp, is_admin, checked_at = claims
+
+    now = time.time()
+    max_age = current_app.config.get('TOKEN_CLAIMS_MAX_AGE', 60)
+    if now - checked_at <= max_age and get_last_changed([User]) < checked_at:
+        return claims
+
+    user = User.query.options(load_only('is_admin')).filter_by(public_id=public_id).first()
+    if user is None:
+        raise InvalidToken("Invalid token")
+    return (public_id, exp, user.is_admin, now)
@@ -0,0 +1,154 @@
+import io
+import re
+
+
+PAD_MODES = {
+    'constant': 'constant',
+    'reflect': 'reflect',
+    'edge': 'edge'
+}
+FLIPS = ('h', 'v', 'hv')
+NORMALIZATIONS = {
+    'unit': (None, None),
+    'imagenet': ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225))
+}
+OUTPUT_FORMATS = ('png', 'npy')
+
+RESIZE_PATTERN = re.compile(r'^(\d+)x(\d+)$')
+
+
+class CropTransform(object):
+    __slots__ = ('resize', 'pad', 'flip', 'context', 'normalize', 'format')
+
+    def __init__(self, resize=None, pad='constant', flip=None, context=0.0, normalize=None, format='png'):
+        self.resize = resize
+        self.pad = pad
+        self.flip = flip
+        self.context = context
+        self.normalize = normalize
+        self.format = format
+
+    @classmethod
+    def from_args(cls, args):
+        transform = cls()
+
+        resize = args.get('resize')
+        if resize is not None:
+            match = RESIZE_PATTERN.match(resize)
+            if not match or not 0 < int(match.group(1)) <= 4096 or not 0 < int(match.group(2)) <= 4096:
+                raise ValueError('resize must be WIDTHxHEIGHT, between 1x1 and 4096x4096')
+            transform.resize = (int(match.group(1)), int(match.group(2)))
+
+        transform.pad = args.get('pad', transform.pad)
+        if transform.pad not in PAD_MODES:
+            raise ValueError(f'pad must be one of {list(PAD_MODES)}')
+
+        transform.flip = args.get('flip')
+        if transform.flip is not None and transform.flip not in FLIPS:
+            raise ValueError(f'flip must be one of {list(FLIPS)}')
+
+        context = args.get('context')
+        if context is not None:
+            try:
+                transform.context = float(context)
+            except ValueError:
+                raise ValueError('context must be a number')
+            if not 0 <= transform.context <= 1:
+                raise ValueError('context must be between 0 and 1')
+
+        transform.normalize = args.get('normalize')
+        if transform.normalize is not None and transform.normalize not in NORMALIZATIONS:
+            raise ValueError(f'normalize must be one of {list(NORMALIZATIONS)}')
+
+        transform.format = args.get('format', 'npy' if transform.normalize else 'png')
+        if transform.format not in OUTPUT_FORMATS:
+            raise ValueError(f'format must be one of {list(OUTPUT_FORMATS)}')
+        if transform.normalize and transform.format != 'npy':
+            raise ValueError('Normalized crops are floats and can only be returned as npy')
+
+        return transform
+
+    # Equal transforms have equal signatures, however they were written in the URL
+    def signature(self):
+        return (
+            f'resize={self.resize[0]}x{self.resize[1]}' if self.resize else '',
+            f'pad={self.pad}',
+            f'flip={self.flip or ""}',
+            f'context={self.context:g}',
+            f'normalize={self.normalize or ""}',
+            f'format={self.format}'
+        )
+
+    def is_identity(self):
+        return not (self.resize or self.flip or self.context or self.normalize) and self.format == 'png'
+
+    @property
+    def mimetype(self):
+        return 'image/png' if self.format == 'png' else 'application/octet-stream'
+
+
+def expand_box(box, context):
+    left, top, right, bottom = box
+    dx = round((right - left) * context)
+    dy = round((bottom - top) * context)
+    return left - dx, top - dy, right + dx, bottom + dy
+
+def crop_padded(image, box, pad):
+    import numpy as np
+
+    left, top, right, bottom = box
+    width, height = image.size
+
+    # Only the part inside the image is decoded into the array, the rest is padding
+    inside = (max(left, 0), max(top, 0), min(right, width), min(bottom, height))
+    pixels = np.asarray(image.crop(inside))
+
+    padding = [
+        (inside[1] - top, bottom - inside[3]),
+        (inside[0] - left, right - inside[2])
+    ] + [(0, 0)] * (pixels.ndim - 2)
+    if not any(before or after for before, after in padding):
+        return pixels
+
+    # reflect needs more than one pixel to mirror
+    mode = PAD_MODES[pad]
+    if mode == 'reflect' and min(pixels.shape[:2]) < 2:
+        mode = 'edge'
+    return np.pad(pixels, padding, mode=mode)
+
+def render_crop(image, box, transform):
+    import numpy as np
+    from PIL import Image as PILImage
+
+    if transform.is_identity():
+        stream = io.BytesIO()
+        image.crop(box).save(stream, format='PNG')
+        return stream.getvalue()
+
+    if image.mode not in ('L', 'RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or image.mode == 'P' else 'RGB')
+    if transform.normalize == 'imagenet' and image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    pixels = crop_padded(image, expand_box(box, transform.context), transform.pad)
+
+    if transform.flip in ('h', 'hv'):
+        pixels = pixels[:, ::-1]
+    if transform.flip in ('v', 'hv'):
+        pixels = pixels[::-1]
+
+    if transform.resize and transform.resize != (pixels.shape[1], pixels.shape[0]):
+        pixels = np.asarray(PILImage.fromarray(np.ascontiguousarray(pixels)).resize(transform.resize, PILImage.BILINEAR))
+
+    if transform.normalize:
+        mean, std = NORMALIZATIONS[transform.normalize]
+        pixels = pixels.astype(np.float32) / 255
+        if mean is not None:
+            pixels = (pixels - np.array(mean, dtype=np.float32)) / np.array(std, dtype=np.float32)
+
+    stream = io.BytesIO()
+    if transform.format == 'npy':
+        np.save(stream, np.ascontiguousarray(pixels), allow_pickle=False)
+    else:
+        PILImage.fromarray(np.ascontiguousarray(pixels)).save(stream, format='PNG')
+    return stream.getvalue()
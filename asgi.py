@@ -0,0 +1,7 @@
+from app import create_app
+from app.asgi import create_asgi_app
+from config import DevelopmentConfig
+
+
+# Serve with an ASGI server, e.g: uvicorn asgi:application
+application = create_asgi_app(create_app(DevelopmentConfig))
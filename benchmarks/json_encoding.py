@@ -0,0 +1,76 @@
+# Times the encoding of a full /classified_areas page with every JSON encoder
+# backend, with the settings of production ( compact, unsorted ) and of
+# debugging ( sorted, indented ).
+#
+#   python benchmarks/json_encoding.py [--items 720] [--repeat 200]
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import json
+
+from app import create_app
+from app.json_encoding import BACKENDS, orjson
+from config import TestConfig
+
+
+def make_page(items):
+    return {
+        'items': [
+            {
+                'x_position': index % 97,
+                'y_position': index % 89,
+                'width': 32,
+                'height': 24,
+                'tag': 'dog' if index % 3 else None,
+                'public_id': f'{index:032x}',
+                'training_image': f'{index // 20:032x}',
+                '_links': {
+                    'self': f'/classified_areas/{index:032x}',
+                    'training_image': f'/training_images/{index // 20:032x}',
+                    'training_image_cropped': f'/classified_areas/{index:032x}/training_image_cropped'
+                }
+            }
+            for index in range(items)
+        ],
+        '_meta': {'page': 1, 'per_page': items, 'total_pages': 10, 'total_items': items * 10},
+        '_links': {'self': '/classified_areas?page=1', 'next_page': '/classified_areas?page=2', 'prev_page': None}
+    }
+
+def time_encoding(app, page, repeat, sort_keys, indent):
+    with app.app_context():
+        # The separators jsonify uses
+        separators = (', ', ': ') if indent else (',', ':')
+        json.dumps(page, sort_keys=sort_keys, indent=indent, separators=separators)
+
+        started = time.perf_counter()
+        for _ in range(repeat):
+            body = json.dumps(page, sort_keys=sort_keys, indent=indent, separators=separators)
+        return (time.perf_counter() - started) / repeat * 1000, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=720)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    page = make_page(args.items)
+    print(f'{"backend":<10} {"settings":<22} {"ms/page":>8} {"bytes":>9}')
+
+    for backend in BACKENDS:
+        if backend == 'orjson' and orjson is None:
+            print(f'{backend:<10} not installed')
+            continue
+
+        app = create_app(type('BenchmarkConfig', (TestConfig,), {'JSON_ENCODER_BACKEND': backend}))
+        for settings, sort_keys, indent in (('compact, unsorted', False, None), ('sorted, indented', True, 2)):
+            milliseconds, size = time_encoding(app, page, args.repeat, sort_keys, indent)
+            print(f'{backend:<10} {settings:<22} {milliseconds:>8.2f} {size:>9}')
+
+
+if __name__ == '__main__':
+    main()
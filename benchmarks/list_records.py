@@ -0,0 +1,92 @@
+# Loads and serializes a full /classified_areas page as ORM instances ( what
+# the list endpoints did before ) and as the projected records they page
+# through now, and reports the time per page and the memory the loaded page
+# keeps alive.
+#
+#   python benchmarks/list_records.py [--items 720] [--repeat 50] [--fields training_image,tag] [--no-links]
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.models import ClassifiedArea, TrainingImage, User
+from config import TestConfig
+
+
+def fill_database(items):
+    user = User(email='benchmark@test.com', password='benchmark')
+    db.session.add(user)
+    db.session.flush()
+
+    db.session.bulk_insert_mappings(TrainingImage, [
+        {'public_id': f'{index:032x}', 'user_id': user.id, 'width': 640, 'height': 480} for index in range(max(1, items // 20))
+    ])
+    images = TrainingImage.query.order_by(TrainingImage.id).all()
+
+    db.session.bulk_insert_mappings(ClassifiedArea, [
+        {
+            'public_id': f'{index:032x}', 'image_id': images[index // 20].id, 'tag': 'dog' if index % 3 else None,
+            'x_position': index % 97, 'y_position': index % 89, 'width': 32, 'height': 24
+        }
+        for index in range(items)
+    ])
+    db.session.commit()
+
+def load_instances(items, fields, include_links):
+    page = ClassifiedArea.query.options(*ClassifiedArea.query_options_for_fields(fields, include_links)).limit(items).all()
+    return page, [area.to_dict(fields=fields, include_links=include_links) for area in page]
+
+def load_records(items, fields, include_links):
+    page = ClassifiedArea.project_query(ClassifiedArea.query, fields, include_links).limit(items).all()
+    return page, [record.to_dict(fields=fields, include_links=include_links) for record in page]
+
+def measure(load, items, repeat, fields, include_links):
+    load(items, fields, include_links)
+    db.session.expunge_all()
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        load(items, fields, include_links)
+        db.session.expunge_all()
+    milliseconds = (time.perf_counter() - started) / repeat * 1000
+
+    # What the loaded page keeps alive until the response is sent
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    page = load(items, fields, include_links)
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    del page
+    db.session.expunge_all()
+    return milliseconds, retained
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=720)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--fields', help='Comma separated fields, every field by default')
+    parser.add_argument('--no-links', action='store_true')
+    args = parser.parse_args()
+
+    fields = args.fields.split(',') if args.fields else None
+    app = create_app(TestConfig)
+    with app.test_request_context():
+        db.create_all()
+        fill_database(args.items)
+
+        print(f'{"page of":<12} {"ms/page":>8} {"retained KB":>12}')
+        for name, load in (('instances', load_instances), ('records', load_records)):
+            milliseconds, retained = measure(load, args.items, args.repeat, fields, not args.no_links)
+            print(f'{name:<12} {milliseconds:>8.2f} {retained / 1024:>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,279 @@
+# Replays a mix of traffic against a running server with concurrent virtual
+# users. Every user signs up, logs in through /login and uses its own token,
+# then picks actions from the mix until the run is over. Users are started
+# evenly over the ramp, so the report shows where throughput stops growing
+# with the number of users and latency starts to climb.
+#
+#   flask run --port 8000   ( or gunicorn / uvicorn, with the settings to test )
+#
+#   python benchmarks/load_test.py --url http://localhost:8000 --users 50 --ramp 60 --seconds 120
+#   python benchmarks/load_test.py --mix "login=1,areas=2,paginate=5,crop=10" --csv load.csv
+#
+# Every --interval seconds a line per endpoint is printed: requests per second,
+# latency percentiles and the share of errors. Rate limited ( 429 ) and shed
+# ( 503 ) responses are counted apart from other errors.
+import argparse
+import base64
+import csv
+import os
+import random
+import secrets
+import threading
+import time
+from collections import defaultdict
+
+import requests
+from PIL import Image
+
+
+TEST_IMAGE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'TEST_IMAGE.png')
+
+MIXES = {
+    # Mostly reads: browsing lists, deep into them, and looking at crops
+    'browse': 'login=1,paginate=6,images=3,crop=10',
+    # Annotators: bursts of new areas between reads
+    'annotate': 'login=1,areas=4,paginate=3,crop=4',
+    'production': 'login=1,areas=2,paginate=5,images=2,crop=8'
+}
+
+TRANSFORMS = ['', '?resize=64x64', '?resize=224x224&context=0.2', '?flip=h', '?resize=32x32&normalize=unit']
+
+
+# "login=1,crop=10" -> {'login': 1.0, 'crop': 10.0}
+def parse_mix(value):
+    mix = {}
+    for action in filter(None, MIXES.get(value, value).split(',')):
+        name, _, weight = action.partition('=')
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+class Stats(object):
+    # Latencies per endpoint and interval, shared by every virtual user
+    def __init__(self, interval):
+        self.interval = interval
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self._windows = defaultdict(lambda: defaultdict(list))
+        self.active_users = 0
+
+    def user_started(self):
+        with self._lock:
+            self.active_users += 1
+
+    def user_finished(self):
+        with self._lock:
+            self.active_users -= 1
+
+    def record(self, endpoint, latency, status):
+        window = int((time.monotonic() - self.started) // self.interval)
+        with self._lock:
+            self._windows[window][endpoint].append((latency, status))
+
+    def take_window(self, window):
+        with self._lock:
+            return self._windows.pop(window, {})
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def summarize(samples, seconds):
+    latencies = sorted(latency for latency, _ in samples)
+    limited = sum(1 for _, status in samples if status in (429, 503))
+    errors = sum(1 for _, status in samples if status is None or (status >= 400 and status not in (429, 503)))
+    return {
+        'requests': len(samples),
+        'rps': len(samples) / seconds,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p90_ms': percentile(latencies, 0.9) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'error_rate': errors / len(samples),
+        'limited_rate': limited / len(samples)
+    }
+
+
+class VirtualUser(object):
+    def __init__(self, url, stats, mix, think, image_bytes, image_size):
+        self.url = url
+        self.stats = stats
+        self.actions = list(mix)
+        self.weights = [mix[action] for action in self.actions]
+        self.think = think
+        self.image_bytes = image_bytes
+        self.image_size = image_size
+
+        self.session = requests.Session()
+        self.email = f'load{secrets.token_hex(8)}@test.com'
+        self.password = secrets.token_hex(8)
+        self.images = []
+        self.crop_urls = []
+        self.total_pages = {}
+
+    def request(self, endpoint, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.url + path, timeout=30, **kwargs)
+        except requests.RequestException:
+            self.stats.record(endpoint, time.perf_counter() - start, None)
+            return None
+
+        self.stats.record(endpoint, time.perf_counter() - start, response.status_code)
+        return response
+
+    def login(self):
+        credentials = base64.b64encode(f'{self.email}:{self.password}'.encode('utf-8')).decode('utf-8')
+        response = self.request('GET /login', 'GET', '/login', headers={'Authorization': f'Basic {credentials}'})
+        if response is not None and response.status_code == 200:
+            self.session.headers['x-access-token'] = response.json()['x-access-token']
+
+    def set_up(self):
+        self.request('POST /users', 'POST', '/users', json={'email': self.email, 'password': self.password})
+        self.login()
+
+        response = self.request('POST /training_images', 'POST', '/training_images', files={'image': ('load.png', self.image_bytes, 'image/png')})
+        if response is not None and response.status_code == 201:
+            self.images.append(response.json()['public_id'])
+        self.create_areas()
+
+    def create_areas(self):
+        if not self.images:
+            return
+
+        # Annotators save in bursts: a bulk request or a few single ones in a row
+        image = random.choice(self.images)
+        width, height = self.image_size[0] // 4, self.image_size[1] // 4
+        if random.random() < 0.5:
+            areas = [
+                {
+                    'training_image': image, 'x_position': random.randrange(width * 3), 'y_position': random.randrange(height * 3),
+                    'width': width, 'height': height, 'tag': random.choice(['car', 'dog', None])
+                }
+                for _ in range(random.randint(5, 50))
+            ]
+            response = self.request('POST /classified_areas/bulk', 'POST', '/classified_areas/bulk', json=areas)
+            if response is not None and response.status_code == 201:
+                self.crop_urls.extend(f"{item['_links']['self']}/training_image_cropped" for item in response.json()['items'][:5])
+        else:
+            for _ in range(random.randint(2, 5)):
+                response = self.request('POST /classified_areas', 'POST', '/classified_areas', json={
+                    'training_image': image, 'x_position': random.randrange(width * 3), 'y_position': random.randrange(height * 3),
+                    'width': width, 'height': height
+                })
+                if response is not None and response.status_code == 201:
+                    self.crop_urls.append(response.json()['_links']['training_image_cropped'])
+
+        del self.crop_urls[:-50]
+
+    def paginate(self, collection='classified_areas'):
+        # Deep pages, anywhere in the collection, not just the first one
+        page = random.randint(1, self.total_pages.get(collection, 1))
+        response = self.request(f'GET /{collection}', 'GET', f'/{collection}?page={page}')
+        if response is not None and response.status_code == 200:
+            self.total_pages[collection] = max(1, response.json()['_meta']['total_pages'])
+
+    def crop(self):
+        if self.crop_urls:
+            self.request('GET crop', 'GET', random.choice(self.crop_urls) + random.choice(TRANSFORMS))
+
+    def act(self, action):
+        if action == 'login':
+            self.login()
+        elif action == 'areas':
+            self.create_areas()
+        elif action == 'paginate':
+            self.paginate()
+        elif action == 'images':
+            self.paginate('training_images')
+        elif action == 'crop':
+            self.crop()
+
+    def run(self, deadline):
+        self.set_up()
+        while time.monotonic() < deadline:
+            self.act(random.choices(self.actions, self.weights)[0])
+            if self.think:
+                time.sleep(random.expovariate(1 / self.think))
+
+
+def run_user(user, stats, deadline):
+    stats.user_started()
+    try:
+        user.run(deadline)
+    finally:
+        stats.user_finished()
+
+def report(stats, window, writer):
+    samples = stats.take_window(window)
+    elapsed = (window + 1) * stats.interval
+    print(f'--- {elapsed:6.0f}s  users {stats.active_users}')
+
+    for endpoint in sorted(samples):
+        summary = summarize(samples[endpoint], stats.interval)
+        print(
+            f'{endpoint:32} {summary["rps"]:8.1f} req/s  p50 {summary["p50_ms"]:7.1f}  p90 {summary["p90_ms"]:7.1f}  '
+            f'p99 {summary["p99_ms"]:7.1f} ms  errors {summary["error_rate"]:6.1%}  limited {summary["limited_rate"]:6.1%}'
+        )
+        if writer is not None:
+            writer.writerow(dict(summary, time=elapsed, users=stats.active_users, endpoint=endpoint))
+
+
+def main(arguments):
+    mix = parse_mix(arguments.mix)
+    unknown = set(mix) - {'login', 'areas', 'paginate', 'images', 'crop'}
+    if unknown:
+        raise SystemExit(f'Unknown actions {sorted(unknown)}')
+
+    with open(arguments.image, 'rb') as file:
+        image_bytes = file.read()
+    with Image.open(arguments.image) as image:
+        image_size = image.size
+
+    stats = Stats(arguments.interval)
+    deadline = time.monotonic() + arguments.seconds
+
+    csv_file = open(arguments.csv, 'w', newline='') if arguments.csv else None
+    writer = None
+    if csv_file is not None:
+        writer = csv.DictWriter(csv_file, ['time', 'users', 'endpoint', 'requests', 'rps', 'p50_ms', 'p90_ms', 'p99_ms', 'error_rate', 'limited_rate'])
+        writer.writeheader()
+
+    threads = []
+    for index in range(arguments.users):
+        user = VirtualUser(arguments.url.rstrip('/'), stats, mix, arguments.think, image_bytes, image_size)
+        thread = threading.Thread(target=run_user, args=(user, stats, deadline), daemon=True)
+        # Users join evenly over the ramp
+        start_at = stats.started + arguments.ramp * index / arguments.users
+        threads.append((start_at, thread))
+
+    window = 0
+    while time.monotonic() < deadline or any(thread.is_alive() for _, thread in threads):
+        now = time.monotonic()
+        for start_at, thread in threads:
+            if start_at <= now and thread.ident is None:
+                thread.start()
+
+        window_end = stats.started + (window + 1) * stats.interval
+        if now >= window_end:
+            report(stats, window, writer)
+            window += 1
+        time.sleep(0.05)
+
+    report(stats, window, writer)
+    if csv_file is not None:
+        csv_file.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay a mix of traffic with concurrent virtual users')
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--mix', default='production', help=f'One of {list(MIXES)} or weights like "login=1,areas=2,paginate=5,images=2,crop=8"')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--ramp', type=float, default=30, help='Seconds over which the users are started')
+    parser.add_argument('--seconds', type=float, default=60)
+    parser.add_argument('--think', type=float, default=0.5, help='Mean pause between the actions of a user, in seconds')
+    parser.add_argument('--interval', type=float, default=5, help='Seconds per report line')
+    parser.add_argument('--image', default=TEST_IMAGE_PATH)
+    parser.add_argument('--csv', help='Also write the report to this file')
+
+    main(parser.parse_args())
@@ -0,0 +1,122 @@
+# Opens a number of slow clients against a running server and measures how
+# long ordinary requests take while they are connected. Run it once against
+# a thread/worker based WSGI server and once against the ASGI gateway:
+#
+#   gunicorn --workers 1 --threads 8 "app:create_app()"
+#   uvicorn asgi:application --port 8000
+#
+#   python benchmarks/slow_clients.py --url http://localhost:8000 --slow-clients 32
+#
+# With the WSGI server the probe requests time out once every thread is held
+# by a slow client. Behind the gateway the slow clients are only waited on by
+# the event loop and the probes keep their normal latency.
+import argparse
+import asyncio
+import statistics
+import time
+from urllib.parse import urlparse
+
+
+async def slow_upload(host, port, path, body_size, seconds):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write((
+        f'POST {path} HTTP/1.1\r\n'
+        f'Host: {host}\r\n'
+        'Content-Type: application/octet-stream\r\n'
+        f'Content-Length: {body_size}\r\n'
+        '\r\n'
+    ).encode('latin-1'))
+
+    # Trickle the body so the upload lasts for the whole run
+    interval = seconds / body_size
+    for _ in range(body_size):
+        writer.write(b'0')
+        await writer.drain()
+        await asyncio.sleep(interval)
+
+    await reader.read(1)
+    writer.close()
+
+async def slow_download(host, port, path, seconds):
+    reader, writer = await asyncio.open_connection(host, port, limit=1)
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n'.encode('latin-1'))
+    await writer.drain()
+
+    # Read one byte at a time so the response is sent as slowly as possible
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        if not await reader.read(1):
+            break
+        await asyncio.sleep(0.05)
+
+    writer.close()
+
+async def probe(host, port, path, timeout):
+    start = time.perf_counter()
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n'.encode('latin-1'))
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        writer.close()
+    except (asyncio.TimeoutError, OSError):
+        return None
+
+    if not status_line:
+        return None
+    return time.perf_counter() - start
+
+async def main(arguments):
+    url = urlparse(arguments.url)
+    host, port = url.hostname, url.port or 80
+
+    if arguments.mode == 'upload':
+        slow_clients = [
+            slow_upload(host, port, arguments.upload_path, arguments.body_size, arguments.seconds)
+            for _ in range(arguments.slow_clients)
+        ]
+    else:
+        slow_clients = [
+            slow_download(host, port, arguments.download_path, arguments.seconds)
+            for _ in range(arguments.slow_clients)
+        ]
+    slow_tasks = [asyncio.ensure_future(client) for client in slow_clients]
+
+    # Give the slow clients time to take their connections
+    await asyncio.sleep(1)
+
+    latencies = []
+    failures = 0
+    deadline = time.monotonic() + arguments.seconds - 1
+    while time.monotonic() < deadline:
+        latency = await probe(host, port, arguments.probe_path, arguments.timeout)
+        if latency is None:
+            failures += 1
+        else:
+            latencies.append(latency)
+        await asyncio.sleep(arguments.probe_interval)
+
+    for task in slow_tasks:
+        task.cancel()
+    await asyncio.gather(*slow_tasks, return_exceptions=True)
+
+    print(f'{arguments.slow_clients} slow {arguments.mode} clients against {arguments.url}')
+    print(f'probes: {len(latencies) + failures}, timed out: {failures}')
+    if latencies:
+        print(f'probe latency ms: median {statistics.median(latencies) * 1000:.1f}, max {max(latencies) * 1000:.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure request latency while slow clients hold connections')
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--mode', choices=['upload', 'download'], default='upload')
+    parser.add_argument('--slow-clients', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--body-size', type=int, default=200)
+    parser.add_argument('--upload-path', default='/training_images')
+    parser.add_argument('--download-path', default='/users')
+    parser.add_argument('--probe-path', default='/users')
+    parser.add_argument('--probe-interval', type=float, default=0.25)
+    parser.add_argument('--timeout', type=float, default=2)
+
+    asyncio.run(main(parser.parse_args()))
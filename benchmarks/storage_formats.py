@@ -0,0 +1,88 @@
+# Compares the storage format policies of TRAINING_IMAGES_STORAGE_FORMAT on a
+# set of images: time to ingest (decode + encode), bytes on disk and the time
+# to decode crops from the stored file.
+#
+#   python benchmarks/storage_formats.py path/to/images [--crops 20]
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.images import STORAGE_POLICIES, encode_for_storage, open_image
+
+
+POLICY_CONFIGS = [
+    ('png (level 1)', {'TRAINING_IMAGES_STORAGE_FORMAT': 'png', 'TRAINING_IMAGES_PNG_COMPRESS_LEVEL': 1}),
+    ('png (level 6)', {'TRAINING_IMAGES_STORAGE_FORMAT': 'png', 'TRAINING_IMAGES_PNG_COMPRESS_LEVEL': 6}),
+    ('png (level 9)', {'TRAINING_IMAGES_STORAGE_FORMAT': 'png', 'TRAINING_IMAGES_PNG_COMPRESS_LEVEL': 9}),
+    ('original', {'TRAINING_IMAGES_STORAGE_FORMAT': 'original'}),
+    ('webp-lossless', {'TRAINING_IMAGES_STORAGE_FORMAT': 'webp-lossless'}),
+    ('raw', {'TRAINING_IMAGES_STORAGE_FORMAT': 'raw'}),
+]
+
+
+def load_sources(paths):
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            sources.extend(load_sources(os.path.join(path, name) for name in sorted(os.listdir(path))))
+            continue
+
+        with open(path, 'rb') as file:
+            sources.append(file.read())
+    return sources
+
+def benchmark_policy(config, sources, crops, rng):
+    ingest_seconds = 0
+    stored_bytes = 0
+    crop_seconds = 0
+
+    for source in sources:
+        start = time.perf_counter()
+        image = open_image(source)
+        image.load()
+        stored, _ = encode_for_storage(image, source, config)
+        ingest_seconds += time.perf_counter() - start
+
+        stored_bytes += len(stored)
+
+        width, height = image.size
+        for _ in range(crops):
+            x, y = rng.randrange(width), rng.randrange(height)
+            box = (x, y, rng.randint(x + 1, width), rng.randint(y + 1, height))
+
+            start = time.perf_counter()
+            open_image(stored).crop(box).load()
+            crop_seconds += time.perf_counter() - start
+
+    return ingest_seconds, stored_bytes, crop_seconds
+
+
+def main(arguments):
+    sources = load_sources(arguments.paths)
+    source_bytes = sum(len(source) for source in sources)
+    print(f'{len(sources)} images, {source_bytes / 1024:.1f} KiB uploaded, {arguments.crops} crops per image\n')
+
+    print(f'{"policy":<16}{"ingest ms/img":>15}{"disk KiB":>12}{"vs upload":>11}{"crop ms":>10}')
+    for name, config in POLICY_CONFIGS:
+        try:
+            ingest, stored, crop = benchmark_policy(config, sources, arguments.crops, random.Random(0))
+        except RuntimeError as e:
+            print(f'{name:<16}{"skipped: " + str(e)}')
+            continue
+
+        print(
+            f'{name:<16}{ingest * 1000 / len(sources):>15.2f}{stored / 1024:>12.1f}'
+            f'{stored / source_bytes:>10.2f}x{crop * 1000 / (len(sources) * arguments.crops):>10.3f}'
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=f'Benchmark the image storage policies {STORAGE_POLICIES}')
+    parser.add_argument('paths', nargs='+', help='Image files or directories of images')
+    parser.add_argument('--crops', type=int, default=20)
+
+    main(parser.parse_args())
@@ -12,12 +12,91 @@ class DevelopmentConfig(object):
     
     TRAINING_IMAGES_UPLOAD_URL = os.environ.get('TRAINING_IMAGES_UPLOAD_URL') or '/static/training_images'
     TRAINING_IMAGES_UPLOAD_FOLDER = os.environ.get('TRAINING_IMAGES_UPLOAD_FOLDER') or 'training_images'
+    # png, original ( keep uploads already in TRAINING_IMAGES_ORIGINAL_FORMATS ), webp-lossless or raw ( uncompressed TIFF )
+    TRAINING_IMAGES_STORAGE_FORMAT = os.environ.get('TRAINING_IMAGES_STORAGE_FORMAT') or 'png'
+    TRAINING_IMAGES_PNG_COMPRESS_LEVEL = int(os.environ.get('TRAINING_IMAGES_PNG_COMPRESS_LEVEL')) if os.environ.get('TRAINING_IMAGES_PNG_COMPRESS_LEVEL') else 6
+    TRAINING_IMAGES_ORIGINAL_FORMATS = os.environ.get('TRAINING_IMAGES_ORIGINAL_FORMATS').split(',') if os.environ.get('TRAINING_IMAGES_ORIGINAL_FORMATS') else ['PNG', 'JPEG', 'WEBP']
+    TRAINING_IMAGES_ACCEL_REDIRECT_PREFIX = os.environ.get('TRAINING_IMAGES_ACCEL_REDIRECT_PREFIX')
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', '').lower() in ('1', 'true', 'yes')
+    
+    BULK_UPLOAD_WORKERS = int(os.environ.get('BULK_UPLOAD_WORKERS')) if os.environ.get('BULK_UPLOAD_WORKERS') else os.cpu_count()
+    BULK_UPLOAD_BATCH_SIZE = int(os.environ.get('BULK_UPLOAD_BATCH_SIZE')) if os.environ.get('BULK_UPLOAD_BATCH_SIZE') else 200
+    BULK_UPLOAD_MAX_FILES = int(os.environ.get('BULK_UPLOAD_MAX_FILES')) if os.environ.get('BULK_UPLOAD_MAX_FILES') else 10000
+    BULK_UPLOAD_MAX_ENTRY_SIZE = int(os.environ.get('BULK_UPLOAD_MAX_ENTRY_SIZE')) if os.environ.get('BULK_UPLOAD_MAX_ENTRY_SIZE') else 64 * 1024 * 1024
     
     SECRET_KEY = os.environ.get('SECRET_KEY') or "TEMPORARY"
 
     TOKEN_EXPIERY_IN_MINUTES = int(os.environ.get('TOKEN_EXPIERY_IN_MINUTES')) if os.environ.get('TOKEN_EXPIERY_IN_MINUTES') else 12 * 60
+    # "kid:secret,..." tokens are signed with TOKEN_SIGNING_KID ( or the last key ), without keys SECRET_KEY is used
+    TOKEN_SIGNING_KEYS = os.environ.get('TOKEN_SIGNING_KEYS') or ''
+    TOKEN_SIGNING_KID = os.environ.get('TOKEN_SIGNING_KID') or None
+    # Also accept tokens without a kid ( signed with SECRET_KEY ) while TOKEN_SIGNING_KEYS is set
+    TOKEN_ACCEPT_LEGACY = os.environ.get('TOKEN_ACCEPT_LEGACY', '').lower() in ('1', 'true', 'yes')
+    # Seconds a token's is_admin claim is trusted before it is checked against the user again
+    TOKEN_CLAIMS_MAX_AGE = int(os.environ.get('TOKEN_CLAIMS_MAX_AGE')) if os.environ.get('TOKEN_CLAIMS_MAX_AGE') else 60
+    TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE')) if os.environ.get('TOKEN_CACHE_SIZE') else 10000
     ITEMS_PER_PAGE = int(os.environ.get('ITEMS_PER_PAGE')) if os.environ.get('ITEMS_PER_PAGE') else 12 * 60
 
+    BULK_AREAS_MAX = int(os.environ.get('BULK_AREAS_MAX')) if os.environ.get('BULK_AREAS_MAX') else 10000
+
+    SAMPLE_MAX_SIZE = int(os.environ.get('SAMPLE_MAX_SIZE')) if os.environ.get('SAMPLE_MAX_SIZE') else 1000
+    # Areas next to each other in random_key order always come out together,
+    # runs longer than 1 trade independence for fewer queries
+    SAMPLE_RUN_SIZE = int(os.environ.get('SAMPLE_RUN_SIZE')) if os.environ.get('SAMPLE_RUN_SIZE') else 1
+
+    CHANGE_FEED_MAX_LIMIT = int(os.environ.get('CHANGE_FEED_MAX_LIMIT')) if os.environ.get('CHANGE_FEED_MAX_LIMIT') else 10000
+    CHANGE_FEED_SETTLE_SECONDS = int(os.environ.get('CHANGE_FEED_SETTLE_SECONDS')) if os.environ.get('CHANGE_FEED_SETTLE_SECONDS') else 0
+    CHANGE_FEED_POLL_INTERVAL = float(os.environ.get('CHANGE_FEED_POLL_INTERVAL')) if os.environ.get('CHANGE_FEED_POLL_INTERVAL') else 1.0
+    CHANGE_FEED_STREAM_SECONDS = int(os.environ.get('CHANGE_FEED_STREAM_SECONDS')) if os.environ.get('CHANGE_FEED_STREAM_SECONDS') else 300
+    # Open streams each hold a worker thread, keep this well below ASGI_WORKER_THREADS ( or the server's threads )
+    CHANGE_FEED_MAX_STREAMS = int(os.environ.get('CHANGE_FEED_MAX_STREAMS')) if os.environ.get('CHANGE_FEED_MAX_STREAMS') else 4
+
+    CROP_CACHE_SIZE = int(os.environ.get('CROP_CACHE_SIZE')) if os.environ.get('CROP_CACHE_SIZE') else 256
+    CROP_CACHE_TTL = int(os.environ.get('CROP_CACHE_TTL')) if os.environ.get('CROP_CACHE_TTL') else 600
+    CROP_CACHE_BYTES = int(os.environ.get('CROP_CACHE_BYTES')) if os.environ.get('CROP_CACHE_BYTES') else 64 * 1024 * 1024
+    # Crops larger than this are rendered every time instead of being cached
+    CROP_CACHE_MAX_ITEM_BYTES = int(os.environ.get('CROP_CACHE_MAX_ITEM_BYTES')) if os.environ.get('CROP_CACHE_MAX_ITEM_BYTES') else 1024 * 1024
+
+    # inline renders crops in the web worker, farm in a pool of render processes ( or "module:Class" )
+    CROP_RENDER_BACKEND = os.environ.get('CROP_RENDER_BACKEND') or 'inline'
+    CROP_RENDER_WORKERS = int(os.environ.get('CROP_RENDER_WORKERS')) if os.environ.get('CROP_RENDER_WORKERS') else os.cpu_count()
+    CROP_RENDER_CACHE_SIZE = int(os.environ.get('CROP_RENDER_CACHE_SIZE')) if os.environ.get('CROP_RENDER_CACHE_SIZE') else 32
+    CROP_RENDER_MAX_QUEUE = int(os.environ.get('CROP_RENDER_MAX_QUEUE')) if os.environ.get('CROP_RENDER_MAX_QUEUE') else 4
+    CROP_RENDER_TIMEOUT = int(os.environ.get('CROP_RENDER_TIMEOUT')) if os.environ.get('CROP_RENDER_TIMEOUT') else 30
+
+    # auto ( orjson when installed, else the stdlib ), orjson, stdlib or "module:Class"
+    JSON_ENCODER_BACKEND = os.environ.get('JSON_ENCODER_BACKEND') or 'auto'
+    JSON_SORT_KEYS = os.environ.get('JSON_SORT_KEYS', '').lower() in ('1', 'true', 'yes')
+    JSONIFY_PRETTYPRINT_REGULAR = os.environ.get('JSONIFY_PRETTYPRINT_REGULAR', '').lower() in ('1', 'true', 'yes')
+
+    # Counts are invalidated by writes of this process only, with several
+    # worker processes a count can be up to the TTL old ( 0 turns it off )
+    PAGINATION_COUNT_CACHE_SIZE = int(os.environ.get('PAGINATION_COUNT_CACHE_SIZE')) if os.environ.get('PAGINATION_COUNT_CACHE_SIZE') else 1024
+    PAGINATION_COUNT_CACHE_TTL = int(os.environ.get('PAGINATION_COUNT_CACHE_TTL')) if os.environ.get('PAGINATION_COUNT_CACHE_TTL') else 300
+
+    RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE_ENABLED', '').lower() in ('1', 'true', 'yes')
+    # memory only sees the writes of its own process, use redis with several workers
+    RESPONSE_CACHE_BACKEND = os.environ.get('RESPONSE_CACHE_BACKEND') or 'memory'
+    RESPONSE_CACHE_REDIS_URL = os.environ.get('RESPONSE_CACHE_REDIS_URL') or 'redis://localhost:6379/0'
+    RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL')) if os.environ.get('RESPONSE_CACHE_TTL') else 60
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES')) if os.environ.get('RESPONSE_CACHE_MAX_ENTRIES') else 4096
+
+    ASGI_WORKER_THREADS = int(os.environ.get('ASGI_WORKER_THREADS')) if os.environ.get('ASGI_WORKER_THREADS') else 8
+    ASGI_BODY_SPOOL_SIZE = int(os.environ.get('ASGI_BODY_SPOOL_SIZE')) if os.environ.get('ASGI_BODY_SPOOL_SIZE') else 1024 * 1024
+
+    RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '').lower() in ('1', 'true', 'yes')
+    RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND') or 'memory'
+    RATE_LIMIT_REDIS_URL = os.environ.get('RATE_LIMIT_REDIS_URL') or 'redis://localhost:6379/0'
+    # endpoint class=requests per second:burst, for the json, image and upload classes
+    RATE_LIMITS = os.environ.get('RATE_LIMITS') or 'json=20:40,image=5:10,upload=1:5'
+    # endpoint class=requests in progress per process before new ones get a 503
+    RATE_LIMIT_MAX_IN_FLIGHT = os.environ.get('RATE_LIMIT_MAX_IN_FLIGHT') or 'image=16,upload=4'
+
+    INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED', '').lower() in ('1', 'true', 'yes')
+    PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE')) if os.environ.get('PROFILING_SAMPLE_RATE') else 0
+    PROFILING_SLOW_REQUEST_MS = int(os.environ.get('PROFILING_SLOW_REQUEST_MS')) if os.environ.get('PROFILING_SLOW_REQUEST_MS') else 500
+    PROFILING_DUMP_FOLDER = os.environ.get('PROFILING_DUMP_FOLDER') or os.path.join(basedir, 'profiles')
+
 
 class TestConfig(object):
     SQLALCHEMY_TRACK_MODIFICATIONS = False
@@ -26,4 +105,10 @@ class TestConfig(object):
     TRAINING_IMAGES_UPLOAD_FOLDER = os.path.join('tests', 'training_images')
     SECRET_KEY = "TEST"
     TOKEN_EXPIERY_IN_MINUTES = 12 * 60
+    # Import time of the app and what create_app() imports, checked with python -X importtime
+    IMPORT_TIME_BUDGET_MS = int(os.environ.get('IMPORT_TIME_BUDGET_MS')) if os.environ.get('IMPORT_TIME_BUDGET_MS') else 500
     ITEMS_PER_PAGE = 10
+    INSTRUMENTATION_ENABLED = False
+    RESPONSE_CACHE_ENABLED = False
+    BULK_UPLOAD_WORKERS = 2
+    BULK_UPLOAD_BATCH_SIZE = 2
@@ -0,0 +1,54 @@
+"""ON DELETE CASCADE on the training_image and classified_area foreign keys
+
+Revision ID: c45d81f0a6b3
+Revises: 7b2e5a0c4d18
+Create Date: 2026-10-19 15:02:18.660114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c45d81f0a6b3'
+down_revision = '7b2e5a0c4d18'
+branch_labels = None
+depends_on = None
+
+
+# SQLite foreign keys created by the first revisions have no name, the
+# naming convention gives them one so batch mode can drop them
+naming_convention = {
+    "fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s",
+}
+
+FOREIGN_KEYS = [
+    ('training_image', 'user_id', 'user'),
+    ('classified_area', 'image_id', 'training_image'),
+]
+
+
+def get_foreign_key_name(table, column, referred_table):
+    for foreign_key in sa.inspect(op.get_bind()).get_foreign_keys(table):
+        if foreign_key['constrained_columns'] == [column] and foreign_key['name']:
+            return foreign_key['name']
+    return f'fk_{table}_{column}_{referred_table}'
+
+
+def replace_foreign_keys(ondelete):
+    for table, column, referred_table in FOREIGN_KEYS:
+        name = get_foreign_key_name(table, column, referred_table)
+
+        with op.batch_alter_table(table, naming_convention=naming_convention) as batch_op:
+            batch_op.drop_constraint(name, type_='foreignkey')
+            batch_op.create_foreign_key(
+                f'fk_{table}_{column}_{referred_table}', referred_table, [column], ['id'], ondelete=ondelete
+            )
+
+
+def upgrade():
+    replace_foreign_keys(ondelete='CASCADE')
+
+
+def downgrade():
+    replace_foreign_keys(ondelete=None)
@@ -1,7 +1,16 @@
+import sys
+
 from app import create_app
 from config import DevelopmentConfig
 
 
 if __name__ == '__main__':
     app = create_app(DevelopmentConfig)
-    app.run(debug=True)
\ No newline at end of file
+
+    if '--asgi' in sys.argv:
+        import uvicorn
+        from app.asgi import create_asgi_app
+
+        uvicorn.run(create_asgi_app(app))
+    else:
+        app.run(debug=True)
@@ -2,21 +2,40 @@ import unittest
 
 from config import TestConfig
 from app import create_app, db
-
-from app.models import User, TrainingImage
-
-from flask import current_app, url_for
+from app.asgi import create_asgi_app
+from app.backfill import backfill_dimensions
+from app.boxes import cluster_duplicates, iou_pairs, suppress_duplicates
+from app.cache import LRUCache
+from app.images import encode_for_storage, open_image, probe_image, store_image
+from app.integrity import scan_image_folder
+
+from app.models import User, TrainingImage, ClassifiedArea
+from app.rate_limit import parse_limits
+from app.render_farm import segment_name
+from app.sweeper import file_sweeper
+from app.tokens import InvalidToken, create_token, verify_token
+from app.transforms import CropTransform, render_crop
+
+from flask import current_app, json, jsonify, url_for
 
 import requests
 from requests.auth import HTTPBasicAuth
 
 from PIL import Image
 
+import asyncio
+from datetime import datetime
+import numpy
 import base64
 import io
 import os
 
 import secrets
+import subprocess
+import sys
+import zipfile
+import zlib
+from multiprocessing import shared_memory
 
 from uuid import uuid4
 
@@ -187,6 +206,24 @@ class TestRoutes(unittest.TestCase):
             get_file_binary('TEST_IMAGE.png')
         )
 
+    def test_image_file_download(self):
+        image_url = self.user.get_create_image_response().json['_links']['image']
+        image_binary = get_file_binary(TEST_IMAGE_1_PATH)
+
+        response = self.client.get(image_url)
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertEqual(response.headers['Accept-Ranges'], 'bytes')
+        response.close()
+
+        response = self.client.get(image_url, headers={'Range': 'bytes=0-9'})
+        self.assertTrue(self.response_resolves_to(response, 206))
+        self.assertEqual(response.data, image_binary[:10])
+        response.close()
+
+        response = self.client.get(image_url, headers={'If-None-Match': f'"{image_url.split("v=")[1]}"'})
+        self.assertTrue(self.response_resolves_to(response, 304))
+        response.close()
+
     def test_classified_area_upload(self):
         # Create an image
         image_public_id = self.user.get_create_image_response().json["public_id"]
@@ -312,6 +349,419 @@ class TestRoutes(unittest.TestCase):
         )
 
 
+    def test_field_selection(self):
+        image = self.user.get_create_image_response().json['public_id']
+        area = self.user.get_create_classified_area_response(training_image=image, tag="dog").json['public_id']
+
+        response = self.client.get('/classified_areas?fields=public_id,x_position&links=false')
+        self.assertTrue(self.response_resolves_to(response, 200))
+        for item in response.json['items']:
+            self.assertEqual(set(item.keys()), {'public_id', 'x_position'})
+        self.assertIn('fields=public_id%2Cx_position', response.json['_links']['self'])
+        self.assertIn('links=false', response.json['_links']['self'])
+
+        response = self.client.get(f'/classified_areas/{area}?fields=training_image')
+        self.assertEqual(response.json['training_image'], image)
+        self.assertIn('_links', response.json)
+        self.assertNotIn('tag', response.json)
+
+        self.assertTrue(
+            self.response_resolves_to(self.client.get('/users?fields=password_hash'), 400)
+        )
+
+    def test_projected_list_records(self):
+        image = self.user.get_create_image_response().json['public_id']
+        self.user.get_create_classified_area_response(training_image=image, width=2, height=2, tag="dog")
+        self.user.get_create_classified_area_response(training_image=image, x_position=3, width=1, height=1)
+
+        # List pages are built from projected records, they must serialize like the models do
+        for endpoint, model, some_fields in (
+            ('/users', User, 'email,public_id'),
+            ('/training_images', TrainingImage, 'user,area_count,created_at'),
+            ('/classified_areas', ClassifiedArea, 'training_image,tag')
+        ):
+            for arguments in ('', 'links=false', f'fields={some_fields}', f'fields={some_fields}&links=false', 'fields=public_id'):
+                fields = some_fields.split(',') if some_fields in arguments else ['public_id'] if 'fields' in arguments else None
+                include_links = 'links=false' not in arguments
+
+                items = self.client.get(f'{endpoint}?{arguments}').json['items']
+                self.assertTrue(items)
+                with self.app.test_request_context():
+                    expected = [
+                        json.loads(jsonify(model.query.filter_by(public_id=item['public_id']).first().to_dict(fields=fields, include_links=include_links)).get_data())
+                        for item in self.client.get(f'{endpoint}?fields=public_id&links=false').json['items']
+                    ]
+                self.assertEqual(items, expected, f'{endpoint}?{arguments}')
+
+    def test_cached_pagination_count(self):
+        image = self.user.get_create_image_response().json['public_id']
+        self.user.get_create_classified_area_response(training_image=image, tag="cat")
+
+        self.assertEqual(self.client.get('/classified_areas?tag=cat').json['_meta']['total_items'], 1)
+
+        # Writes to the table invalidate the cached count
+        self.user.get_create_classified_area_response(training_image=image, tag="cat")
+        self.assertEqual(self.client.get('/classified_areas?tag=cat').json['_meta']['total_items'], 2)
+
+        # Estimates may serve the count from before the latest write
+        self.user.get_create_classified_area_response(training_image=image, tag="cat")
+        meta = self.client.get('/classified_areas?tag=cat&count=estimate').json['_meta']
+        self.assertEqual(meta['total_items'], 2)
+        self.assertTrue(meta['estimated'])
+
+        meta = self.client.get('/classified_areas?tag=cat').json['_meta']
+        self.assertEqual(meta['total_items'], 3)
+        self.assertNotIn('estimated', meta)
+
+        # Writes of other processes do not invalidate it, a TTL of 0 recounts every time
+        db.session.execute(ClassifiedArea.__table__.delete())
+        db.session.commit()
+        self.assertEqual(self.client.get('/classified_areas?tag=cat').json['_meta']['total_items'], 3)
+        self.app.extensions['count_cache'].ttl = 0
+        self.assertEqual(self.client.get('/classified_areas?tag=cat').json['_meta']['total_items'], 0)
+
+    def test_delete_user_with_dependents(self):
+        image = self.user.get_create_image_response().json['public_id']
+        self.user.get_create_classified_area_response(training_image=image)
+        image_path = TrainingImage.query.filter_by(public_id=image).first().get_image_path()
+
+        response = self.client.delete(f'/users/{self.user.public_id}', headers={'x-access-token': self.user.token})
+        self.assertTrue(self.response_resolves_to(response, 200))
+
+        self.assertEqual(TrainingImage.query.filter_by(public_id=image).count(), 0)
+        self.assertEqual(ClassifiedArea.query.count(), 0)
+        self.assertTrue(
+            self.response_resolves_to(self.client.get(f'/training_images/{image}'), 404)
+        )
+
+        # The file is removed in the background once the deletion is committed
+        file_sweeper.sweep()
+        self.assertFalse(os.path.exists(image_path))
+
+    def test_image_folder_scan(self):
+        kept = self.user.get_create_image_response().json['public_id']
+        missing = self.user.get_create_image_response().json['public_id']
+
+        missing_path = TrainingImage.query.filter_by(public_id=missing).first().get_image_path()
+        os.remove(missing_path)
+
+        orphan_path = TrainingImage.make_image_path(uuid4().hex, 'png')
+        with open(orphan_path, 'wb') as file:
+            file.write(get_file_binary(TEST_IMAGE_1_PATH))
+
+        # Young files are left alone, they may belong to an upload in progress
+        report = scan_image_folder(remove_orphans=True, batch_size=1)
+        self.assertEqual(report.orphaned_files, [])
+        self.assertEqual(report.missing_files, [missing_path])
+
+        report = scan_image_folder(remove_orphans=True, batch_size=1, grace_seconds=0)
+        self.assertEqual(report.orphaned_files, [orphan_path])
+        self.assertEqual(report.removed_files, 1)
+        self.assertFalse(os.path.exists(orphan_path))
+        self.assertTrue(os.path.exists(TrainingImage.query.filter_by(public_id=kept).first().get_image_path()))
+
+    def test_dimensions_backfill(self):
+        size = Image.open(TEST_IMAGE_1_PATH).size
+        filled = self.user.get_create_image_response().json['public_id']
+        missing = self.user.get_create_image_response().json['public_id']
+        self.user.post('/classified_areas', json={'training_image': filled, 'x_position': 0, 'y_position': 0, 'width': 10, 'height': 10})
+
+        TrainingImage.query.update({'width': None, 'height': None}, synchronize_session=False)
+        db.session.commit()
+        missing_path = TrainingImage.query.filter_by(public_id=missing).first().get_image_path()
+        os.remove(missing_path)
+
+        report = backfill_dimensions(batch_size=1, workers=2)
+        self.assertEqual((report.rows_scanned, report.rows_updated), (2, 1))
+        self.assertEqual(report.unreadable_files, [missing_path])
+
+        training_image = self.user.get(f'/training_images/{filled}').json
+        self.assertEqual((training_image['width'], training_image['height']), size)
+        self.assertAlmostEqual(training_image['covered_ratio'], 100 / (size[0] * size[1]))
+
+    def test_bulk_image_upload(self):
+        image_binary = get_file_binary(TEST_IMAGE_1_PATH)
+
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zip_file:
+            zip_file.writestr('a.png', image_binary)
+            zip_file.writestr('broken.png', b'not an image')
+        archive.seek(0)
+        archive_bytes = archive.getvalue()
+
+        response = self.user.post('/training_images/bulk', data={
+            'images': [(io.BytesIO(image_binary), 'b.png'), (io.BytesIO(image_binary), 'c.png')],
+            'archive': (archive, 'images.zip')
+        })
+        self.assertTrue(self.response_resolves_to(response, 201))
+        self.assertEqual((response.json['created'], response.json['failed']), (3, 1))
+        self.assertEqual([result['name'] for result in response.json['results']], ['b.png', 'c.png', 'a.png', 'broken.png'])
+        self.assertEqual(response.json['results'][3]['status'], 'failed')
+
+        dry_run = self.user.post('/training_images/bulk?dry_run=true', data={'archive': (io.BytesIO(archive_bytes), 'images.zip')}).json
+        self.assertEqual((dry_run['valid'], dry_run['failed']), (1, 1))
+        self.assertEqual((dry_run['results'][0]['format'], dry_run['results'][0]['width'], dry_run['results'][0]['height']), ('PNG',) + Image.open(TEST_IMAGE_1_PATH).size)
+
+        public_id = response.json['results'][0]['public_id']
+        training_image = self.user.get(f'/training_images/{public_id}').json
+        self.assertEqual(training_image['user'], self.user.public_id)
+        self.assertEqual((training_image['width'], training_image['height']), Image.open(TEST_IMAGE_1_PATH).size)
+
+        response = self.client.get(training_image['_links']['image'])
+        self.assertEqual(Image.open(io.BytesIO(response.data)).size, Image.open(TEST_IMAGE_1_PATH).size)
+        response.close()
+
+        # A member that can not be read ( bad CRC ) only fails its own entry
+        corrupt = io.BytesIO()
+        with zipfile.ZipFile(corrupt, 'w') as zip_file:
+            zip_file.writestr('good.png', image_binary)
+            zip_file.writestr('bad.png', image_binary)
+        corrupt = bytearray(corrupt.getvalue())
+        corrupt[corrupt.rindex(b'\x89PNG') + 20] ^= 0xff
+        for dry_run in ('', '?dry_run=true'):
+            response = self.user.post(f'/training_images/bulk{dry_run}', data={'archive': (io.BytesIO(bytes(corrupt)), 'corrupt.zip')})
+            self.assertEqual([result['status'] for result in response.json['results']], ['valid' if dry_run else 'created', 'failed'])
+            self.assertIn('Bad CRC-32', response.json['results'][1]['error'])
+
+        # Modes PNG can not store are converted, not a failed request
+        cmyk = io.BytesIO()
+        Image.open(TEST_IMAGE_1_PATH).convert('CMYK').save(cmyk, format='JPEG')
+        response = self.user.post('/training_images/bulk', data={'images': [(io.BytesIO(cmyk.getvalue()), 'cmyk.jpg')]})
+        self.assertEqual(response.json['created'], 1)
+        self.assertTrue(self.response_resolves_to(self.user.get_create_image_response(cmyk.getvalue()), 201))
+
+        self.assertTrue(self.response_resolves_to(self.user.post('/training_images/bulk', data={}), 400))
+        self.assertTrue(self.response_resolves_to(
+            self.user.post('/training_images/bulk', data={'images': [(io.BytesIO(image_binary), 'd.png')], 'user': self.admin.public_id}), 401
+        ))
+
+    def test_sample_classified_areas(self):
+        image = self.user.get_create_image_response().json['public_id']
+        for i in range(12):
+            self.user.get_create_classified_area_response(training_image=image, x_position=i, tag='dog' if i < 9 else 'cat')
+
+        response = self.client.get('/classified_areas/sample?n=4&seed=7')
+        self.assertTrue(self.response_resolves_to(response, 200))
+        self.assertEqual(response.json['_meta']['seed'], 7)
+        sampled = [area['public_id'] for area in response.json['items']]
+        self.assertEqual(len(set(sampled)), 4)
+        self.assertEqual(sampled, [area['public_id'] for area in self.client.get('/classified_areas/sample?n=4&seed=7').json['items']])
+
+        # Asking for more than there is returns every area once
+        response = self.client.get(f'/classified_areas/sample?n=100&user={self.user.public_id}')
+        self.assertEqual(len({area['public_id'] for area in response.json['items']}), 12)
+
+        response = self.client.get('/classified_areas/sample?n=6&stratify=tag&seed=1&fields=tag')
+        self.assertEqual(sorted(area['tag'] for area in response.json['items']), ['cat'] * 3 + ['dog'] * 3)
+        self.assertEqual(response.json['_meta']['strata'], [{'tag': 'cat', 'returned': 3}, {'tag': 'dog', 'returned': 3}])
+
+        self.assertTrue(self.response_resolves_to(self.client.get('/classified_areas/sample?n=0'), 400))
+        self.assertEqual(self.client.get('/classified_areas/sample?seed=-1').json['message'], 'seed must be at least 0')
+        self.assertEqual(self.client.get('/classified_areas/sample?n=1001').json['message'], 'n must be at most 1000')
+        self.assertTrue(self.response_resolves_to(self.client.get(f'/classified_areas/sample?seed={10 ** 30}'), 400))
+        self.assertTrue(self.response_resolves_to(self.client.get('/classified_areas/sample?stratify=user'), 400))
+        self.assertTrue(self.response_resolves_to(self.client.get(f'/classified_areas/sample?user={uuid4().hex}'), 404))
+
+    def test_transformed_crop(self):
+        image = self.user.get_create_image_response().json['public_id']
+        area = self.user.get_create_classified_area_response(training_image=image, x_position=0, y_position=0, width=4, height=2).json
+        crop_url = area['_links']['training_image_cropped']
+
+        response = self.client.get(crop_url)
+        self.assertEqual(Image.open(io.BytesIO(response.data)).size, (4, 2))
+
+        response = self.client.get(f'{crop_url}?resize=8x8&pad=reflect&context=0.5&flip=h')
+        self.assertEqual(response.mimetype, 'image/png')
+        self.assertEqual(Image.open(io.BytesIO(response.data)).size, (8, 8))
+
+        # The same transform written differently is the same cached crop
+        etag = response.headers['ETag']
+        response = self.client.get(f'{crop_url}?flip=h&context=0.50&pad=reflect&resize=8x8', headers={'If-None-Match': etag})
+        self.assertTrue(self.response_resolves_to(response, 304))
+
+        response = self.client.get(f'{crop_url}?resize=6x4&normalize=imagenet')
+        array = numpy.load(io.BytesIO(response.data))
+        self.assertEqual((array.shape, array.dtype), ((4, 6, 3), numpy.float32))
+
+        expected = numpy.asarray(Image.open(TEST_IMAGE_1_PATH).crop((0, 0, 4, 2)))[:, ::-1] / 255
+        response = self.client.get(f'{crop_url}?flip=h&normalize=unit')
+        self.assertTrue(numpy.allclose(numpy.load(io.BytesIO(response.data)), expected))
+
+        # The cache is bounded by bytes and large crops are not kept at all
+        cache = self.app.extensions['crop_cache']
+        self.client.get(f'{crop_url}?resize=1024x1024&normalize=unit')
+        self.assertLessEqual(cache._bytes, self.app.config.get('CROP_CACHE_BYTES', 64 * 1024 * 1024))
+        self.assertFalse(any(len(value) > 1024 * 1024 for value, _, _ in cache._entries.values()))
+
+        self.assertTrue(self.response_resolves_to(self.client.get(f'{crop_url}?resize=big'), 400))
+        self.assertTrue(self.response_resolves_to(self.client.get(f'{crop_url}?normalize=unit&format=png'), 400))
+
+    def test_bulk_classified_areas(self):
+        image = self.user.get_create_image_response().json['public_id']
+        other_image = self.user2.get_create_image_response().json['public_id']
+        box = {'training_image': image, 'x_position': 0, 'y_position': 0, 'width': 10, 'height': 10}
+
+        areas = [
+            dict(box, tag='Dog'),
+            dict(box, x_position=-1),
+            dict(box, width=1000),
+            dict(box, height=0),
+            dict(box, width='10'),
+            dict(box, training_image=other_image),
+            {'training_image': image}
+        ]
+        response = self.user.post('/classified_areas/bulk', json={'areas': areas})
+        self.assertTrue(self.response_resolves_to(response, 400))
+        self.assertEqual(
+            [(error['index'], error['field']) for error in response.json['errors']],
+            [(1, 'x_position'), (2, 'width'), (3, 'height'), (4, 'width'), (5, 'training_image'), (6, 'x_position')]
+        )
+        self.assertEqual(ClassifiedArea.query.count(), 0)
+
+        # Values that would overflow the int64 bounds check are rejected, not wrapped around or a 500
+        areas = [dict(box, x_position=2 ** 62, width=2 ** 62), dict(box, y_position=2 ** 63), dict(box, height=2 ** 64 - 1)]
+        response = self.user.post('/classified_areas/bulk', json=areas)
+        self.assertTrue(self.response_resolves_to(response, 400))
+        self.assertEqual([(error['index'], error['field']) for error in response.json['errors']], [(0, 'x_position'), (1, 'y_position'), (2, 'height')])
+        for area in areas:
+            self.assertTrue(self.response_resolves_to(self.user.post('/classified_areas', json=area), 400))
+        self.assertEqual(ClassifiedArea.query.count(), 0)
+
+        areas = [dict(box, x_position=i, tag='Dog') for i in range(100)]
+        self.assertEqual(self.user.post('/classified_areas/bulk?dry_run=true', json=areas).json, {'valid': 100})
+        self.assertEqual(ClassifiedArea.query.count(), 0)
+
+        response = self.user.post('/classified_areas/bulk', json=areas)
+        self.assertTrue(self.response_resolves_to(response, 201))
+        self.assertEqual(response.json['created'], 100)
+
+        area = self.client.get(response.json['items'][5]['_links']['self']).json
+        self.assertEqual((area['x_position'], area['tag'], area['training_image']), (5, 'dog', image))
+
+        # Admins can create areas on any image
+        self.assertTrue(self.response_resolves_to(self.admin.post('/classified_areas/bulk', json=[dict(box, training_image=other_image)]), 201))
+
+    def test_annotation_summaries(self):
+        image = self.user.get_create_image_response().json['public_id']
+        other_image = self.user.get_create_image_response().json['public_id']
+
+        first = self.user.get_create_classified_area_response(training_image=image, width=64, height=64, tag='Car').json['public_id']
+        box = {'training_image': image, 'x_position': 32, 'y_position': 32, 'width': 64, 'height': 64}
+        self.user.post('/classified_areas/bulk', json=[dict(box, tag='dog'), dict(box, tag=None)])
+
+        summary = self.client.get(f'/training_images/{image}').json
+        self.assertEqual((summary['area_count'], summary['tags']), (3, ['car', 'dog']))
+        self.assertAlmostEqual(summary['covered_ratio'], (64 * 64 * 2 - 32 * 32) / (128 * 128))
+
+        # Moving an area updates the image it left and the one it joined
+        self.user.put(f'/classified_areas/{first}', json={'training_image': other_image})
+        self.assertEqual(self.client.get(f'/training_images/{image}').json['tags'], ['dog'])
+        self.assertEqual(self.client.get(f'/training_images/{other_image}').json['area_count'], 1)
+
+        self.assertEqual([item['public_id'] for item in self.client.get('/training_images?tag=CAR').json['items']], [other_image])
+        self.assertEqual([item['public_id'] for item in self.client.get('/training_images?min_areas=2').json['items']], [image])
+        self.assertTrue(self.response_resolves_to(self.client.get('/training_images?min_areas=-1'), 400))
+
+        self.user.client.delete(f'/classified_areas/{first}', headers={'x-access-token': self.user.token})
+        summary = self.client.get(f'/training_images/{other_image}').json
+        self.assertEqual((summary['area_count'], summary['tags'], summary['covered_ratio']), (0, [], 0))
+
+        # A tag stays while another area of the image has it, the covered
+        # ratio is only marked stale by writes and computed on read
+        second = self.user.get_create_classified_area_response(training_image=image, width=64, height=64, tag='dog').json['public_id']
+        self.user.put(f'/classified_areas/{second}', json={'tag': 'cat'})
+        self.assertIsNone(TrainingImage.query.filter_by(public_id=image).first().covered_ratio)
+        summary = self.client.get(f'/training_images/{image}').json
+        self.assertEqual((summary['area_count'], summary['tags']), (3, ['cat', 'dog']))
+        self.assertAlmostEqual(summary['covered_ratio'], (64 * 64 * 2 - 32 * 32) / (128 * 128))
+
+        self.user.client.delete(f'/classified_areas/{second}', headers={'x-access-token': self.user.token})
+        self.assertEqual(self.client.get(f'/training_images/{image}').json['tags'], ['dog'])
+
+    def test_training_image_filters(self):
+        annotated = self.user.get_create_image_response().json['public_id']
+        self.user.get_create_classified_area_response(training_image=annotated, width=10, height=10)
+        created_at = self.client.get(f'/training_images/{annotated}').json['created_at']
+        unannotated = self.user.get_create_image_response().json['public_id']
+
+        def listed(query):
+            return [item['public_id'] for item in self.client.get(f'/training_images?{query}').json['items']]
+
+        self.assertEqual(listed('has_areas=true'), [annotated])
+        self.assertEqual(listed('has_areas=false'), [unannotated])
+        self.assertEqual(listed(f'created_after={created_at}'), [unannotated])
+        self.assertEqual(listed('min_width=128&max_height=128'), [annotated, unannotated])
+        self.assertEqual(listed('min_width=129'), [])
+
+        self.assertTrue(self.response_resolves_to(self.client.get('/training_images?created_after=yesterday'), 400))
+        self.assertTrue(self.response_resolves_to(self.client.get('/training_images?has_areas=maybe'), 400))
+
+    def test_duplicate_classified_areas(self):
+        image = self.user.get_create_image_response().json['public_id']
+        boxes = [(10, 10, 20, 20, 'dog'), (11, 10, 20, 20, 'dog'), (10, 11, 20, 21, 'dog'), (10, 10, 20, 20, 'cat'), (60, 60, 10, 10, 'dog')]
+        ids = [
+            self.user.get_create_classified_area_response(training_image=image, x_position=x, y_position=y, width=width, height=height, tag=tag).json['public_id']
+            for x, y, width, height, tag in boxes
+        ]
+
+        response = self.client.get(f'/classified_areas/duplicates?training_image={image}&threshold=0.8')
+        self.assertEqual(response.json['groups'], [{'training_image': image, 'tag': 'dog', 'keep': ids[0], 'duplicates': ids[1:3]}])
+        self.assertEqual(self.client.get('/classified_areas/duplicates?tag=dog&mode=nms').json['groups'][0]['keep'], ids[0])
+        self.assertTrue(self.response_resolves_to(self.client.get('/classified_areas/duplicates'), 400))
+
+        self.assertEqual(self.user2.post(f'/classified_areas/duplicates/merge?training_image={image}').json['removed'], 0)
+
+        response = self.user.post(f'/classified_areas/duplicates/merge?training_image={image}&threshold=0.8')
+        self.assertEqual(response.json['removed'], 2)
+
+        kept = self.client.get(f'/classified_areas/{ids[0]}').json
+        self.assertEqual((kept['x_position'], kept['y_position'], kept['width'], kept['height']), (10, 10, 20, 21))
+        self.assertTrue(self.response_resolves_to(self.client.get(f'/classified_areas/{ids[1]}'), 404))
+        self.assertEqual(self.client.get(f'/classified_areas/duplicates?training_image={image}').json['groups'], [])
+
+    def test_change_feed(self):
+        since = self.client.get('/changes').json['_meta']['last_seq']
+
+        image = self.user.get_create_image_response().json['public_id']
+        area = self.user.get_create_classified_area_response(training_image=image, tag='dog').json['public_id']
+        self.user.put(f'/classified_areas/{area}', json={'x_position': 2})
+        self.user.post('/classified_areas/bulk', json=[{'training_image': image, 'x_position': 0, 'y_position': 0, 'width': 1, 'height': 1}])
+        self.user.client.delete(f'/training_images/{image}', headers={'x-access-token': self.user.token})
+
+        response = self.client.get(f'/changes?since={since}')
+        changes = [(change['model'], change['operation']) for change in response.json['changes']]
+        self.assertEqual(changes, [
+            ('TrainingImage', 'create'),
+            ('ClassifiedArea', 'create'),
+            ('ClassifiedArea', 'update'),
+            ('ClassifiedArea', 'create'),
+            ('ClassifiedArea', 'delete'),
+            ('ClassifiedArea', 'delete'),
+            ('TrainingImage', 'delete')
+        ])
+        self.assertEqual(response.json['changes'][1]['public_id'], area)
+
+        seqs = [change['seq'] for change in response.json['changes']]
+        self.assertEqual(seqs, sorted(seqs))
+        self.assertEqual(self.client.get(response.json['_links']['next']).json['changes'], [])
+
+        for limit in (0, -1, 10 ** 6):
+            self.assertTrue(self.response_resolves_to(self.client.get(f'/changes?since={since}&limit={limit}'), 400))
+
+        response = self.client.get(f'/changes/stream?since={seqs[-2]}&timeout=0')
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        self.assertIn(f'id: {seqs[-1]}\nevent: change\n', response.get_data(as_text=True))
+        response.close()
+
+        # Open streams hold a thread each, past CHANGE_FEED_MAX_STREAMS they are turned away
+        streams = [self.client.get('/changes/stream?timeout=0', buffered=False) for _ in range(self.app.config.get('CHANGE_FEED_MAX_STREAMS', 4))]
+        self.assertTrue(self.response_resolves_to(self.client.get('/changes/stream?timeout=0'), 503))
+        for stream in reversed(streams):
+            stream.close()
+        response = self.client.get('/changes/stream?timeout=0')
+        self.assertTrue(self.response_resolves_to(response, 200))
+        response.close()
+
     def test_put_classified_area(self):
         image = self.user.get_create_image_response().json['public_id']
 
@@ -509,6 +959,24 @@ class TestRoutes(unittest.TestCase):
         )
 
 
+    def test_demoted_admin_token(self):
+        # A second admin demotes the first, whose token is still valid
+        other_admin = TestUser(self.app, f'{secrets.token_hex(16).lower()}@helllo.com', 'password')
+        User.query.filter_by(public_id=other_admin.public_id).first().is_admin = True
+        db.session.commit()
+        self.assertTrue(self.response_resolves_to(other_admin.post(f'/users/{self.admin.public_id}/demote'), 200))
+
+        self.assertTrue(self.response_resolves_to(self.admin.post(f'/users/{self.admin.public_id}/promote'), 401))
+        self.assertTrue(self.response_resolves_to(self.admin.post(f'/users/{self.user.public_id}/promote'), 401))
+        self.assertFalse(self.client.get(f'/users/{self.admin.public_id}').json["is_admin"])
+
+        # A deleted admin's token is no good at all
+        self.assertTrue(self.response_resolves_to(other_admin.client.delete(
+            f'/users/{other_admin.public_id}', headers={'x-access-token': other_admin.token}
+        ), 200))
+        self.assertTrue(self.response_resolves_to(other_admin.post(f'/users/{self.user.public_id}/promote'), 401))
+
+
     def remove_test_images(self):
         dir_name = os.path.join(current_app.static_folder, current_app.config['TRAINING_IMAGES_UPLOAD_FOLDER'])
         test = os.listdir(dir_name)
@@ -525,6 +993,487 @@ class TestRoutes(unittest.TestCase):
 
 
 
+class InstrumentedTestConfig(TestConfig):
+    INSTRUMENTATION_ENABLED = True
+
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(InstrumentedTestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_server_timing_and_metrics(self):
+        self.client.post('/users', json={'email': 'instrumented@test.com', 'password': 'pass'})
+
+        response = self.client.get('/users')
+        self.assertIn('total;dur=', response.headers['Server-Timing'])
+        self.assertIn('queries', response.headers['Server-Timing'])
+
+        # The second walk over the same page reuses the cached count
+        response = self.client.get('/users')
+        self.assertIn('desc="1 queries"', response.headers['Server-Timing'])
+
+        metrics = self.client.get('/metrics').data.decode('utf-8')
+        self.assertIn('microaa_requests_total{endpoint="api.get_users",method="GET"} 2', metrics)
+        self.assertIn('# TYPE microaa_db_queries_total counter', metrics)
+
+
+class CachedTestConfig(TestConfig):
+    RESPONSE_CACHE_ENABLED = True
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(CachedTestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.client = self.app.test_client()
+        self.user = TestUser(self.app, 'cached@test.com', 'password')
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_cached_get_and_revalidation(self):
+        route = f'/users/{self.user.public_id}'
+
+        first = self.client.get(route)
+        self.assertEqual(first.headers['X-Cache'], 'MISS')
+        self.assertIsNotNone(first.headers.get('Last-Modified'))
+
+        second = self.client.get(route)
+        self.assertEqual(second.headers['X-Cache'], 'HIT')
+        self.assertEqual(second.headers['ETag'], first.headers['ETag'])
+
+        not_modified = self.client.get(route, headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(not_modified.status_code, 304)
+
+        # Writes to users invalidate the cached response
+        self.user.put(route, json={'email': 'changed@test.com'})
+        third = self.client.get(route)
+        self.assertEqual(third.headers['X-Cache'], 'MISS')
+        self.assertEqual(third.json['email'], 'changed@test.com')
+
+
+class RateLimitedTestConfig(TestConfig):
+    RATE_LIMIT_ENABLED = True
+    RATE_LIMITS = 'json=1000:1000,image=0.001:2,upload=0.001:1'
+    RATE_LIMIT_MAX_IN_FLIGHT = 'image=4'
+
+class TestRateLimiting(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(RateLimitedTestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.user = TestUser(self.app, f'{secrets.token_hex(16).lower()}@helllo.com', 'password')
+        self.user2 = TestUser(self.app, f'{secrets.token_hex(16).lower()}@helllo.com', 'password')
+
+    def tearDown(self):
+        for training_image in TrainingImage.query.all():
+            training_image.delete_image()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_limits_per_principal_and_class(self):
+        # Uploads are limited per user
+        self.assertEqual(self.user.get_create_image_response().status_code, 201)
+        response = self.user.get_create_image_response()
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response.headers)
+        image = self.user2.get_create_image_response().json['public_id']
+
+        area = self.user2.get_create_classified_area_response(training_image=image).json['public_id']
+        crop_url = f'/classified_areas/{area}/training_image_cropped'
+
+        # Anonymous image renders are limited per address
+        client = self.app.test_client()
+        self.assertEqual([client.get(crop_url).status_code for _ in range(3)], [200, 200, 429])
+        self.assertEqual(client.get(crop_url, environ_base={'REMOTE_ADDR': '10.0.0.2'}).status_code, 200)
+
+        # Cheap JSON requests have their own bucket
+        self.assertEqual(client.get(f'/classified_areas/{area}').status_code, 200)
+
+        # Renders beyond the in-flight limit are shed
+        state = self.app.extensions['rate_limiter']
+        state.in_flight['image'] = state.max_in_flight['image']
+        self.assertEqual(client.get(crop_url, environ_base={'REMOTE_ADDR': '10.0.0.3'}).status_code, 503)
+        state.in_flight['image'] = 0
+
+        client.get(crop_url, environ_base={'REMOTE_ADDR': '10.0.0.4'})
+        self.assertEqual(state.in_flight['image'], 0)
+
+    def test_non_positive_limits(self):
+        self.assertEqual(parse_limits('json=20:40, image=5:10'), {'json': (20.0, 40.0), 'image': (5.0, 10.0)})
+        for limits in ('json=0:40', 'json=20:-1', 'image=0'):
+            with self.assertRaises(ValueError):
+                parse_limits(limits)
+
+
+class RenderFarmTestConfig(TestConfig):
+    CROP_RENDER_BACKEND = 'farm'
+    CROP_RENDER_WORKERS = 2
+    CROP_RENDER_CACHE_SIZE = 1
+
+
+class TestRenderFarm(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(RenderFarmTestConfig)
+        self.farm = self.app.extensions['crop_renderer']
+
+        self.source = Image.open(TEST_IMAGE_1_PATH)
+        self.source.load()
+
+    def tearDown(self):
+        self.farm.shutdown()
+
+    def test_renders_like_inline(self):
+        box = (0, 0, 4, 2)
+        for transform in (CropTransform(), CropTransform(resize=(8, 8), flip='h', context=0.5), CropTransform(normalize='unit', format='npy')):
+            # A cold source, the same source warm and one that evicts it
+            for key in ('first:v1', 'first:v1', 'second:v1'):
+                self.assertEqual(self.farm.render(key, TEST_IMAGE_1_PATH, box, transform), render_crop(self.source, box, transform))
+
+    def test_renders_other_modes_like_inline(self):
+        # Palette and 16 bit sources are not converted on the way to the crop
+        box = (0, 0, 4, 2)
+        for mode in ('P', 'I;16'):
+            path = os.path.join(os.path.dirname(TEST_IMAGE_1_PATH), f'render_farm_{mode.replace(";", "")}.png')
+            source = self.source.convert('P') if mode == 'P' else Image.fromarray((numpy.asarray(self.source.convert('L'), dtype=numpy.uint16) * 257), 'I;16')
+            source.save(path)
+            try:
+                inline = Image.open(path)
+                inline.load()
+                for transform in (CropTransform(), CropTransform(resize=(8, 8), flip='h')):
+                    self.assertEqual(self.farm.render(f'{mode}:v1', path, box, transform), render_crop(inline, box, transform))
+            finally:
+                os.remove(path)
+
+    def test_spilled_jobs_read_shared_source(self):
+        key = 'spilled:v1'
+        box = (2, 2, 10, 10)
+        self.farm.render(key, TEST_IMAGE_1_PATH, box, CropTransform())
+
+        # With its worker busy the job goes to the other worker, which reads
+        # the decoded source from shared memory instead of the (missing) file
+        owner = zlib.crc32(key.encode('utf-8')) % self.farm.workers
+        self.farm._queued[owner] = self.farm.max_queue
+        try:
+            rendered = self.farm.render(key, 'missing.png', box, CropTransform())
+        finally:
+            self.farm._queued[owner] = 0
+        self.assertEqual(rendered, render_crop(self.source, box, CropTransform()))
+
+        self.farm.shutdown()
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=segment_name(key))
+
+
+class RotatedKeysTestConfig(TestConfig):
+    TOKEN_SIGNING_KEYS = 'old:old secret,new:new secret'
+    TOKEN_SIGNING_KID = 'new'
+
+class OldKeysTestConfig(TestConfig):
+    TOKEN_SIGNING_KEYS = 'old:old secret'
+
+class ExpiredTokensTestConfig(TestConfig):
+    TOKEN_EXPIERY_IN_MINUTES = -1
+
+class RetiredKeysTestConfig(TestConfig):
+    TOKEN_SIGNING_KEYS = 'new:new secret'
+
+
+class LegacyKeysTestConfig(RetiredKeysTestConfig):
+    TOKEN_ACCEPT_LEGACY = True
+
+
+class TestTokens(unittest.TestCase):
+    def setUp(self):
+        self.user = User(public_id=str(uuid4()), is_admin=True)
+
+    def issue_token(self, config):
+        app = create_app(config)
+        with app.app_context():
+            return create_token(self.user).decode('utf-8')
+
+    def verify(self, config, token):
+        app = create_app(config)
+        with app.app_context():
+            # Claims without is_admin are checked against the user row
+            db.create_all()
+            user = User(email='token@test.com', password='password', is_admin=self.user.is_admin)
+            user.public_id = self.user.public_id
+            db.session.add(user)
+            db.session.commit()
+            return verify_token(token)
+
+    def test_claims_without_lookup(self):
+        app = create_app(TestConfig)
+        with app.app_context():
+            token = create_token(self.user).decode('utf-8')
+
+            # There are no tables, is_admin comes from the claim
+            principal = verify_token(token)
+            self.assertEqual((principal.public_id, principal.is_admin), (self.user.public_id, True))
+
+            # Verified once, later requests are served from the cache
+            self.assertIsNotNone(app.extensions['token_cache'].get(token))
+            self.assertEqual(verify_token(token).public_id, self.user.public_id)
+
+            with self.assertRaises(InvalidToken):
+                verify_token(token[:-2])
+
+    def test_key_rotation(self):
+        token = self.issue_token(OldKeysTestConfig)
+
+        # Tokens signed with a key that is still listed keep working
+        self.assertEqual(self.verify(RotatedKeysTestConfig, token).public_id, self.user.public_id)
+
+        with self.assertRaises(InvalidToken):
+            self.verify(RetiredKeysTestConfig, token)
+
+        new_token = self.issue_token(RotatedKeysTestConfig)
+        self.assertEqual(self.verify(RetiredKeysTestConfig, new_token).public_id, self.user.public_id)
+
+    def test_stale_admin_claim(self):
+        token = self.issue_token(TestConfig)
+
+        # A demotion made by another process is picked up once the claims are TOKEN_CLAIMS_MAX_AGE old
+        app = create_app(type('StaleClaimsTestConfig', (TestConfig,), {'TOKEN_CLAIMS_MAX_AGE': 0}))
+        with app.app_context():
+            db.create_all()
+            user = User(email='token@test.com', password='password', is_admin=False)
+            user.public_id = self.user.public_id
+            db.session.add(user)
+            db.session.commit()
+            self.assertFalse(verify_token(token).is_admin)
+
+    def test_invalid_kid(self):
+        # PyJWT will not sign an unhashable kid, the header is put together by hand
+        header, claims = (base64.urlsafe_b64encode(json.dumps(part).encode('utf-8')).rstrip(b'=').decode('ascii') for part in (
+            {'alg': 'HS256', 'typ': 'JWT', 'kid': ['default']}, {'public_id': self.user.public_id}
+        ))
+        token = f'{header}.{claims}.signature'
+        with self.assertRaises(InvalidToken):
+            self.verify(TestConfig, token)
+
+    def test_tokens_without_kid(self):
+        import jwt
+
+        token = jwt.encode({'public_id': self.user.public_id, 'exp': datetime.now().timestamp() + 60}, TestConfig.SECRET_KEY, algorithm='HS256').decode('utf-8')
+        self.assertEqual(self.verify(TestConfig, token).public_id, self.user.public_id)
+
+        # With keys configured SECRET_KEY alone can not sign tokens, unless legacy tokens are accepted
+        with self.assertRaises(InvalidToken):
+            self.verify(RetiredKeysTestConfig, token)
+        self.assertEqual(self.verify(LegacyKeysTestConfig, token).public_id, self.user.public_id)
+
+    def test_expired_token(self):
+        token = self.issue_token(ExpiredTokensTestConfig)
+
+        with self.assertRaises(InvalidToken) as context:
+            self.verify(TestConfig, token)
+        self.assertEqual(str(context.exception), 'Token expired')
+
+
+class TestASGIGateway(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.gateway = create_asgi_app(self.app)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def call(self, method, path, body=b'', headers=()):
+        # The body arrives in two messages like a slow client would send it
+        messages = [
+            {'type': 'http.request', 'body': body[:4], 'more_body': True},
+            {'type': 'http.request', 'body': body[4:], 'more_body': False}
+        ]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'headers': list(headers)}
+        asyncio.run(self.gateway(scope, receive, send))
+        return sent[0]['status'], b''.join(message.get('body', b'') for message in sent[1:])
+
+    def test_requests_through_gateway(self):
+        status, body = self.call(
+            'POST', '/users',
+            body=b'{"email": "asgi@test.com", "password": "pass"}',
+            headers=[(b'content-type', b'application/json')]
+        )
+        self.assertEqual(status, 201)
+        self.assertIn(b'asgi@test.com', body)
+
+        status, body = self.call('GET', '/users')
+        self.assertEqual(status, 200)
+        self.assertIn(b'asgi@test.com', body)
+
+
+class TestImageStorage(unittest.TestCase):
+    def setUp(self):
+        self.source = get_file_binary(TEST_IMAGE_1_PATH)
+        self.image = open_image(self.source)
+        self.image.load()
+
+    def test_storage_policies(self):
+        stored, image_format = encode_for_storage(self.image, self.source, {'TRAINING_IMAGES_STORAGE_FORMAT': 'original'})
+        self.assertEqual((stored, image_format), (self.source, 'png'))
+
+        stored, image_format = encode_for_storage(self.image, self.source, {'TRAINING_IMAGES_STORAGE_FORMAT': 'raw'})
+        self.assertEqual(image_format, 'tiff')
+
+        # Every policy is lossless
+        for policy in ['png', 'raw']:
+            stored, _ = encode_for_storage(self.image, self.source, {'TRAINING_IMAGES_STORAGE_FORMAT': policy})
+            self.assertEqual(list(open_image(stored).getdata()), list(self.image.getdata()))
+
+        with self.assertRaises(ValueError):
+            encode_for_storage(self.image, self.source, {'TRAINING_IMAGES_STORAGE_FORMAT': 'gif'})
+
+
+    def test_header_probe(self):
+        with probe_image(self.source) as probe:
+            self.assertEqual((probe.format, probe.mode, probe.size), (self.image.format, self.image.mode, self.image.size))
+            probe.verify()
+
+        # Stored as uploaded, the upload is only probed and verified
+        stored, image_format = encode_for_storage(probe, self.source, {'TRAINING_IMAGES_STORAGE_FORMAT': 'original'})
+        self.assertEqual((stored, image_format), (self.source, 'png'))
+
+        with self.assertRaises(ValueError):
+            probe_image(b'not an image')
+        with self.assertRaises(ValueError):
+            probe_image(self.source[:-40]).verify()
+
+        # Pillow's own verify() checks nothing for JPEG, a truncated one is still rejected
+        jpeg = io.BytesIO()
+        self.image.convert('RGB').save(jpeg, format='JPEG')
+        truncated = jpeg.getvalue()[:len(jpeg.getvalue()) // 2]
+        self.assertEqual(probe_image(truncated).format, 'JPEG')
+        with self.assertRaises(ValueError):
+            probe_image(truncated).verify()
+        with self.assertRaises(ValueError):
+            store_image(truncated, '/nonexistent', 'truncated', {'TRAINING_IMAGES_STORAGE_FORMAT': 'original'})
+
+
+class TestDuplicateBoxes(unittest.TestCase):
+    def test_tiled_pairs_match_every_pair(self):
+        rng = numpy.random.default_rng(0)
+        x, y = rng.integers(0, 200, 300), rng.integers(0, 200, 300)
+        width, height = rng.integers(1, 40, 300), rng.integers(1, 40, 300)
+
+        expected = set()
+        for first in range(300):
+            for second in range(first + 1, 300):
+                overlap_width = max(0, min(x[first] + width[first], x[second] + width[second]) - max(x[first], x[second]))
+                overlap_height = max(0, min(y[first] + height[first], y[second] + height[second]) - max(y[first], y[second]))
+                intersection = overlap_width * overlap_height
+                union = width[first] * height[first] + width[second] * height[second] - intersection
+                if intersection / union >= 0.3:
+                    expected.add((first, second))
+
+        # Tiles smaller than the group, so pairs cross tiles
+        for tile in (7, 256):
+            self.assertEqual(set(zip(*(pairs.tolist() for pairs in iou_pairs(x, y, width, height, 0.3, tile=tile)))), expected)
+
+        clusters = cluster_duplicates(x, y, width, height, 0.3)
+        self.assertTrue(all(group == sorted(group) for group in clusters))
+        kept = [group[0] for group in suppress_duplicates(x, y, width, height, 0.3)]
+        self.assertFalse(any((first, second) in expected for first in kept for second in kept if first < second))
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_bounded_by_bytes(self):
+        cache = LRUCache(max_size=10, max_bytes=10)
+        cache.set('a', b'1234')
+        cache.set('b', b'1234')
+        cache.set('c', b'1234')
+        self.assertEqual((cache.get('a'), cache.get('c'), len(cache)), (None, b'1234', 2))
+
+        # A value larger than the whole cache is not kept, and replaces nothing else
+        cache.set('d', b'x' * 11)
+        self.assertEqual((cache.get('d'), len(cache)), (None, 2))
+
+
+class TestJSONEncoding(unittest.TestCase):
+    def test_encoders_agree(self):
+        data = {'b': [1, 2.5, None, True], 'a': {'date': datetime(2020, 1, 2, 3, 4, 5), 1: 'é'}}
+
+        bodies = []
+        for backend in ('stdlib', 'orjson'):
+            app = create_app(type('JSONTestConfig', (TestConfig,), {'JSON_ENCODER_BACKEND': backend, 'JSON_SORT_KEYS': False}))
+            with app.test_request_context():
+                bodies.append(json.loads(jsonify(data).get_data(as_text=True)))
+
+        self.assertEqual(bodies[0], bodies[1])
+
+        # orjson stops at 64 bit integers, wider ones fall back to the stdlib encoder
+        app = create_app(type('JSONTestConfig', (TestConfig,), {'JSON_ENCODER_BACKEND': 'orjson'}))
+        with app.test_request_context():
+            self.assertEqual(json.loads(jsonify({'seed': 10 ** 30}).get_data(as_text=True)), {'seed': 10 ** 30})
+        self.assertEqual(bodies[1]['a']['date'], 'Thu, 02 Jan 2020 03:04:05 GMT')
+
+
+class TestStartup(unittest.TestCase):
+    def test_import_time_budget(self):
+        # Workers that never touch an image or a migration start without them
+        script = (
+            'import sys; from app import create_app; app = create_app(); '
+            'print(",".join(m for m in ("numpy", "PIL", "jwt", "alembic", "flask_migrate") if m in sys.modules))'
+        )
+        loaded = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', script], capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        self.assertEqual(loaded.stdout.strip(), '')
+
+        # "import time: self [us] | cumulative | name", children are listed before their parent
+        imports = []
+        for line in loaded.stderr.splitlines():
+            if line.startswith('import time:') and not line.endswith('imported package'):
+                self_time, _, name = line[len('import time:'):].split('|')
+                if self_time.strip().isdigit():
+                    imports.append((int(self_time), name))
+
+        # The app tree starts after the last top level import before app, the
+        # imports create_app() runs are counted too
+        app_index = next(index for index, (_, name) in enumerate(imports) if name.strip() == 'app' and name.startswith(' app'))
+        start = max([index + 1 for index, (_, name) in enumerate(imports[:app_index]) if not name.startswith('  ')] or [0])
+        milliseconds = sum(self_time for self_time, _ in imports[start:]) / 1000
+        self.assertLess(milliseconds, TestConfig.IMPORT_TIME_BUDGET_MS, f'Importing the app took {milliseconds:.0f} ms')
+
+        app = create_app(TestConfig)
+        with app.app_context():
+            self.assertIs(app.extensions['migrate'].db, db)
+            self.assertIn('alembic', sys.modules)
+
+
 class TestDatabase(unittest.TestCase):
     def setUp(self):
         self.app = create_app(TestConfig)
@@ -556,6 +1505,25 @@ class TestDatabase(unittest.TestCase):
         self.assertEqual(i.user, u)
         self.assertEqual(i.user_id, u.id)
 
+    def explain(self, query):
+        statement = query.statement.compile(dialect=db.engine.dialect)
+        parameters = [statement.params[name] for name in statement.positiontup]
+        return ' '.join(row[-1] for row in db.engine.execute(f'EXPLAIN QUERY PLAN {statement}', *parameters))
+
+    def test_filter_query_plans(self):
+        # Every filter of the list endpoints is answered from an index, not a table scan
+        for query, index in (
+            (TrainingImage.query.filter(TrainingImage.user_id == 1), 'ix_training_image_user_id'),
+            (TrainingImage.query.filter(TrainingImage.created_at > datetime(2020, 1, 1)), 'ix_training_image_created_at'),
+            (TrainingImage.query.filter(TrainingImage.area_count == 0), 'ix_training_image_area_count'),
+            (TrainingImage.query.filter(TrainingImage.width >= 100, TrainingImage.width <= 200), 'ix_training_image_width_height'),
+            (ClassifiedArea.query.filter(ClassifiedArea.image_id == 1), 'ix_classified_area_image_id'),
+            (ClassifiedArea.query.filter(ClassifiedArea.tag == 'dog'), 'ix_classified_area_tag')
+        ):
+            plan = self.explain(query)
+            self.assertIn(f'USING INDEX {index}', plan)
+            self.assertNotIn('SCAN', plan)
+
 
 if __name__ == '__main__':
     unittest.main()